@@ -12,7 +12,6 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 from os import getenv
-import logging.config
 from django.urls import reverse_lazy
 from django.utils.translation import gettext_lazy as _
 
@@ -77,17 +76,20 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'requestdataapp.middlewares.MetricsMiddleware',
     # 'django.middleware.cache.UpdateCacheMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'requestdataapp.middlewares.ReplicaMiddleware',
+    'requestdataapp.middlewares.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     # 'requestdataapp.middlewares.set_useragent_on_request_middleware',
     # 'requestdataapp.middlewares.CountRequestsMiddleware',
-    # 'requestdataapp.middlewares.ThrottlingMiddleware',
+    'requestdataapp.middlewares.ThrottlingMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.contrib.admindocs.middleware.XViewMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -123,20 +125,121 @@ DATABASES = {
         'ENGINE': 'django.db.backends.sqlite3',
         # 'NAME': BASE_DIR / 'db.sqlite3',
         'NAME': DATABASE_DIR / 'db.sqlite3',
-    }
+        # Постоянные соединения: PRAGMA и прогретый кэш страниц живут между запросами
+        'CONN_MAX_AGE': int(getenv("DJANGO_CONN_MAX_AGE", "60")),
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # Копия default для тяжёлого чтения (requestdataapp.replicas), обновляет manage.py sync_replica
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DATABASE_DIR / 'replica.sqlite3',
+        'CONN_MAX_AGE': int(getenv("DJANGO_CONN_MAX_AGE", "60")),
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+DATABASE_ROUTERS = ["requestdataapp.replicas.ReplicaRouter"]
+
+# Чтение с реплики (requestdataapp.middlewares.ReplicaMiddleware): alias или None,
+# GET/HEAD к каким view_name и сколько секунд после записи клиент читает из default
+DATABASE_REPLICA = "replica" if getenv("DJANGO_DB_REPLICA", "0") == "1" else None
+DATABASE_REPLICA_VIEWS = [
+    "shopapp:*export*",
+    "shopapp:products-feed",
+    "shopapp:products_list",
+    "shopapp:product_details",
+    "shopapp:product-list",
+    "shopapp:product-detail",
+    "shopapp:order-list",
+    "shopapp:order-detail",
+    "shopapp:daily*",
+    "blogapp:*",
+    "django.contrib.sitemaps.views.sitemap",
+]
+DATABASE_REPLICA_PIN_SECONDS = 5
+
+# PRAGMA для каждого нового соединения с SQLite (requestdataapp.sqlite)
+SQLITE_PRAGMAS = {
+    "journal_mode": getenv("DJANGO_SQLITE_JOURNAL_MODE", "wal"),
+    "synchronous": getenv("DJANGO_SQLITE_SYNCHRONOUS", "normal"),
+    "busy_timeout": 5000,
+    "cache_size": -64000,  # в КиБ, т.е. 64 МБ
+    "mmap_size": int(getenv("DJANGO_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "memory",
 }
 
+# Формат значений в общем кэше: pickle или msgpack (requestdataapp.msgpackcache).
+# msgpack быстрее кодирует данные сериализаторов API, pickle - строки с Decimal и datetime
+CACHE_SERIALIZER = getenv("DJANGO_CACHE_SERIALIZER", "pickle")
+
 CACHES = {
+    # LRU в памяти процесса перед общим кэшем "shared" (requestdataapp.tieredcache)
     "default": {
+        "BACKEND": "requestdataapp.tieredcache.TieredCache",
+        "LOCATION": "shared",
+        "OPTIONS": {
+            "MAX_ENTRIES": 1000,
+            "MAX_SIZE": 32 * 1024 * 1024,
+            "L1_TIMEOUT": 5,
+            "L1_VERSIONED_TIMEOUT": 300,
+        },
+    },
+    "shared": {
         # "BACKEND": "django.core.cache.backends.dummy.DummyCache",
-        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        # "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        # Читает оба формата, так что CACHE_SERIALIZER можно менять без очистки кэша
+        "BACKEND": "requestdataapp.msgpackcache.MsgpackFileBasedCache",
         # "LOCATION": "/var/tmp/django_cache",
         # "LOCATION": "c:/foo/bar",
         "LOCATION": BASE_DIR / 'django_cache',
+        "OPTIONS": {"SERIALIZER": CACHE_SERIALIZER},
+    },
+    # Изменяемые всеми воркерами ключи: номера версий, счётчики, лимиты, сводка профилировщика.
+    # Без L1 и без случайного удаления при переполнении - только истёкшие записи
+    "state": {
+        "BACKEND": "requestdataapp.msgpackcache.MsgpackFileBasedCache",
+        "LOCATION": BASE_DIR / "django_state",
+        "OPTIONS": {"SERIALIZER": CACHE_SERIALIZER, "MAX_ENTRIES": 100_000, "CULL": "expired"},
     },
 }
+# Алиас для номеров версий и счётчиков (shopapp.caching, requestdataapp.replicas, requestdataapp.profiling)
+STATE_CACHE = "state"
 CACHE_MIDDLEWARE_SECONDS = 200
 
+# Выборочное профилирование (requestdataapp.middlewares.ProfilingMiddleware):
+# каждый N-й запрос (0 - только по заголовку от сотрудника)
+PROFILING_SAMPLE_RATE = int(getenv("DJANGO_PROFILING_SAMPLE_RATE", "0"))
+PROFILING_HEADER = "X-Profile"
+PROFILING_STACK_INTERVAL = 0.005
+PROFILING_DIR = BASE_DIR / "profiles"
+
+# Метрики для Prometheus (requestdataapp.metrics): файлы воркеров и кто может читать /metrics
+METRICS_DIR = BASE_DIR / "metrics"
+METRICS_FLUSH_INTERVAL = 1.0
+# manage.py test подменяет METRICS_DIR, файл лога и все CACHES (requestdataapp.testrunner)
+TEST_RUNNER = "requestdataapp.testrunner.TestRunner"
+METRICS_ALLOWED_IPS = INTERNAL_IPS + [
+    ip.strip() for ip in getenv("DJANGO_METRICS_ALLOWED_IPS", "").split(",") if ip.strip()
+]
+
+# Лимиты частоты запросов (requestdataapp.middlewares.ThrottlingMiddleware):
+# первое правило, чей шаблон подходит к view_name, на IP клиента
+RATE_LIMIT_CACHE = STATE_CACHE
+RATE_LIMITS = [
+    {
+        "name": "exports",
+        "views": ["shopapp:*export*", "shopapp:product-download-csv"],
+        "limit": 60,
+        "window": 60,
+    },
+    {
+        "name": "api",
+        "views": ["shopapp:api-root", "shopapp:product-*", "shopapp:order-*", "shopapp:daily*"],
+        "limit": 600,
+        "window": 60,
+    },
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -185,6 +288,12 @@ STATIC_URL = 'static/'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'uploads'
+
+# Уменьшенные копии изображений товаров (shopapp.images): ширины WebP, качество
+# и потоки фоновой обработки (0 - сразу после коммита в потоке запроса)
+IMAGE_VARIANT_WIDTHS = [320, 640, 1280]
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_WORKERS = 2
 # DEFAULT_FILE_STORAGE =
 
 # Default primary key field type
@@ -216,13 +325,23 @@ LOGFILE_NAME = BASE_DIR / "log.txt"
 # LOGFILE_SIZE = 400
 LOGFILE_SIZE = 1 * 1024 * 1024
 LOGFILE_COUNT = 3
+LOGLEVEL = getenv("DJANGO_LOGLEVEL", "info").upper()
+# Из DEBUG-записей одного места вызова пишется каждая N-я
+LOG_DEBUG_SAMPLE_RATE = int(getenv("DJANGO_LOG_DEBUG_SAMPLE_RATE", "100"))
 
+# Запросы только кладут записи в очередь, консоль и файл пишет фоновый поток (requestdataapp.logqueue)
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "formatters": {
         "verbose": {
-            "format": "%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+            "format": "%(asctime)s [%(levelname)s] %(name)s:%(lineno)s: %(message)s",
+        },
+    },
+    "filters": {
+        "sample_debug": {
+            "()": "requestdataapp.logqueue.SamplingFilter",
+            "rate": LOG_DEBUG_SAMPLE_RATE,
         },
     },
     "handlers": {
@@ -238,37 +357,17 @@ LOGGING = {
             "backupCount": LOGFILE_COUNT,
             "formatter": "verbose",
         },
+        # Имя по алфавиту после целевых: dictConfig настраивает обработчики по порядку имён
+        "queue": {
+            "()": "requestdataapp.logqueue.AsyncQueueHandler",
+            "handlers": ["cfg://handlers.console", "cfg://handlers.logfile"],
+            "filters": ["sample_debug"],
+        },
     },
     "root": {
         "handlers": [
-            "console",
-            "logfile",
+            "queue",
         ],
-        "level": "DEBUG",
+        "level": LOGLEVEL,
     },
 }
-
-LOGLEVEL = getenv("DJANGO_LOGLEVEL", "info").upper()
-logging.config.dictConfig({
-    "version": 1,
-    "disable_existing_loggers": False,
-    "formatters": {
-        "console": {
-            "format": "%(asctime)s %(levelname)s [%(name)s:%(lineno)s] %(module)s %(message)s",
-        },
-    },
-    "handlers": {
-        "console": {
-            "class": "logging.StreamHandler",
-            "formatter": "console",
-        },
-    },
-    "loggers": {
-        "": {
-            "level": LOGLEVEL,
-            "handlers": [
-                "console",
-            ]
-        },
-    },
-})
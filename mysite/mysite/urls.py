@@ -5,6 +5,7 @@ from django.conf.urls.static import static
 from django.conf import settings
 from django.conf.urls.i18n import i18n_patterns
 from .sitemaps import sitemaps
+from requestdataapp.views import metrics_view
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
 urlpatterns = [
@@ -18,6 +19,7 @@ urlpatterns = [
     path('api/', include('myapiapp.urls')),
     path('shop/', include('shopapp.urls')),
     path("blog/", include('blogapp.urls')),
+    path("metrics", metrics_view, name="metrics"),
     path("sitemap.xml", sitemap, {"sitemaps": sitemaps}, name="django.contrib.sitemaps.views.sitemap"),
 ]
 
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class RequestdataappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'requestdataapp'
+
+    def ready(self):
+        from .sqlite import configure_sqlite_connection
+
+        connection_created.connect(configure_sqlite_connection, dispatch_uid="requestdataapp.sqlite")
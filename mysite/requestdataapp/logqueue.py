@@ -0,0 +1,135 @@
+"""
+Неблокирующее логирование через очередь.
+
+Поток запроса только кладёт запись в очередь (QueueHandler), а фоновый
+поток QueueListener забирает их пачками и отдаёт обычным обработчикам
+(консоль, файл), которые форматируют и пишут. Если очередь переполнена,
+запись отбрасывается и учитывается в dropped - запрос никогда не ждёт
+диска. SamplingFilter пропускает только каждую N-ю DEBUG-запись с одного
+места вызова, чтобы отладочные логи горячих путей не забивали очередь.
+"""
+
+import atexit
+import logging
+import os
+from logging.handlers import QueueHandler, QueueListener
+from queue import Empty, Full, Queue
+from threading import Lock
+from typing import Dict, Iterable, List, Tuple
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает 1 из rate записей уровня level и ниже с каждого места вызова."""
+
+    def __init__(self, rate: int = 1, level: str = "DEBUG"):
+        super().__init__()
+        self.rate = max(int(rate), 1)
+        self.levelno = logging.getLevelName(level)
+        self.counters: Dict[Tuple[str, int], int] = {}
+        self.lock = Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate == 1 or record.levelno > self.levelno:
+            return True
+        key = (record.pathname, record.lineno)
+        with self.lock:
+            seen = self.counters.get(key, 0)
+            self.counters[key] = seen + 1
+        return seen % self.rate == 0
+
+
+class BatchingQueueListener(QueueListener):
+    """QueueListener, который за одно пробуждение разбирает до batch_size записей."""
+
+    def __init__(self, queue: Queue, handlers: Iterable[logging.Handler], batch_size: int = 256):
+        super().__init__(queue, *handlers, respect_handler_level=True)
+        self.batch_size = batch_size
+
+    def _monitor(self):
+        queue = self.queue
+        while True:
+            batch = [queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(queue.get_nowait())
+            except Empty:
+                pass
+            for record in batch:
+                if record is self._sentinel:
+                    for _ in batch:
+                        queue.task_done()
+                    return
+                self.handle(record)
+            for _ in batch:
+                queue.task_done()
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    Обработчик для LOGGING: записи уходят в очередь и пишутся обработчиками
+    handlers (ссылки вида "cfg://handlers.console") в фоновом потоке.
+
+    Имя обработчика в LOGGING должно быть позже целевых по алфавиту:
+    dictConfig настраивает обработчики в отсортированном порядке.
+    """
+
+    def __init__(self, handlers: List, maxsize: int = 10000, batch_size: int = 256):
+        super().__init__(Queue(maxsize))
+        targets = [handlers[i] for i in range(len(handlers))]
+        for target in targets:
+            if not isinstance(target, logging.Handler):
+                raise ValueError(f"Handler {target!r} is not configured yet")
+        self.targets = targets
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.closed = False
+        self.start_listener()
+        atexit.register(self.stop_listener)
+        # Поток не переживает fork (воркеры gunicorn) - запускаем заново в потомке
+        os.register_at_fork(after_in_child=self.restart_in_child)
+
+    def start_listener(self) -> None:
+        if self.closed:
+            return
+        self.listener = BatchingQueueListener(self.queue, self.targets, self.batch_size)
+        self.listener.start()
+
+    def restart_in_child(self) -> None:
+        """
+        Новая очередь и поток в процессе-потомке.
+
+        Очередь родителя не годится: fork копирует её блокировки в том
+        состоянии, в каком они были, и если в этот момент поток родителя
+        держал mutex очереди, первый же put в потомке зависнет навсегда.
+        Записи, которые родитель не успел обработать, остаются родителю.
+        """
+        self.queue = Queue(self.queue.maxsize)
+        self.start_listener()
+
+    def stop_listener(self) -> None:
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Только подставляем аргументы (они могут измениться после вызова),
+        # форматирование - в фоновом потоке
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+    def flush(self) -> None:
+        """Дождаться, пока фоновый поток обработает всё из очереди."""
+        if self.listener._thread is not None:
+            self.queue.join()
+
+    def close(self) -> None:
+        # dictConfig закрывает старые обработчики при повторной настройке
+        self.closed = True
+        self.stop_listener()
+        super().close()
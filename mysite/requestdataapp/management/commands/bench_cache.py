@@ -0,0 +1,63 @@
+import random
+from decimal import Decimal
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from django.core.cache import caches
+from django.core.management import BaseCommand
+from django.test import override_settings
+
+
+class Command(BaseCommand):
+    """
+    Compares cache.get throughput of the shared FileBasedCache alone and behind the in-process L1 (TieredCache)
+    """
+
+    help = "Benchmark FileBasedCache vs TieredCache reads with a skewed key popularity"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keys", type=int, default=500)
+        parser.add_argument("--reads", type=int, default=20000)
+        parser.add_argument("--rows", type=int, default=50, help="Export-like rows per cached value")
+        parser.add_argument("--l1-entries", type=int, default=1000)
+        parser.add_argument("--zipf-s", type=float, default=1.1)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        weights = [1 / rank ** options["zipf_s"] for rank in range(1, options["keys"] + 1)]
+        reads = rng.choices(range(options["keys"]), weights=weights, k=options["reads"])
+        value = [
+            {"pk": pk, "name": f"Product {pk}", "price": Decimal("199.90"), "discount": 5, "archived": False}
+            for pk in range(options["rows"])
+        ]
+
+        with TemporaryDirectory() as directory:
+            with override_settings(CACHES={
+                "file": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": directory,
+                    "OPTIONS": {"MAX_ENTRIES": options["keys"] * 2},
+                },
+                "tiered": {
+                    "BACKEND": "requestdataapp.tieredcache.TieredCache",
+                    "LOCATION": "file",
+                    "OPTIONS": {"MAX_ENTRIES": options["l1_entries"]},
+                },
+            }):
+                for key in range(options["keys"]):
+                    caches["file"].set(f"bench:{key}", value, timeout=None, version=1)
+                results = {}
+                for alias in ("file", "tiered"):
+                    backend = caches[alias]
+                    started = perf_counter()
+                    for key in reads:
+                        backend.get(f"bench:{key}", version=1)
+                    elapsed = perf_counter() - started
+                    results[alias] = len(reads) / elapsed
+                    self.stdout.write(f"{alias:>6}: {results[alias]:9.0f} gets/s  {elapsed / len(reads) * 1e6:7.1f} us/get")
+                stats = caches["tiered"].stats()
+                self.stdout.write(
+                    f"L1 hit ratio {stats['l1']['hit_ratio']:.1%} ({stats['l1']['entries']} entries, "
+                    f"{stats['l1']['evictions']} evictions)  speedup {results['tiered'] / results['file']:.1f}x"
+                )
@@ -0,0 +1,87 @@
+import logging
+import os
+from logging.handlers import RotatingFileHandler
+from tempfile import TemporaryDirectory
+from threading import Barrier, Thread
+from time import perf_counter, sleep
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from requestdataapp.logqueue import AsyncQueueHandler
+from shopapp.benchmarks import percentile
+
+
+class Command(BaseCommand):
+    """
+    Measures per-call logging latency under bursts: synchronous handlers vs the queue pipeline
+    """
+
+    help = "Compare tail latency of synchronous and queue-based logging under log bursts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--bursts", type=int, default=20)
+        parser.add_argument("--burst-size", type=int, default=200)
+        parser.add_argument("--pause", type=float, default=0.1, help="Seconds between bursts")
+
+    def handle(self, *args, **options):
+        formatter = logging.Formatter(settings.LOGGING["formatters"]["verbose"]["format"])
+        with TemporaryDirectory() as directory, open(os.devnull, "w") as devnull:
+            for mode in ("sync", "queue"):
+                console = logging.StreamHandler(devnull)
+                logfile = RotatingFileHandler(
+                    os.path.join(directory, f"{mode}.log"),
+                    maxBytes=settings.LOGFILE_SIZE,
+                    backupCount=settings.LOGFILE_COUNT,
+                )
+                for handler in (console, logfile):
+                    handler.setFormatter(formatter)
+                handlers = [console, logfile]
+                if mode == "queue":
+                    handlers = [AsyncQueueHandler([console, logfile])]
+
+                logger = logging.getLogger(f"bench.logging.{mode}")
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                for handler in handlers:
+                    logger.addHandler(handler)
+                try:
+                    timings = self.run_bursts(logger, options)
+                finally:
+                    for handler in handlers:
+                        logger.removeHandler(handler)
+                        handler.close()
+                    console.close()
+                    logfile.close()
+                self.report(mode, timings, getattr(handlers[0], "dropped", 0))
+
+    def run_bursts(self, logger: logging.Logger, options) -> list:
+        threads = options["threads"]
+        barrier = Barrier(threads)
+        results = [[] for _ in range(threads)]
+
+        def worker(timings: list):
+            for burst in range(options["bursts"]):
+                barrier.wait()
+                for i in range(options["burst_size"]):
+                    started = perf_counter()
+                    logger.info("Order %s for user %s: %s items", i, burst, {"total": i * 10})
+                    timings.append(perf_counter() - started)
+                sleep(options["pause"])
+
+        workers = [Thread(target=worker, args=(timings,)) for timings in results]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return sorted(timing for timings in results for timing in timings)
+
+    def report(self, mode: str, timings: list, dropped: int):
+        p50, p99, p999 = (percentile(timings, fraction) * 1e6 for fraction in (0.5, 0.99, 0.999))
+        self.stdout.write(
+            f"{mode:>5}: {len(timings)} calls  "
+            f"p50 {p50:8.1f} us  p99 {p99:8.1f} us  "
+            f"p99.9 {p999:8.1f} us  max {timings[-1] * 1e6:9.1f} us  "
+            f"dropped {dropped}"
+        )
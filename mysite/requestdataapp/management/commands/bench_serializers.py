@@ -0,0 +1,105 @@
+import json
+import pickle
+import zlib
+from time import perf_counter
+
+from django.core.management import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Prefetch
+
+from requestdataapp import msgpackcache
+from shopapp.datagen import DataSpec, generate_data
+from shopapp.models import Order, Product
+from shopapp.renderers import MsgpackParser, MsgpackRenderer
+from shopapp.serializers import OrderSerializer, ProductSerializer
+
+
+class BytesStream:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def read(self) -> bytes:
+        return self.data
+
+
+def json_dumps(value) -> bytes:
+    return json.dumps(value, cls=DjangoJSONEncoder).encode()
+
+
+def api_msgpack_loads(data: bytes):
+    return MsgpackParser().parse(BytesStream(data))
+
+
+CODECS = {
+    "json": (json_dumps, json.loads),
+    "pickle": (lambda value: pickle.dumps(value, pickle.HIGHEST_PROTOCOL), pickle.loads),
+    "msgpack": (msgpackcache.dumps, msgpackcache.loads),
+    "msgpack-api": (MsgpackRenderer().render, api_msgpack_loads),
+}
+
+
+class Command(BaseCommand):
+    """
+    Compares payload size and encode/decode time of JSON, pickle and msgpack on shop data
+    """
+
+    help = "Benchmark JSON, pickle and msgpack on product/order payloads from a throwaway database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--orders", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            generate_data(DataSpec(
+                users=max(options["orders"] // 10, 1),
+                products=options["products"],
+                orders=options["orders"],
+                seed=options["seed"],
+            ))
+            payloads = self.build_payloads()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(
+            f"{'payload':<16} {'codec':<12} {'bytes':>10} {'zlib':>10} {'encode ms':>10} {'decode ms':>10}"
+        )
+        for name, value in payloads.items():
+            for codec, (dumps, loads) in CODECS.items():
+                # Внутренние расширения msgpack не для API: API-формат меряем на данных сериализаторов
+                if codec == "msgpack-api" and not name.startswith("api"):
+                    continue
+                encoded = dumps(value)
+                encode = self.best_of(options["repeat"], dumps, value)
+                decode = self.best_of(options["repeat"], loads, encoded)
+                self.stdout.write(
+                    f"{name:<16} {codec:<12} {len(encoded):>10} {len(zlib.compress(encoded)):>10} "
+                    f"{encode * 1000:>10.2f} {decode * 1000:>10.2f}"
+                )
+
+    def build_payloads(self) -> dict:
+        orders = Order.objects.prefetch_related(Prefetch("products", queryset=Product.objects.only("pk")))
+        return {
+            # Как в ProductsDataExportView: Decimal как есть
+            "products-export": [
+                {"pk": product.pk, "name": product.name, "price": product.price, "archived": product.archived}
+                for product in Product.objects.order_by("pk")
+            ],
+            # Строки заказов с Decimal и datetime
+            "orders-rows": list(Order.objects.order_by("pk").values()),
+            "api-products": ProductSerializer(Product.objects.order_by("pk"), many=True).data,
+            "api-orders": OrderSerializer(orders.order_by("pk"), many=True).data,
+        }
+
+    @staticmethod
+    def best_of(repeat: int, func, arg) -> float:
+        best = float("inf")
+        for _ in range(repeat):
+            started = perf_counter()
+            func(arg)
+            best = min(best, perf_counter() - started)
+        return best
@@ -0,0 +1,122 @@
+import os
+import random
+import sqlite3
+from multiprocessing import Pool
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from requestdataapp.sqlite import apply_pragmas
+
+# Что было до профиля: журнал отката, полный fsync, новое соединение на запрос
+BASELINE_PRAGMAS = {"journal_mode": "delete", "synchronous": "full"}
+
+SCHEMA = """
+CREATE TABLE product (id INTEGER PRIMARY KEY, name TEXT NOT NULL, price REAL NOT NULL, stock INTEGER NOT NULL);
+CREATE TABLE product_order (id INTEGER PRIMARY KEY, product_id INTEGER NOT NULL, quantity INTEGER NOT NULL);
+CREATE INDEX product_order_product ON product_order (product_id);
+"""
+
+
+def run_worker(args) -> tuple:
+    path, profile, pragmas, operations, write_ratio, products, seed = args
+    rng = random.Random(seed)
+    persistent = profile == "tuned"
+    connection = None
+    reads = writes = locked = 0
+    started = perf_counter()
+    for _ in range(operations):
+        if connection is None:
+            connection = sqlite3.connect(path, timeout=5)
+            apply_pragmas(connection, pragmas)
+        product_id = rng.randint(1, products)
+        try:
+            if rng.random() < write_ratio:
+                with connection:
+                    connection.execute(
+                        "INSERT INTO product_order (product_id, quantity) VALUES (?, ?)",
+                        (product_id, rng.randint(1, 5)),
+                    )
+                    connection.execute("UPDATE product SET stock = stock - 1 WHERE id = ?", (product_id,))
+                writes += 1
+            else:
+                connection.execute("SELECT name, price, stock FROM product WHERE id = ?", (product_id,)).fetchone()
+                connection.execute(
+                    "SELECT count(*), sum(quantity) FROM product_order WHERE product_id = ?", (product_id,)
+                ).fetchone()
+                reads += 1
+        except sqlite3.OperationalError as exc:
+            if "locked" not in str(exc):
+                raise
+            locked += 1
+        if not persistent:
+            connection.close()
+            connection = None
+    if connection is not None:
+        connection.close()
+    return reads, writes, locked, perf_counter() - started
+
+
+class Command(BaseCommand):
+    """
+    Compares SQLite throughput under concurrent workers: old defaults vs SQLITE_PRAGMAS with persistent connections
+    """
+
+    help = "Benchmark concurrent SQLite reads/writes with the baseline and tuned connection profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--operations", type=int, default=2000, help="Operations per worker")
+        parser.add_argument("--write-ratio", type=float, default=0.1)
+        parser.add_argument("--products", type=int, default=10000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        profiles = {"baseline": BASELINE_PRAGMAS, "tuned": settings.SQLITE_PRAGMAS}
+        results = {}
+        for profile, pragmas in profiles.items():
+            with TemporaryDirectory() as directory:
+                path = os.path.join(directory, "bench.sqlite3")
+                self.create_database(path, pragmas, options["products"])
+                tasks = [
+                    (
+                        path,
+                        profile,
+                        pragmas,
+                        options["operations"],
+                        options["write_ratio"],
+                        options["products"],
+                        f"{options['seed']}:{worker}",
+                    )
+                    for worker in range(options["workers"])
+                ]
+                started = perf_counter()
+                with Pool(options["workers"]) as pool:
+                    stats = pool.map(run_worker, tasks)
+                elapsed = perf_counter() - started
+            reads, writes, locked = (sum(column) for column in list(zip(*stats))[:3])
+            results[profile] = (reads + writes) / elapsed
+            self.stdout.write(
+                f"{profile:>8}: {reads + writes:7d} ops in {elapsed:6.2f} s  "
+                f"{results[profile]:9.0f} ops/s  reads {reads}  writes {writes}  locked {locked}"
+            )
+        self.stdout.write(f"speedup: {results['tuned'] / results['baseline']:.2f}x")
+
+    def create_database(self, path: str, pragmas: dict, products: int):
+        rng = random.Random(0)
+        connection = sqlite3.connect(path)
+        try:
+            apply_pragmas(connection, pragmas)
+            connection.executescript(SCHEMA)
+            with connection:
+                connection.executemany(
+                    "INSERT INTO product (id, name, price, stock) VALUES (?, ?, ?, ?)",
+                    (
+                        (pk, f"product {pk}", round(rng.lognormvariate(7, 1), 2), 1000)
+                        for pk in range(1, products + 1)
+                    ),
+                )
+        finally:
+            connection.close()
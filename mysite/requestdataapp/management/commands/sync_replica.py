@@ -0,0 +1,42 @@
+from time import perf_counter, sleep, time_ns
+
+from django.core.management import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from requestdataapp.replicas import copy_sqlite_database, mark_synced
+
+
+class Command(BaseCommand):
+    """
+    Copies the primary SQLite database into the replica file (local stand-in for replication)
+    """
+
+    help = "Copy the default SQLite database into the replica alias, once or every --interval seconds"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--replica", default="replica", help="Replica database alias")
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Repeat every N seconds (keep below DATABASE_REPLICA_PIN_SECONDS); 0 - copy once",
+        )
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        if options["replica"] not in connections:
+            raise CommandError(f"Unknown database alias {options['replica']!r}")
+        replica = connections[options["replica"]].settings_dict
+        if primary["ENGINE"] != replica["ENGINE"] or connections[DEFAULT_DB_ALIAS].vendor != "sqlite":
+            raise CommandError("sync_replica only copies SQLite databases")
+
+        while True:
+            started = perf_counter()
+            # До копирования: всё, что закоммичено раньше, попадёт в копию
+            started_ns = time_ns()
+            copy_sqlite_database(str(primary["NAME"]), str(replica["NAME"]))
+            mark_synced(started_ns)
+            self.stdout.write(f"Copied {primary['NAME']} -> {replica['NAME']} in {perf_counter() - started:.3f} s")
+            if not options["interval"]:
+                break
+            sleep(options["interval"])
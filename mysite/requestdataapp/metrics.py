@@ -0,0 +1,253 @@
+"""
+Метрики запросов в текстовом формате Prometheus.
+
+Каждый процесс копит счётчики в памяти (словарь под блокировкой - на
+запрос несколько операций со словарём) и не чаще раза в
+METRICS_FLUSH_INTERVAL секунд сбрасывает их в METRICS_DIR/<pid>.json.
+Эндпоинт /metrics складывает файлы всех воркеров, так что счётчики
+общие для всех процессов gunicorn и переживают перезапуск воркера.
+
+Файлы завершившихся процессов collect() переносит в ARCHIVE_FILE
+(суммы не уменьшаются, а файлов не становится больше с каждым
+перезапуском). Процесс, получивший pid завершившегося, перед первой
+записью тоже переносит его файл в архив, а не затирает. Проверка
+процесса - os.kill(pid, 0), поэтому перенос работает только на POSIX.
+
+Метрики с меткой view (view_name маршрута):
+- django_http_requests_total{view, method, status}
+- django_http_request_duration_seconds - гистограмма времени ответа
+- django_db_queries_total - SQL-запросы
+- django_cache_requests_total{view, result} и django_cache_hit_ratio
+
+И без метки view - django_cache_tier_requests_total{tier, result}
+(requestdataapp.tieredcache).
+"""
+
+import json
+import os
+from bisect import bisect_left
+from pathlib import Path
+from threading import Lock, local
+from time import monotonic
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.files import locks
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+FAMILIES = {
+    "django_http_requests_total": ("counter", "HTTP requests by view, method and status."),
+    "django_http_request_duration_seconds": ("histogram", "HTTP request latency by view."),
+    "django_db_queries_total": ("counter", "SQL queries executed by view."),
+    "django_cache_requests_total": ("counter", "Application cache lookups by view and result."),
+    "django_cache_tier_requests_total": ("counter", "Tiered cache lookups by tier (l1, l2) and result."),
+}
+
+ARCHIVE_FILE = "archive.json"
+ARCHIVE_LOCK = "archive.lock"
+
+Labels = Tuple[Tuple[str, str], ...]
+SeriesKey = Tuple[str, Labels]
+
+_local = local()
+
+
+class MetricsStore:
+    def __init__(self):
+        self.values: Dict[SeriesKey, float] = {}
+        self.lock = Lock()
+        self.flushed_at = monotonic()
+        # pid, который уже писал свой файл (после fork - другой)
+        self.owner_pid: Optional[int] = None
+
+    def observe_request(self, view: str, method: str, status: int, duration: float,
+                        queries: int, cache_hits: int, cache_misses: int) -> None:
+        view_label = (("view", view),)
+        # Гистограмма хранится сразу накопленной: bucket le увеличивается для всех le >= duration
+        first_bucket = bisect_left(BUCKETS, duration)
+        with self.lock:
+            values = self.values
+            for key, value in (
+                (("django_http_requests_total", (("view", view), ("method", method), ("status", str(status)))), 1),
+                (("django_http_request_duration_seconds_sum", view_label), duration),
+                (("django_http_request_duration_seconds_count", view_label), 1),
+                (("django_db_queries_total", view_label), queries),
+            ):
+                values[key] = values.get(key, 0) + value
+            for le in BUCKETS[first_bucket:] + (float("inf"),):
+                key = ("django_http_request_duration_seconds_bucket", (("view", view), ("le", _format_le(le))))
+                values[key] = values.get(key, 0) + 1
+            for result, count in (("hit", cache_hits), ("miss", cache_misses)):
+                if count:
+                    key = ("django_cache_requests_total", (("view", view), ("result", result)))
+                    values[key] = values.get(key, 0) + count
+
+    def inc(self, name: str, labels: Labels, value: float = 1) -> None:
+        with self.lock:
+            self.values[(name, labels)] = self.values.get((name, labels), 0) + value
+
+    def snapshot(self) -> List[list]:
+        with self.lock:
+            return [[name, list(labels), value] for (name, labels), value in self.values.items()]
+
+    def flush(self, directory: Optional[Path] = None, force: bool = False) -> None:
+        if not force and monotonic() - self.flushed_at < settings.METRICS_FLUSH_INTERVAL:
+            return
+        self.flushed_at = monotonic()
+        directory = Path(directory or settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        pid = os.getpid()
+        path = directory / f"{pid}.json"
+        if self.owner_pid != pid:
+            # Файл с нашим pid остался от завершившегося процесса
+            if path.exists():
+                archive(directory, [path])
+            self.owner_pid = pid
+        _write_series(path, self.snapshot())
+
+
+store = MetricsStore()
+
+
+def _format_le(le: float) -> str:
+    return "+Inf" if le == float("inf") else repr(le)
+
+
+def start_request() -> None:
+    _local.cache = [0, 0]
+
+
+def finish_request() -> Tuple[int, int]:
+    counts = getattr(_local, "cache", None) or [0, 0]
+    _local.cache = None
+    return counts[0], counts[1]
+
+
+def observe_cache(hit: bool) -> None:
+    """Учесть обращение к кэшу приложения в текущем запросе."""
+    counts = getattr(_local, "cache", None)
+    if counts is not None:
+        counts[0 if hit else 1] += 1
+
+
+def _write_series(path: Path, series: list) -> None:
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(series))
+    # Читатель всегда видит файл целиком
+    os.replace(tmp_path, path)
+
+
+def _read_series(path: Path, totals: Dict[SeriesKey, float]) -> None:
+    try:
+        series = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return
+    for name, labels, value in series:
+        key = (name, tuple(tuple(pair) for pair in labels))
+        totals[key] = totals.get(key, 0) + value
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _owned_by_other(path: Path) -> bool:
+    pid = int(path.stem)
+    return pid != os.getpid() and pid_alive(pid)
+
+
+def archive(directory: Path, paths: Iterable[Path]) -> None:
+    """Добавить файлы процессов к ARCHIVE_FILE и удалить их."""
+    with open(directory / ARCHIVE_LOCK, "a") as lock_file:
+        locks.lock(lock_file, locks.LOCK_EX)
+        try:
+            totals: Dict[SeriesKey, float] = {}
+            _read_series(directory / ARCHIVE_FILE, totals)
+            # Пока ждали блокировку, файл мог перенести другой процесс,
+            # а pid - достаться новому воркеру: файлы живых процессов не трогаем
+            paths = [path for path in paths if path.exists() and not _owned_by_other(path)]
+            if not paths:
+                return
+            for path in paths:
+                _read_series(path, totals)
+            _write_series(
+                directory / ARCHIVE_FILE,
+                [[name, list(labels), value] for (name, labels), value in totals.items()],
+            )
+            for path in paths:
+                path.unlink(missing_ok=True)
+        finally:
+            locks.unlock(lock_file)
+
+
+def prune(directory: Path) -> None:
+    """Перенести в архив файлы процессов, которых уже нет."""
+    if os.name != "posix":
+        return
+    dead = [
+        path for path in directory.glob("*.json")
+        if path.stem.isdigit() and not pid_alive(int(path.stem))
+    ]
+    if dead:
+        archive(directory, dead)
+
+
+def collect(directory: Optional[Path] = None) -> Dict[SeriesKey, float]:
+    """Сумма значений из файлов всех процессов и архива."""
+    directory = Path(directory or settings.METRICS_DIR)
+    if directory.exists():
+        prune(directory)
+    totals: Dict[SeriesKey, float] = {}
+    for path in directory.glob("*.json"):
+        _read_series(path, totals)
+    return totals
+
+
+def _series_sort_key(item) -> tuple:
+    (name, labels), _ = item
+    return name, tuple(
+        (key, float(value) if key == "le" else 0.0, value)
+        for key, value in labels
+    )
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = ",".join(
+        '{}="{}"'.format(key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + pairs + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(totals: Dict[SeriesKey, float]) -> str:
+    lines = []
+    ordered = sorted(totals.items(), key=_series_sort_key)
+    for family, (kind, help_text) in FAMILIES.items():
+        lines.append(f"# HELP {family} {help_text}")
+        lines.append(f"# TYPE {family} {kind}")
+        for (name, labels), value in ordered:
+            if name == family or (kind == "histogram" and name.startswith(family + "_")):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    lines.append("# HELP django_cache_hit_ratio Share of application cache lookups that hit, by view.")
+    lines.append("# TYPE django_cache_hit_ratio gauge")
+    lookups: Dict[str, List[float]] = {}
+    for (name, labels), value in ordered:
+        if name == "django_cache_requests_total":
+            label_map = dict(labels)
+            counts = lookups.setdefault(label_map["view"], [0, 0])
+            counts[0 if label_map["result"] == "hit" else 1] += value
+    for view, (hits, misses) in sorted(lookups.items()):
+        lines.append(f'django_cache_hit_ratio{_format_labels((("view", view),))} {_format_value(hits / (hits + misses))}')
+    return "\n".join(lines) + "\n"
@@ -1,7 +1,14 @@
-from datetime import datetime
 from ipaddress import ip_address
+from contextlib import ExitStack
+from itertools import count
+from time import perf_counter
 
-from django.http import HttpRequest, HttpResponseForbidden
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+
+from django.db import connections
+
+from . import metrics, profiling, ratelimit, replicas
 
 
 def set_useragent_on_request_middleware(get_response):
@@ -39,24 +46,145 @@ class CountRequestsMiddleware:
 
 
 class ThrottlingMiddleware:
+    """
+    Ограничение частоты запросов по правилам RATE_LIMITS.
+
+    Правило выбирается по view_name (первое подходящее), клиент - по IP.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
-        self.log = {}
+        self.limiter = ratelimit.get_limiter()
 
     def __call__(self, request: HttpRequest):
-        ip_address = request.META.get("REMOTE_ADDR")
-        current_time = datetime.now()
+        return self.get_response(request)
+
+    def process_view(self, request: HttpRequest, view_func, view_args, view_kwargs):
+        rule = self.limiter.rule_for(request.resolver_match.view_name)
+        if rule is None:
+            return None
+        # По IP, а не по пользователю: request.user стоил бы запросов к сессии и пользователю
+        try:
+            client = f"ip:{ip_address(request.META.get('REMOTE_ADDR', ''))}"
+        except ValueError:
+            # Пустой или не IP (прокси через unix-сокет) - общий ключ для всех таких клиентов
+            client = "ip:unknown"
+        allowed, retry_after = self.limiter.hit(rule, client)
+        if allowed:
+            return None
+        response = HttpResponse("Try later!", status=429)
+        response["Retry-After"] = str(retry_after)
+        return response
 
-        if ip_address not in self.log:
-            self.log[ip_address] = [current_time]
-        else:
-            last_request = self.log[ip_address][-1]
-            interval = current_time - last_request
 
-            if interval.total_seconds() < 10:
-                return HttpResponseForbidden("Try later!", status=403)
+class ProfilingMiddleware:
+    """
+    Профилирует каждый PROFILING_SAMPLE_RATE-й запрос (0 - ни одного)
+    и запросы сотрудников с заголовком PROFILING_HEADER.
 
-            self.log[ip_address].append(current_time)
+    Ставится после AuthenticationMiddleware. Профилированный ответ получает
+    заголовок Server-Timing, сводка по маршрутам - в requestdataapp:profiling.
+    """
 
-        response = self.get_response(request)
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.header = "HTTP_" + settings.PROFILING_HEADER.upper().replace("-", "_")
+        self.stack_interval = settings.PROFILING_STACK_INTERVAL
+        self.counter = count()
+        profiling.instrument_templates()
+
+    def should_profile(self, request: HttpRequest) -> bool:
+        if self.sample_rate and next(self.counter) % self.sample_rate == 0:
+            return True
+        user = getattr(request, "user", None)
+        return bool(request.META.get(self.header)) and user is not None and user.is_staff
+
+    def __call__(self, request: HttpRequest):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        with profiling.profile_request(self.stack_interval) as profile:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        route = match.route if match is not None else "<unresolved>"
+        profiling.record(route, profile)
+        profiling.write_stacks(route, profile.stacks)
+        response["Server-Timing"] = profile.server_timing()
+        return response
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """
+    Счётчики запросов для /metrics (requestdataapp.metrics).
+
+    Ставится первой, чтобы время ответа включало остальные middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest):
+        queries = QueryCounter()
+        metrics.start_request()
+        started = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        duration = perf_counter() - started
+        cache_hits, cache_misses = metrics.finish_request()
+
+        match = request.resolver_match
+        metrics.store.observe_request(
+            view=match.view_name if match is not None else "<unresolved>",
+            method=request.method,
+            status=response.status_code,
+            duration=duration,
+            queries=queries.count,
+            cache_hits=cache_hits,
+            cache_misses=cache_misses,
+        )
+        metrics.store.flush()
         return response
+
+
+class ReplicaMiddleware:
+    """
+    Чтение с реплики для GET/HEAD к DATABASE_REPLICA_VIEWS (requestdataapp.replicas).
+
+    После записи клиент DATABASE_REPLICA_PIN_SECONDS читает из основной базы.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = settings.DATABASE_REPLICA_PIN_SECONDS
+
+    def __call__(self, request: HttpRequest):
+        with replicas.routing_scope() as state:
+            request.db_routing = state
+            response = self.get_response(request)
+        if state.wrote:
+            response.set_cookie(
+                replicas.PIN_COOKIE, "1", max_age=self.pin_seconds, httponly=True, samesite="Lax"
+            )
+        return response
+
+    def process_view(self, request: HttpRequest, view_func, view_args, view_kwargs):
+        if (
+            request.method in ("GET", "HEAD")
+            and replicas.PIN_COOKIE not in request.COOKIES
+            and replicas.is_replica_view(request.resolver_match.view_name)
+        ):
+            request.db_routing.replica = True
+        return None
@@ -0,0 +1,222 @@
+"""
+Сериализация значений кэша в msgpack.
+
+Данные сериализаторов API (словари строк и чисел) msgpack кодирует
+быстрее pickle, строки с Decimal и datetime - медленнее (см.
+bench_serializers), поэтому формат записи выбирается настройкой.
+Типы, которых нет в msgpack, кодируются расширениями: Decimal,
+datetime/date/time строкой ISO, tuple - списком внутри расширения
+(чтобы вернуться кортежем). Подклассы dict и list
+(OrderedDict, ReturnDict, ReturnList) сохраняются как обычные dict и
+list. Всё остальное (например, HttpResponse из cache_page) уходит
+в расширение с pickle, так что закэшировать можно что угодно.
+
+Закодированное значение начинается с MARKER (0xc1 в msgpack не
+используется), значения без него читаются как pickle - записи
+в любом из форматов остаются читаемыми после смены настройки.
+
+Счётчики общего кэша (лимиты запросов, статистика кэша списков)
+меняют все воркеры, поэтому add и incr в MsgpackFileBasedCache
+атомарны между процессами, а incr не сбрасывает срок жизни ключа.
+С OPTIONS["CULL"] = "expired" при переполнении удаляются только
+истёкшие записи - так хранятся номера версий и счётчики (CACHES["state"]).
+"""
+
+import os
+import pickle
+import tempfile
+import zlib
+from datetime import date, datetime, time
+from decimal import Decimal
+from functools import partial
+from time import time as now
+
+import msgpack
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+
+MARKER = b"\xc1"
+
+EXT_DECIMAL = 1
+EXT_DATETIME = 2
+EXT_DATE = 3
+EXT_TIME = 4
+EXT_TUPLE = 5
+EXT_PICKLE = 6
+
+
+def _default(obj):
+    if isinstance(obj, dict):
+        return dict(obj)
+    if isinstance(obj, list):
+        return list(obj)
+    if isinstance(obj, tuple):
+        return msgpack.ExtType(EXT_TUPLE, _pack(list(obj)))
+    if isinstance(obj, Decimal):
+        return msgpack.ExtType(EXT_DECIMAL, str(obj).encode())
+    # datetime - подкласс date, проверяется первым
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(EXT_DATETIME, obj.isoformat().encode())
+    if isinstance(obj, date):
+        return msgpack.ExtType(EXT_DATE, obj.isoformat().encode())
+    if isinstance(obj, time):
+        return msgpack.ExtType(EXT_TIME, obj.isoformat().encode())
+    return msgpack.ExtType(EXT_PICKLE, pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+
+def _ext_hook(code: int, data: bytes):
+    if code == EXT_DECIMAL:
+        return Decimal(data.decode())
+    if code == EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == EXT_DATE:
+        return date.fromisoformat(data.decode())
+    if code == EXT_TIME:
+        return time.fromisoformat(data.decode())
+    if code == EXT_TUPLE:
+        return tuple(_unpack(data))
+    if code == EXT_PICKLE:
+        return pickle.loads(data)
+    return msgpack.ExtType(code, data)
+
+
+def _pack(value) -> bytes:
+    # strict_types: подклассы (bool у int, OrderedDict у dict) идут через _default
+    return msgpack.packb(value, default=_default, strict_types=True, use_bin_type=True)
+
+
+def _unpack(data: bytes):
+    return msgpack.unpackb(data, ext_hook=_ext_hook, raw=False, strict_map_key=False)
+
+
+def dumps(value) -> bytes:
+    try:
+        return MARKER + _pack(value)
+    except (OverflowError, ValueError):
+        # Целые вне 64 бит и слишком глубокая вложенность
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def loads(data: bytes):
+    if data[:1] == MARKER:
+        return _unpack(data[1:])
+    return pickle.loads(data)
+
+
+class MsgpackFileBasedCache(FileBasedCache):
+    """
+    FileBasedCache, который хранит значения в msgpack (dumps/loads), а не pickle.
+
+    OPTIONS["SERIALIZER"] = "pickle" пишет pickle; читаются оба формата,
+    поэтому переключение в любую сторону не ломает уже записанный кэш.
+
+    В FileBasedCache add - это has_key и set, а incr - get и set
+    с timeout по умолчанию: параллельные воркеры теряли приращения,
+    а счётчик с timeout=None получал срок жизни. Здесь add создаёт файл
+    через link (не заменяет существующий), incr меняет его на месте под
+    блокировкой файла.
+
+    При переполнении MAX_ENTRIES FileBasedCache удаляет случайную
+    1/CULL_FREQUENCY часть записей, в том числе счётчики и номера версий.
+    OPTIONS["CULL"] = "expired" удаляет только истёкшие записи: живые
+    не теряются, но после переполнения каждая запись просматривает весь
+    каталог, поэтому MAX_ENTRIES должен быть с запасом.
+    """
+
+    def __init__(self, dir, params):
+        super().__init__(dir, params)
+        options = params.get("OPTIONS", {})
+        serializer = options.get("SERIALIZER", "msgpack")
+        if serializer not in ("msgpack", "pickle"):
+            raise ValueError(f"Unknown cache serializer {serializer!r}")
+        self.dumps = dumps if serializer == "msgpack" else partial(pickle.dumps, protocol=self.pickle_protocol)
+        self.cull = options.get("CULL", "random")
+        if self.cull not in ("random", "expired"):
+            raise ValueError(f"Unknown cache cull mode {self.cull!r}")
+
+    def get(self, key, default=None, version=None):
+        fname = self._key_to_file(key, version)
+        try:
+            with open(fname, "rb") as f:
+                if not self._is_expired(f):
+                    return loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            pass
+        return default
+
+    def _write_content(self, file, timeout, value):
+        expiry = self.get_backend_timeout(timeout)
+        file.write(pickle.dumps(expiry, self.pickle_protocol))
+        file.write(zlib.compress(self.dumps(value)))
+
+    def _cull(self):
+        if self.cull == "random":
+            return super()._cull()
+        filelist = self._list_cache_files()
+        if len(filelist) < self._max_entries:
+            return
+        for fname in filelist:
+            try:
+                # _is_expired сам удаляет истёкший файл
+                with open(fname, "rb") as f:
+                    self._is_expired(f)
+            except FileNotFoundError:
+                pass
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        try:
+            with open(self._key_to_file(key, version), "r+b") as f:
+                try:
+                    locks.lock(f, locks.LOCK_EX)
+                    if self._is_expired(f):
+                        return False
+                    previous_value = loads(zlib.decompress(f.read()))
+                    f.seek(0)
+                    self._write_content(f, timeout, previous_value)
+                    return True
+                finally:
+                    locks.unlock(f)
+        except FileNotFoundError:
+            return False
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if self.has_key(key, version):
+            return False
+        self._createdir()
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, "wb") as f:
+                self._write_content(f, timeout, value)
+            # В отличие от rename, link не заменяет файл, созданный другим процессом
+            os.link(tmp_path, self._key_to_file(key, version))
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        try:
+            with open(self._key_to_file(key, version), "r+b") as f:
+                locks.lock(f, locks.LOCK_EX)
+                try:
+                    try:
+                        expiry = pickle.load(f)
+                    except EOFError:
+                        expiry = 0
+                    if expiry is not None and expiry < now():
+                        raise ValueError(f"Key '{key}' not found")
+                    value = loads(zlib.decompress(f.read())) + delta
+                    f.seek(0)
+                    # Прежний срок жизни, а не timeout по умолчанию
+                    f.write(pickle.dumps(expiry, self.pickle_protocol))
+                    f.write(zlib.compress(self.dumps(value)))
+                    f.truncate()
+                    f.flush()
+                finally:
+                    locks.unlock(f)
+        except FileNotFoundError:
+            raise ValueError(f"Key '{key}' not found")
+        return value
@@ -0,0 +1,211 @@
+"""
+Выборочное профилирование запросов.
+
+Для профилируемого запроса считаются: число и время SQL-запросов (через
+execute_wrapper на всех соединениях), время рендера шаблонов (обёртка
+над Template.render, считается только внешний шаблон), CPU-время потока
+и стек вызовов, который отдельный поток снимает каждые
+PROFILING_STACK_INTERVAL секунд. Стеки дописываются в
+PROFILING_DIR/<маршрут>.folded в формате collapsed stacks (flamegraph.pl,
+speedscope), сводка по маршрутам хранится в кэше STATE_CACHE и общая для воркеров.
+"""
+
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from functools import wraps
+from pathlib import Path
+from threading import Event, Lock, Thread, get_ident, local
+from time import perf_counter, thread_time
+from typing import Dict, Iterator, List
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template.base import Template
+from django.utils.connection import ConnectionProxy
+
+SUMMARY_KEY = "requestdataapp:profiling:routes"
+
+# Общий для воркеров ключ - в CACHES[STATE_CACHE]
+state_cache = ConnectionProxy(caches, settings.STATE_CACHE)
+
+_local = local()
+_files_lock = Lock()
+
+
+@dataclass
+class RequestProfile:
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    sql_count: int = 0
+    sql_time: float = 0.0
+    template_time: float = 0.0
+    template_depth: int = 0
+    stacks: Counter = field(default_factory=Counter)
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper соединений
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_count += 1
+            self.sql_time += perf_counter() - started
+
+    def server_timing(self) -> str:
+        return ", ".join([
+            f'sql;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} queries"',
+            f"tpl;dur={self.template_time * 1000:.1f}",
+            f"cpu;dur={self.cpu_time * 1000:.1f}",
+            f"total;dur={self.wall_time * 1000:.1f}",
+        ])
+
+
+def collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler(Thread):
+    """Поток, снимающий стек потока thread_id раз в interval секунд."""
+
+    def __init__(self, thread_id: int, interval: float, stacks: Counter):
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = stacks
+        self.finished = Event()
+
+    def run(self):
+        while not self.finished.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def stop(self):
+        self.finished.set()
+        self.join()
+
+
+def instrument_templates() -> None:
+    """Один раз обернуть Template.render, чтобы считать время рендера."""
+    if getattr(Template.render, "profiled", False):
+        return
+    original = Template.render
+
+    @wraps(original)
+    def render(self, context):
+        profile = getattr(_local, "profile", None)
+        if profile is None or profile.template_depth:
+            return original(self, context)
+        profile.template_depth += 1
+        started = perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            profile.template_depth -= 1
+            profile.template_time += perf_counter() - started
+
+    render.profiled = True
+    Template.render = render
+
+
+@contextmanager
+def profile_request(stack_interval: float) -> Iterator[RequestProfile]:
+    """Профилировать код текущего потока внутри блока with."""
+    profile = RequestProfile()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profile))
+        sampler = None
+        if stack_interval:
+            sampler = StackSampler(get_ident(), stack_interval, profile.stacks)
+            sampler.start()
+        _local.profile = profile
+        started, cpu_started = perf_counter(), thread_time()
+        try:
+            yield profile
+        finally:
+            profile.wall_time = perf_counter() - started
+            profile.cpu_time = thread_time() - cpu_started
+            _local.profile = None
+            if sampler is not None:
+                sampler.stop()
+
+
+def stacks_path(route: str) -> Path:
+    slug = re.sub(r"[^\w-]+", "_", route).strip("_") or "root"
+    return Path(settings.PROFILING_DIR) / f"{slug}.folded"
+
+
+def write_stacks(route: str, stacks: Counter) -> None:
+    if not stacks:
+        return
+    path = stacks_path(route)
+    lines = "".join(f"{stack} {count}\n" for stack, count in stacks.items())
+    with _files_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a") as file:
+            file.write(lines)
+
+
+def record(route: str, profile: RequestProfile) -> None:
+    """
+    Добавить профиль к сводке маршрута.
+
+    Чтение и запись ключа не атомарны: при одновременных запросах часть
+    выборок может потеряться, для статистики по выборке это допустимо.
+    """
+    summary: Dict[str, dict] = state_cache.get(SUMMARY_KEY) or {}
+    stats = summary.setdefault(route, {
+        "count": 0,
+        "wall_ms": 0.0,
+        "wall_max_ms": 0.0,
+        "cpu_ms": 0.0,
+        "sql_count": 0,
+        "sql_max_count": 0,
+        "sql_ms": 0.0,
+        "template_ms": 0.0,
+    })
+    wall_ms = profile.wall_time * 1000
+    stats["count"] += 1
+    stats["wall_ms"] += wall_ms
+    stats["wall_max_ms"] = max(stats["wall_max_ms"], wall_ms)
+    stats["cpu_ms"] += profile.cpu_time * 1000
+    stats["sql_count"] += profile.sql_count
+    stats["sql_max_count"] = max(stats["sql_max_count"], profile.sql_count)
+    stats["sql_ms"] += profile.sql_time * 1000
+    stats["template_ms"] += profile.template_time * 1000
+    state_cache.set(SUMMARY_KEY, summary, timeout=None)
+
+
+def summary() -> List[dict]:
+    """Средние значения по маршрутам, самые затратные по суммарному времени - первыми."""
+    rows = []
+    for route, stats in (state_cache.get(SUMMARY_KEY) or {}).items():
+        count = stats["count"]
+        rows.append({
+            "route": route,
+            "count": count,
+            "total_wall_ms": round(stats["wall_ms"], 2),
+            "avg_wall_ms": round(stats["wall_ms"] / count, 2),
+            "max_wall_ms": round(stats["wall_max_ms"], 2),
+            "avg_cpu_ms": round(stats["cpu_ms"] / count, 2),
+            "avg_sql_count": round(stats["sql_count"] / count, 2),
+            "max_sql_count": stats["sql_max_count"],
+            "avg_sql_ms": round(stats["sql_ms"] / count, 2),
+            "avg_template_ms": round(stats["template_ms"] / count, 2),
+            "stacks_file": str(stacks_path(route)),
+        })
+    rows.sort(key=lambda row: row["total_wall_ms"], reverse=True)
+    return rows
+
+
+def reset() -> None:
+    state_cache.delete(SUMMARY_KEY)
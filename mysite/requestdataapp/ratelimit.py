@@ -0,0 +1,103 @@
+"""
+Ограничение частоты запросов скользящим окном в общем кэше.
+
+На клиента и правило хранятся два счётчика: текущего и предыдущего окна.
+Оценка числа запросов за последние window секунд - счётчик текущего окна
+плюс доля предыдущего, пропорциональная ещё не истёкшей его части. Счётчик
+увеличивается через cache.incr. Лимит общий для всех воркеров, только если
+incr атомарен: в memcached, redis и в общем файловом кэше проекта
+(requestdataapp.msgpackcache.MsgpackFileBasedCache) это так. У LocMemCache
+счётчики свои в каждом процессе, а FileBasedCache из Django теряет
+приращения при параллельных запросах. Состояние клиента не растёт со
+временем: старые окна истекают по timeout.
+"""
+
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from math import ceil
+from time import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = "ratelimit"
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Не больше limit запросов за window секунд к представлениям views (шаблоны fnmatch по view_name)."""
+
+    name: str
+    views: Tuple[str, ...]
+    limit: int
+    window: int
+
+    def matches(self, view_name: str) -> bool:
+        return any(fnmatchcase(view_name, pattern) for pattern in self.views)
+
+
+def load_rules(config: Iterable[dict]) -> List[RateLimit]:
+    return [
+        RateLimit(name=rule["name"], views=tuple(rule["views"]), limit=rule["limit"], window=rule["window"])
+        for rule in config
+    ]
+
+
+class SlidingWindowLimiter:
+    def __init__(self, rules: List[RateLimit], cache_alias: str = "default"):
+        self.rules = rules
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def rule_for(self, view_name: str) -> Optional[RateLimit]:
+        for rule in self.rules:
+            if rule.matches(view_name):
+                return rule
+        return None
+
+    def incr(self, key: str, timeout: int) -> int:
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            if self.cache.add(key, 1, timeout=timeout):
+                return 1
+            return self.cache.incr(key)
+
+    def hit(self, rule: RateLimit, client: str, now: Optional[float] = None) -> Tuple[bool, int]:
+        """
+        Учесть запрос клиента. Возвращает (разрешён ли, Retry-After в секундах).
+
+        Отклонённый запрос из счётчика вычитается: лимит расходуют только
+        выполненные запросы.
+        """
+        now = time() if now is None else now
+        window_index, offset = divmod(now, rule.window)
+        window_index = int(window_index)
+        key = f"{KEY_PREFIX}:{rule.name}:{client}:{window_index}"
+        previous_key = f"{KEY_PREFIX}:{rule.name}:{client}:{window_index - 1}"
+
+        current = self.incr(key, timeout=rule.window * 2)
+        previous = self.cache.get(previous_key, 0)
+        estimated = previous * (1 - offset / rule.window) + current
+        if estimated <= rule.limit:
+            return True, 0
+
+        try:
+            self.cache.decr(key)
+        except ValueError:
+            pass
+        self.incr(f"{KEY_PREFIX}:rejected:{rule.name}", timeout=None)
+        return False, max(ceil(rule.window - offset), 1)
+
+    def rejection_counts(self) -> Dict[str, int]:
+        keys = {f"{KEY_PREFIX}:rejected:{rule.name}": rule.name for rule in self.rules}
+        found = self.cache.get_many(list(keys))
+        return {name: found.get(key, 0) for key, name in keys.items()}
+
+
+def get_limiter() -> SlidingWindowLimiter:
+    return SlidingWindowLimiter(load_rules(settings.RATE_LIMITS), settings.RATE_LIMIT_CACHE)
@@ -0,0 +1,137 @@
+"""
+Чтение с реплики базы данных.
+
+ReplicaMiddleware включает реплику для GET/HEAD к представлениям из
+DATABASE_REPLICA_VIEWS (шаблоны fnmatch по view_name), ReplicaRouter
+отправляет туда чтение внутри такого запроса. Запись всегда идёт
+в основную базу; после первой записи запрос до конца читает из основной,
+а клиент получает cookie PIN_COOKIE и ещё DATABASE_REPLICA_PIN_SECONDS
+читает только из основной - реплика успевает догнать, и клиент видит
+свои изменения. Сессии читаются только из основной базы.
+
+Реплика отстаёт от основной базы, а версии кэша (shopapp.caching) -
+время записи в наносекундах - меняются сразу после коммита. sync_replica
+запоминает время начала копирования (mark_synced): всё, что закоммичено
+раньше, в реплике уже есть. Если версия данных новее, запрос, который
+строит что-то под этой версией (запись кэша, ETag), дочитывает из
+основной базы - read_from_primary_if_stale().
+
+Локально реплика - второй файл SQLite, который обновляет sync_replica
+(copy_sqlite_database через backup API).
+"""
+
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from typing import Iterator, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.connection import ConnectionProxy
+
+PIN_COOKIE = "db_primary"
+SYNCED_KEY = "requestdataapp:replica:synced_at"
+
+# Общий для воркеров ключ - в CACHES[STATE_CACHE]
+state_cache = ConnectionProxy(caches, settings.STATE_CACHE)
+
+# Данные, которые должны быть свежими в каждом запросе
+PRIMARY_ONLY_APPS = {"sessions"}
+
+
+@dataclass
+class RoutingState:
+    replica: bool = False
+    wrote: bool = False
+
+
+_state: ContextVar[Optional[RoutingState]] = ContextVar("requestdataapp_db_routing", default=None)
+
+
+@contextmanager
+def routing_scope() -> Iterator[RoutingState]:
+    state = RoutingState()
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def replica_alias() -> Optional[str]:
+    return settings.DATABASE_REPLICA
+
+
+def reading_replica() -> bool:
+    """Читает ли текущий запрос с реплики."""
+    state = _state.get()
+    return replica_alias() is not None and state is not None and state.replica and not state.wrote
+
+
+def read_from_primary() -> None:
+    """До конца запроса читать из основной базы."""
+    state = _state.get()
+    if state is not None:
+        state.replica = False
+
+
+def mark_synced(started_ns: int) -> None:
+    """Реплика содержит всё, что закоммичено до started_ns (time_ns начала копирования)."""
+    state_cache.set(SYNCED_KEY, started_ns, timeout=None)
+
+
+def replica_synced_at() -> int:
+    return state_cache.get(SYNCED_KEY, 0)
+
+
+def read_from_primary_if_stale(version: int) -> None:
+    """Читать из основной базы, если реплику копировали раньше, чем сменилась версия."""
+    if reading_replica() and version > replica_synced_at():
+        read_from_primary()
+
+
+def is_replica_view(view_name: str) -> bool:
+    return any(fnmatchcase(view_name, pattern) for pattern in settings.DATABASE_REPLICA_VIEWS)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        alias = replica_alias()
+        if alias is None or state is None or not state.replica or state.wrote:
+            return None
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        # Явно: иначе объект, прочитанный с реплики, сохранился бы в неё же
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия основной базы, связи между ними допустимы
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплики приходит вместе с копией основной базы
+        return db == DEFAULT_DB_ALIAS
+
+
+def copy_sqlite_database(source: str, target: str, pages: int = -1) -> None:
+    """Скопировать базу SQLite через backup API: читатели target ждут только на время записи."""
+    source_connection = sqlite3.connect(source)
+    target_connection = sqlite3.connect(target)
+    try:
+        source_connection.backup(target_connection, pages=pages)
+    finally:
+        target_connection.close()
+        source_connection.close()
@@ -0,0 +1,41 @@
+"""
+Настройки SQLite на каждое новое соединение (сигнал connection_created).
+
+PRAGMA из SQLITE_PRAGMAS выполняются по порядку сразу после подключения:
+journal_mode=WAL (читатели не блокируют писателя), synchronous=NORMAL
+(в WAL безопасно, fsync только на checkpoint), mmap_size и cache_size
+(меньше системных вызовов на чтение) и busy_timeout (ждать блокировку,
+а не сразу падать с "database is locked"). Вместе с CONN_MAX_AGE
+соединение и его настройки переиспользуются между запросами.
+"""
+
+from typing import Dict, List, Union
+
+from django.conf import settings
+
+PragmaValue = Union[int, str]
+
+
+def pragma_statements(pragmas: Dict[str, PragmaValue]) -> List[str]:
+    statements = []
+    for name, value in pragmas.items():
+        if not name.isidentifier() or not str(value).lstrip("-").isalnum():
+            raise ValueError(f"Invalid SQLite pragma {name}={value!r}")
+        statements.append(f"PRAGMA {name} = {value}")
+    return statements
+
+
+def apply_pragmas(cursor, pragmas: Dict[str, PragmaValue]) -> None:
+    for statement in pragma_statements(pragmas):
+        cursor.execute(statement)
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    pragmas = getattr(settings, "SQLITE_PRAGMAS", {})
+    if connection.is_in_memory_db():
+        # WAL и mmap у базы в памяти не имеют смысла
+        pragmas = {name: value for name, value in pragmas.items() if name not in ("journal_mode", "mmap_size")}
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, pragmas)
@@ -0,0 +1,54 @@
+from copy import deepcopy
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TextTestResult
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from django.utils.log import configure_logging
+
+
+class CacheClearingResultMixin:
+    """Каждый тест начинается с пустых кэшей: версии, счётчики и лимиты не переходят между тестами."""
+
+    def startTest(self, test):
+        for backend in caches.all():
+            backend.clear()
+        super().startTest(test)
+
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner, который не трогает файлы проекта: метрики воркера
+    и log.txt пишутся во временный каталог, все алиасы CACHES заменены
+    на LocMemCache (django_cache не растёт, тесты не видят записей
+    запущенного сервера).
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.files_dir = TemporaryDirectory(prefix="mysite-tests-")
+        files_dir = Path(self.files_dir.name)
+        self.files_override = override_settings(
+            METRICS_DIR=files_dir / "metrics",
+            CACHES={
+                alias: {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": alias}
+                for alias in settings.CACHES
+            },
+        )
+        self.files_override.enable()
+        logging_config = deepcopy(settings.LOGGING)
+        logging_config["handlers"]["logfile"]["filename"] = files_dir / "log.txt"
+        configure_logging(settings.LOGGING_CONFIG, logging_config)
+
+    def teardown_test_environment(self, **kwargs):
+        configure_logging(settings.LOGGING_CONFIG, settings.LOGGING)
+        self.files_override.disable()
+        self.files_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
+
+    def get_resultclass(self):
+        resultclass = super().get_resultclass() or TextTestResult
+        return type("CacheClearingResult", (CacheClearingResultMixin, resultclass), {})
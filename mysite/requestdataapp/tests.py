@@ -1,3 +1,614 @@
-from django.test import TestCase
+import logging
+import os
+import pickle
+import sqlite3
+import subprocess
+import sys
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import sleep, time_ns
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from requestdataapp.logqueue import AsyncQueueHandler, SamplingFilter
+from requestdataapp.msgpackcache import MsgpackFileBasedCache, dumps as msgpack_dumps, loads as msgpack_loads
+from requestdataapp.metrics import MetricsStore, collect, render, store as metrics_store
+from requestdataapp.profiling import profile_request, write_stacks
+from requestdataapp.ratelimit import RateLimit, SlidingWindowLimiter, load_rules
+from requestdataapp.replicas import PIN_COOKIE, ReplicaRouter, copy_sqlite_database, mark_synced, routing_scope
+from requestdataapp.sqlite import pragma_statements
+from requestdataapp.tieredcache import TieredCache
+from shopapp.caching import PRODUCTS, PRODUCTS_LIST, bump_version, get_versions
+from shopapp.fuzzy import FuzzyProductIndex
+from shopapp.models import Product
+
+
+@override_settings(
+    PROFILING_SAMPLE_RATE=0,
+    PROFILING_STACK_INTERVAL=0.001,
+)
+class ProfilingMiddlewareTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username="staff", password="qwerty", is_staff=True)
+        cls.user = User.objects.create_user(username="user", password="qwerty")
+
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.profiles_dir = Path(directory.name)
+        settings_override = override_settings(PROFILING_DIR=self.profiles_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_not_profiled_by_default(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("requestdataapp:get-view"))
+        self.assertNotIn("Server-Timing", response)
+
+    def test_header_ignored_for_non_staff(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("requestdataapp:get-view"), HTTP_X_PROFILE="1")
+        self.assertNotIn("Server-Timing", response)
+
+    def test_staff_header_profiles_request(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("requestdataapp:get-view"), HTTP_X_PROFILE="1")
+        self.assertIn("sql;dur=", response["Server-Timing"])
+
+        summary = self.client.get(reverse("requestdataapp:profiling-summary")).json()["routes"]
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]["route"], "req/get/")
+        self.assertEqual(summary[0]["count"], 1)
+        self.assertGreater(summary[0]["avg_template_ms"], 0)
+
+    @override_settings(PROFILING_SAMPLE_RATE=2)
+    def test_sampling_every_nth_request(self):
+        profiled = [
+            "Server-Timing" in self.client.get(reverse("requestdataapp:get-view"))
+            for _ in range(4)
+        ]
+        self.assertEqual(profiled, [True, False, True, False])
+
+    def test_summary_requires_staff(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("requestdataapp:profiling-summary"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_profile_collects_sql_and_stacks(self):
+        with profile_request(0.001) as profile:
+            User.objects.count()
+            sleep(0.05)
+
+        self.assertEqual(profile.sql_count, 1)
+        self.assertGreater(profile.wall_time, 0.04)
+        self.assertTrue(any("test_profile_collects_sql_and_stacks" in stack for stack in profile.stacks))
+
+        write_stacks("req/get/", profile.stacks)
+        lines = (self.profiles_dir / "req_get.folded").read_text().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in lines))
+
+
+class SlidingWindowLimiterTestCase(TestCase):
+    rule = RateLimit(name="test", views=("shopapp:*",), limit=3, window=10)
+
+    def setUp(self):
+        self.limiter = SlidingWindowLimiter([self.rule])
+
+    def test_rejects_over_limit_within_window(self):
+        results = [self.limiter.hit(self.rule, "ip:1", now=100 + i)[0] for i in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+        self.assertEqual(self.limiter.hit(self.rule, "ip:1", now=104), (False, 6))
+        # Другой клиент - своё окно
+        self.assertTrue(self.limiter.hit(self.rule, "ip:2", now=104)[0])
+        self.assertEqual(self.limiter.rejection_counts(), {"test": 2})
+
+    def test_previous_window_weight_decays(self):
+        for i in range(3):
+            self.limiter.hit(self.rule, "ip:1", now=105 + i)
+        # В начале следующего окна предыдущее ещё почти целиком учитывается
+        self.assertFalse(self.limiter.hit(self.rule, "ip:1", now=111)[0])
+        # К концу окна его вес мал
+        self.assertTrue(self.limiter.hit(self.rule, "ip:1", now=119)[0])
+
+    def test_rule_matching(self):
+        limiter = SlidingWindowLimiter(load_rules([
+            {"name": "exports", "views": ["shopapp:*export*"], "limit": 1, "window": 1},
+            {"name": "api", "views": ["shopapp:product-*"], "limit": 1, "window": 1},
+        ]))
+        self.assertEqual(limiter.rule_for("shopapp:products-export").name, "exports")
+        self.assertEqual(limiter.rule_for("shopapp:product-list").name, "api")
+        self.assertIsNone(limiter.rule_for("shopapp:products_list"))
+
+
+@override_settings(
+    RATE_LIMITS=[{"name": "get", "views": ["requestdataapp:get-view"], "limit": 2, "window": 60}],
+)
+class ThrottlingMiddlewareTestCase(TestCase):
+    def test_limits_per_route(self):
+        url = reverse("requestdataapp:get-view")
+        statuses = [self.client.get(url).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertIn("Retry-After", self.client.get(url))
+        # Маршрут без правила не ограничен
+        self.assertEqual(self.client.get(reverse("requestdataapp:user-form")).status_code, 200)
+
+    def test_unparsable_remote_addr_shares_one_key(self):
+        url = reverse("requestdataapp:get-view")
+        statuses = [self.client.get(url, REMOTE_ADDR=addr).status_code for addr in ("", "unix:", "")]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_stats_for_staff(self):
+        staff = User.objects.create_user(username="staff", password="qwerty", is_staff=True)
+        self.client.force_login(staff)
+        url = reverse("requestdataapp:get-view")
+        for _ in range(3):
+            self.client.get(url)
+        response = self.client.get(reverse("requestdataapp:ratelimit-stats"))
+        self.assertEqual(response.json(), {"rejected": {"get": 1}})
+
+
+class MetricsStoreTestCase(TestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.metrics_dir = Path(directory.name)
+
+    def test_histogram_is_cumulative(self):
+        store = MetricsStore()
+        store.observe_request("shop:index", "GET", 200, 0.03, queries=2, cache_hits=1, cache_misses=0)
+        values = dict(store.values)
+        bucket = "django_http_request_duration_seconds_bucket"
+        self.assertNotIn((bucket, (("view", "shop:index"), ("le", "0.025"))), values)
+        self.assertEqual(values[(bucket, (("view", "shop:index"), ("le", "0.05")))], 1)
+        self.assertEqual(values[(bucket, (("view", "shop:index"), ("le", "+Inf")))], 1)
+
+    def test_workers_are_summed(self):
+        store = MetricsStore()
+        store.observe_request("shop:index", "GET", 200, 0.2, queries=3, cache_hits=1, cache_misses=0)
+        store.flush(self.metrics_dir, force=True)
+        # Файл другого воркера
+        (self.metrics_dir / "1.json").write_text((self.metrics_dir / f"{os.getpid()}.json").read_text())
+
+        text = render(collect(self.metrics_dir))
+        self.assertIn('django_http_requests_total{view="shop:index",method="GET",status="200"} 2', text)
+        self.assertIn('django_http_request_duration_seconds_bucket{view="shop:index",le="0.25"} 2', text)
+        self.assertIn('django_db_queries_total{view="shop:index"} 6', text)
+        self.assertIn('django_cache_hit_ratio{view="shop:index"} 1', text)
+        self.assertIn("# TYPE django_http_request_duration_seconds histogram", text)
+
+    def dead_pid(self) -> int:
+        process = subprocess.Popen([sys.executable, "-c", ""])
+        process.wait()
+        return process.pid
+
+    def test_dead_workers_are_archived(self):
+        store = MetricsStore()
+        store.observe_request("shop:index", "GET", 200, 0.2, queries=3, cache_hits=0, cache_misses=0)
+        store.flush(self.metrics_dir, force=True)
+        dead_path = self.metrics_dir / f"{self.dead_pid()}.json"
+        dead_path.write_text((self.metrics_dir / f"{os.getpid()}.json").read_text())
+
+        totals = collect(self.metrics_dir)
+        self.assertFalse(dead_path.exists())
+        self.assertTrue((self.metrics_dir / "archive.json").exists())
+        self.assertEqual(totals[("django_db_queries_total", (("view", "shop:index"),))], 6)
+        self.assertEqual(collect(self.metrics_dir), totals)
+
+    def test_reused_pid_keeps_previous_counts(self):
+        # Файл прежнего процесса с тем же pid
+        previous = MetricsStore()
+        previous.observe_request("shop:index", "GET", 200, 0.2, queries=3, cache_hits=0, cache_misses=0)
+        previous.flush(self.metrics_dir, force=True)
+
+        store = MetricsStore()
+        store.observe_request("shop:index", "GET", 200, 0.2, queries=1, cache_hits=0, cache_misses=0)
+        store.flush(self.metrics_dir, force=True)
+        store.flush(self.metrics_dir, force=True)
+        totals = collect(self.metrics_dir)
+        self.assertEqual(totals[("django_db_queries_total", (("view", "shop:index"),))], 4)
+
+
+@override_settings(
+    METRICS_ALLOWED_IPS=["127.0.0.1"],
+)
+class MetricsEndpointTestCase(TestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(METRICS_DIR=Path(directory.name))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        metrics_store.values.clear()
+
+    def test_requests_and_cache_ratio(self):
+        for _ in range(2):
+            self.client.get(reverse("shopapp:product-list"))
+        self.client.get(reverse("requestdataapp:get-view"))
+
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        text = response.content.decode()
+        self.assertIn('django_http_requests_total{view="shopapp:product-list",method="GET",status="200"} 2', text)
+        self.assertIn('django_http_requests_total{view="requestdataapp:get-view",method="GET",status="200"} 1', text)
+        self.assertIn('django_cache_hit_ratio{view="shopapp:product-list"} 0.5', text)
+
+    @override_settings(METRICS_ALLOWED_IPS=[])
+    def test_forbidden_outside_allowed_ips(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=["127.0.0.1", ""])
+    def test_forbidden_without_remote_addr(self):
+        self.assertEqual(self.client.get(reverse("metrics"), REMOTE_ADDR="").status_code, 403)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(self.format(record))
+
+
+class AsyncQueueHandlerTestCase(TestCase):
+    def setUp(self):
+        self.target = ListHandler()
+        self.target.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+        self.logger = logging.getLogger("requestdataapp.tests.logqueue")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+
+    def attach(self, handler: logging.Handler):
+        self.logger.addHandler(handler)
+        self.addCleanup(handler.close)
+        self.addCleanup(self.logger.removeHandler, handler)
+
+    def test_records_written_by_listener(self):
+        handler = AsyncQueueHandler([self.target])
+        self.attach(handler)
+        payload = {"items": 1}
+        self.logger.info("Order %s: %s", 5, payload)
+        # Изменения после вызова в запись не попадают
+        payload["items"] = 2
+        handler.flush()
+
+        self.assertEqual(self.target.records, ["INFO Order 5: {'items': 1}"])
+        self.assertIsNot(handler.listener._thread, None)
+
+    def test_child_gets_own_queue_after_fork(self):
+        handler = AsyncQueueHandler([self.target])
+        self.attach(handler)
+        parent_queue = handler.queue
+        # В потомке потока родителя нет
+        handler.stop_listener()
+        handler.restart_in_child()
+        self.logger.info("child")
+        handler.flush()
+
+        self.assertIsNot(handler.queue, parent_queue)
+        self.assertIs(handler.listener.queue, handler.queue)
+        self.assertEqual(handler.queue.maxsize, parent_queue.maxsize)
+        self.assertEqual(self.target.records, ["INFO child"])
+
+    def test_overflow_drops_instead_of_blocking(self):
+        handler = AsyncQueueHandler([self.target], maxsize=1)
+        handler.stop_listener()
+        self.attach(handler)
+        for i in range(3):
+            self.logger.info("record %s", i)
+        self.assertEqual(handler.dropped, 2)
+
+    def test_debug_sampling_per_call_site(self):
+        handler = AsyncQueueHandler([self.target])
+        handler.addFilter(SamplingFilter(rate=3))
+        self.attach(handler)
+        for i in range(7):
+            self.logger.debug("hot %s", i)
+        self.logger.warning("rare")
+        handler.flush()
+
+        self.assertEqual(self.target.records, ["DEBUG hot 0", "DEBUG hot 3", "DEBUG hot 6", "WARNING rare"])
+
+
+class SQLitePragmasTestCase(TestCase):
+    def pragma(self, wrapper, name: str):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_applied_to_test_connection(self):
+        self.assertEqual(self.pragma(connection, "busy_timeout"), 5000)
+        self.assertEqual(self.pragma(connection, "cache_size"), -64000)
+        self.assertEqual(self.pragma(connection, "synchronous"), 1)  # NORMAL
+
+    def test_file_database_uses_wal(self):
+        with TemporaryDirectory() as directory:
+            wrapper = DatabaseWrapper(
+                {**connection.settings_dict, "NAME": os.path.join(directory, "db.sqlite3")},
+                alias="pragmas",
+            )
+            try:
+                self.assertEqual(self.pragma(wrapper, "journal_mode"), "wal")
+                self.assertEqual(self.pragma(wrapper, "mmap_size"), 256 * 1024 * 1024)
+            finally:
+                wrapper.close()
+
+    def test_rejects_unsafe_values(self):
+        self.assertEqual(pragma_statements({"cache_size": -2000}), ["PRAGMA cache_size = -2000"])
+        with self.assertRaises(ValueError):
+            pragma_statements({"journal_mode": "wal; DROP TABLE x"})
+
+
+@override_settings(
+    DATABASE_REPLICA="replica",
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+)
+class ReplicaRoutingTestCase(TestCase):
+    # Реплика в тестах - второе соединение с той же базой в памяти: таблицы,
+    # изменённые в транзакции теста, для него заблокированы, поэтому здесь без записи
+    databases = {"default", "replica"}
+
+    def get_sitemap(self):
+        with CaptureQueriesContext(connections["default"]) as primary, \
+                CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.client.get(reverse("django.contrib.sitemaps.views.sitemap"))
+        self.assertEqual(response.status_code, 200)
+        return len(primary), len(replica)
+
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Product))
+        with routing_scope() as state:
+            state.replica = True
+            self.assertEqual(router.db_for_read(Product), "replica")
+            self.assertEqual(router.db_for_write(Product), "default")
+            # После записи запрос читает из основной базы
+            self.assertIsNone(router.db_for_read(Product))
+
+    def test_replica_view_reads_replica(self):
+        primary, replica = self.get_sitemap()
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    @override_settings(DATABASE_REPLICA=None)
+    def test_disabled(self):
+        primary, replica = self.get_sitemap()
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_copy_sqlite_database(self):
+        with TemporaryDirectory() as directory:
+            source, target = os.path.join(directory, "primary.sqlite3"), os.path.join(directory, "replica.sqlite3")
+            with sqlite3.connect(source) as primary:
+                primary.execute("CREATE TABLE item (name TEXT)")
+                primary.execute("INSERT INTO item VALUES ('laptop')")
+            primary.close()
+            copy_sqlite_database(source, target)
+            replica = sqlite3.connect(target)
+            try:
+                self.assertEqual(replica.execute("SELECT name FROM item").fetchall(), [("laptop",)])
+            finally:
+                replica.close()
+
+
+@override_settings(DATABASE_REPLICA="replica")
+class ReplicaVersionedCacheTestCase(TestCase):
+    # Как в ReplicaRoutingTestCase - без записи
+    databases = {"default", "replica"}
+
+    def get(self, url):
+        with CaptureQueriesContext(connections["default"]) as primary, \
+                CaptureQueriesContext(connections["replica"]) as replica:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(primary), len(replica)
+
+    urls = ("shopapp:product-list", "shopapp:products-export")
+
+    def test_stale_replica_miss_reads_primary(self):
+        # sync_replica ещё не запускался - реплика старше любой версии
+        for name in self.urls:
+            with self.subTest(url=name):
+                response, primary, replica = self.get(reverse(name))
+                self.assertGreater(primary, 0)
+                self.assertEqual(replica, 0)
+
+                response, primary, replica = self.get(reverse(name))
+                self.assertEqual((primary, replica), (0, 0))
+
+    def test_synced_replica_serves_miss_and_304(self):
+        get_versions(PRODUCTS, PRODUCTS_LIST)
+        mark_synced(time_ns())
+        for name in self.urls:
+            with self.subTest(url=name):
+                response, primary, replica = self.get(reverse(name))
+                self.assertEqual(primary, 0)
+                self.assertGreater(replica, 0)
+                self.assertIn("ETag", response)
+
+                with CaptureQueriesContext(connections["replica"]) as replica:
+                    revalidated = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=response["ETag"])
+                self.assertEqual(revalidated.status_code, 304)
+                self.assertEqual(len(replica), 0)
+
+    def test_write_after_sync_reads_primary(self):
+        mark_synced(time_ns())
+        bump_version(PRODUCTS, PRODUCTS_LIST)
+        _, primary, replica = self.get(reverse("shopapp:products-export"))
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_fuzzy_index_reads_primary(self):
+        with routing_scope() as state, \
+                CaptureQueriesContext(connections["default"]) as primary, \
+                CaptureQueriesContext(connections["replica"]) as replica:
+            state.replica = True
+            FuzzyProductIndex().refresh(force=True)
+        self.assertEqual((len(primary), len(replica)), (1, 0))
+
+
+@override_settings(
+    DATABASE_REPLICA="replica",
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}},
+)
+class ReplicaPinTestCase(TestCase):
+    # Без "replica" в databases любой запрос к реплике уронит тест
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="writer", password="qwerty")
+
+    def test_write_pins_client_to_primary(self):
+        response = self.client.post(reverse("myauth:login"), {"username": "writer", "password": "qwerty"})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        with CaptureQueriesContext(connections["default"]) as primary:
+            response = self.client.get(reverse("django.contrib.sitemaps.views.sitemap"))
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(primary), 0)
+
+
+class TieredCacheTestCase(TestCase):
+    def make_cache(self, **options) -> TieredCache:
+        """Отдельный экземпляр - как L1 отдельного воркера."""
+        return TieredCache("shared", {"OPTIONS": {"L1_BYPASS": ["version:*"], **options}})
+
+    def test_promotes_to_l1(self):
+        tiered = self.make_cache()
+        caches["shared"].set("key", {"total": 1})
+        self.assertEqual(tiered.get("key"), {"total": 1})
+        self.assertEqual(tiered.get("key"), {"total": 1})
+        self.assertIsNone(tiered.get("missing"))
+        stats = tiered.stats()
+        self.assertEqual((stats["l1"]["hits"], stats["l1"]["misses"]), (1, 2))
+        self.assertEqual((stats["l2"]["hits"], stats["l2"]["misses"]), (1, 1))
+
+    def test_version_invalidation_across_workers(self):
+        writer, reader = self.make_cache(), self.make_cache()
+        writer.set("version:products", 1)
+        writer.set("products", ["old"], version=1)
+        self.assertEqual(reader.get("products", version=reader.get("version:products")), ["old"])
+
+        writer.set("version:products", 2)
+        writer.set("products", ["new"], version=2)
+        self.assertEqual(reader.get("products", version=reader.get("version:products")), ["new"])
+
+    def test_unversioned_entries_expire_from_l1(self):
+        writer, reader = self.make_cache(), self.make_cache(L1_TIMEOUT=0.05)
+        writer.set("key", "old")
+        self.assertEqual(reader.get("key"), "old")
+        writer.set("key", "new")
+        self.assertEqual(reader.get("key"), "old")
+        sleep(0.06)
+        self.assertEqual(reader.get("key"), "new")
+
+    def test_bounded_by_entries_and_size(self):
+        tiered = self.make_cache(MAX_ENTRIES=2, MAX_SIZE=1024)
+        for key in ("a", "b", "c"):
+            tiered.set(key, key)
+        tiered.set("big", "x" * 2048)
+        stats = tiered.stats()["l1"]
+        self.assertEqual((stats["entries"], stats["evictions"]), (2, 1))
+        self.assertLessEqual(stats["size"], 1024)
+        self.assertEqual(tiered.get("big"), "x" * 2048)
+        self.assertEqual(tiered.get("a"), "a")
+
+    def test_incr_and_delete_reach_shared(self):
+        tiered = self.make_cache()
+        tiered.set("counter", 1)
+        self.assertEqual(tiered.incr("counter"), 2)
+        self.assertEqual(tiered.get("counter"), 2)
+        tiered.delete("counter")
+        self.assertIsNone(caches["shared"].get("counter"))
+        self.assertIsNone(tiered.get("counter"))
+
+
+class MsgpackCacheTestCase(TestCase):
+    def test_round_trip(self):
+        value = {
+            "products": [{"pk": 1, "price": Decimal("100.50"), "archived": False}],
+            "created_at": datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc),
+            "day": date(2024, 5, 1),
+            "range": (1, 5),
+            "ordered": OrderedDict(b=1, a=2),
+            "big": 2 ** 70,
+            "response": HttpResponse("cached page"),
+        }
+        restored = msgpack_loads(msgpack_dumps(value))
+        self.assertEqual(restored["products"], value["products"])
+        self.assertEqual(restored["created_at"], value["created_at"])
+        self.assertEqual(restored["day"], value["day"])
+        self.assertEqual(restored["range"], (1, 5))
+        self.assertEqual(list(restored["ordered"]), ["b", "a"])
+        self.assertEqual(restored["big"], 2 ** 70)
+        self.assertEqual(restored["response"].content, b"cached page")
+
+    def test_reads_pickled_values(self):
+        self.assertEqual(msgpack_loads(pickle.dumps({"pk": 1})), {"pk": 1})
+
+    def test_file_backend(self):
+        with TemporaryDirectory() as directory:
+            backend = MsgpackFileBasedCache(directory, {})
+            backend.set("export", [{"price": Decimal("1.50")}], 60)
+            self.assertEqual(backend.get("export"), [{"price": Decimal("1.50")}])
+            self.assertTrue(backend.touch("export", 120))
+            backend.set("counter", 1)
+            self.assertEqual(backend.incr("counter", 2), 3)
+            self.assertEqual(backend.get("export"), [{"price": Decimal("1.50")}])
+
+    def test_counters_are_atomic_and_keep_expiry(self):
+        with TemporaryDirectory() as directory:
+            backend = MsgpackFileBasedCache(directory, {})
+            self.assertTrue(backend.add("rejected", 0, timeout=None))
+            self.assertFalse(backend.add("rejected", 5, timeout=None))
+
+            def worker():
+                for _ in range(50):
+                    MsgpackFileBasedCache(directory, {}).incr("rejected")
+
+            threads = [Thread(target=worker) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(backend.get("rejected"), 200)
+            with open(backend._key_to_file("rejected"), "rb") as f:
+                self.assertIsNone(pickle.load(f))
+
+            backend.set("window", 1, timeout=-1)
+            with self.assertRaises(ValueError):
+                backend.incr("window")
+            self.assertTrue(backend.add("window", 1))
+
+    def test_cull_expired_keeps_live_entries(self):
+        with TemporaryDirectory() as directory:
+            backend = MsgpackFileBasedCache(directory, {"OPTIONS": {"MAX_ENTRIES": 3, "CULL": "expired"}})
+            backend.set("version:a", 1, timeout=None)
+            backend.set("version:b", 2, timeout=None)
+            backend.set("window", 1, timeout=-1)
+            backend.set("version:c", 3, timeout=None)
+            self.assertFalse(os.path.exists(backend._key_to_file("window")))
+            self.assertTrue(backend.add("counter", 4, timeout=None))
+            self.assertEqual(
+                backend.get_many(["version:a", "version:b", "version:c", "counter"]),
+                {"version:a": 1, "version:b": 2, "version:c": 3, "counter": 4},
+            )
+
+    def test_switching_serializer_keeps_entries(self):
+        with TemporaryDirectory() as directory:
+            MsgpackFileBasedCache(directory, {}).set("export", [{"price": Decimal("1.50")}])
+            backend = MsgpackFileBasedCache(directory, {"OPTIONS": {"SERIALIZER": "pickle"}})
+            self.assertEqual(backend.get("export"), [{"price": Decimal("1.50")}])
+            backend.set("export", [{"price": Decimal("2.50")}])
+            self.assertEqual(MsgpackFileBasedCache(directory, {}).get("export"), [{"price": Decimal("2.50")}])
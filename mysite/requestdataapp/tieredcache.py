@@ -0,0 +1,231 @@
+"""
+Двухуровневый кэш: LRU в памяти процесса (L1) перед общим бэкендом (L2).
+
+LOCATION - alias общего кэша из CACHES. Чтение сначала ищет запись в L1
+(словарь под блокировкой, без обращения к диску), при промахе - в L2
+и кладёт найденное в L1. Запись идёт в L2 и в L1 своего процесса.
+
+Другие процессы про запись не узнают, поэтому срок жизни в L1 ограничен:
+- записи с явным version (версии shopapp.caching) неизменяемы - новая
+  версия даёт новый ключ, их можно держать до L1_VERSIONED_TIMEOUT;
+- остальные живут в L1 не дольше L1_TIMEOUT секунд;
+- ключи по шаблонам L1_BYPASS (сами номера версий, счётчики) всегда
+  читаются из L2 - так смена версии в одном воркере сразу видна во всех.
+
+L1 ограничен числом записей (MAX_ENTRIES) и суммарным размером
+pickle (MAX_SIZE). Попадания и промахи по уровням - в stats() и
+в /metrics (django_cache_tier_requests_total).
+"""
+
+import pickle
+import re
+from collections import OrderedDict
+from fnmatch import translate
+from threading import Lock
+from time import monotonic
+from typing import Dict, Optional, Tuple
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.shared_alias = location
+        self.max_size = options.get("MAX_SIZE", 32 * 1024 * 1024)
+        self.l1_timeout = options.get("L1_TIMEOUT", 5)
+        self.l1_versioned_timeout = options.get("L1_VERSIONED_TIMEOUT", 300)
+        # Один регулярный шаблон на все L1_BYPASS: проверка на каждом get
+        bypass = options.get("L1_BYPASS", ())
+        self.bypass = re.compile("|".join(translate(pattern) for pattern in bypass)) if bypass else None
+        # ключ L1 -> (pickle, срок по monotonic или None)
+        self._entries: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+        self._counts = {"l1_hits": 0, "l1_misses": 0, "l2_hits": 0, "l2_misses": 0, "evictions": 0}
+
+    @property
+    def shared(self) -> BaseCache:
+        return caches[self.shared_alias]
+
+    # L1
+
+    def _bypassed(self, key: str) -> bool:
+        return self.bypass is not None and self.bypass.match(key) is not None
+
+    def _l1_expiry(self, timeout, version) -> Optional[float]:
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+        limit = self.l1_versioned_timeout if version is not None else self.l1_timeout
+        return monotonic() + (limit if timeout is None else min(timeout, limit))
+
+    def _l1_get(self, l1_key: str):
+        with self._lock:
+            entry = self._entries.get(l1_key)
+            if entry is not None and entry[1] is not None and entry[1] <= monotonic():
+                self._l1_discard(l1_key)
+                entry = None
+            if entry is None:
+                self._counts["l1_misses"] += 1
+                return _MISSING
+            self._entries.move_to_end(l1_key)
+            self._counts["l1_hits"] += 1
+        return pickle.loads(entry[0])
+
+    def _l1_set(self, l1_key: str, value, expiry: Optional[float]) -> None:
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            self._l1_discard(l1_key)
+            if len(pickled) > self.max_size:
+                return
+            self._entries[l1_key] = (pickled, expiry)
+            self._size += len(pickled)
+            while len(self._entries) > self._max_entries or self._size > self.max_size:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self._counts["evictions"] += 1
+
+    def _l1_discard(self, l1_key: str) -> None:
+        entry = self._entries.pop(l1_key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+    def _l1_delete(self, key: str, version=None) -> None:
+        with self._lock:
+            self._l1_discard(self.make_key(key, version))
+
+    def _observe(self, tier: str, hit: bool) -> None:
+        metrics.store.inc("django_cache_tier_requests_total", (("tier", tier), ("result", "hit" if hit else "miss")))
+
+    def _fetch_shared(self, key: str, version=None):
+        value = self.shared.get(key, _MISSING, version=version)
+        with self._lock:
+            self._counts["l2_hits" if value is not _MISSING else "l2_misses"] += 1
+        self._observe("l2", value is not _MISSING)
+        return value
+
+    # API кэша
+
+    def get(self, key, default=None, version=None):
+        if self._bypassed(key):
+            return self.shared.get(key, default, version=version)
+        l1_key = self.make_key(key, version)
+        value = self._l1_get(l1_key)
+        self._observe("l1", value is not _MISSING)
+        if value is not _MISSING:
+            return value
+        value = self._fetch_shared(key, version)
+        if value is _MISSING:
+            return default
+        self._l1_set(l1_key, value, self._l1_expiry(DEFAULT_TIMEOUT, version))
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = _MISSING
+            if not self._bypassed(key):
+                value = self._l1_get(self.make_key(key, version))
+                self._observe("l1", value is not _MISSING)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            shared = self.shared.get_many(missing, version=version)
+            for key in missing:
+                if self._bypassed(key):
+                    continue
+                with self._lock:
+                    self._counts["l2_hits" if key in shared else "l2_misses"] += 1
+                self._observe("l2", key in shared)
+                if key in shared:
+                    self._l1_set(self.make_key(key, version), shared[key], self._l1_expiry(DEFAULT_TIMEOUT, version))
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+        self.shared.set(key, value, timeout, version=version)
+        self._store_local(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._store_local(key, value, timeout, version)
+        return failed
+
+    def _store_local(self, key, value, timeout, version) -> None:
+        l1_key = self.make_key(key, version)
+        if self._bypassed(key) or timeout is not None and timeout <= 0:
+            with self._lock:
+                self._l1_discard(l1_key)
+            return
+        self._l1_set(l1_key, value, self._l1_expiry(timeout, version))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+        if self.shared.add(key, value, timeout, version=version):
+            self._store_local(key, value, timeout, version)
+            return True
+        self._l1_delete(key, version)
+        return False
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_delete(key, version)
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._l1_delete(key, version)
+        return self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._l1_delete(key, version)
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if not self._bypassed(key):
+            with self._lock:
+                entry = self._entries.get(self.make_key(key, version))
+            if entry is not None and (entry[1] is None or entry[1] > monotonic()):
+                return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Счётчик меняют все воркеры - значение только из L2
+        self._l1_delete(key, version)
+        return self.shared.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        self._l1_delete(key, version)
+        return self.shared.decr(key, delta, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        self.shared.clear()
+
+    def stats(self) -> Dict[str, dict]:
+        """Попадания по уровням в этом процессе и заполнение L1."""
+        with self._lock:
+            counts = dict(self._counts)
+            entries, size = len(self._entries), self._size
+        result = {}
+        for tier in ("l1", "l2"):
+            hits, misses = counts[f"{tier}_hits"], counts[f"{tier}_misses"]
+            total = hits + misses
+            result[tier] = {"hits": hits, "misses": misses, "hit_ratio": hits / total if total else 0.0}
+        result["l1"].update(entries=entries, size=size, evictions=counts["evictions"])
+        return result
@@ -1,5 +1,11 @@
 from django.urls import path
-from .views import process_get_view, user_form, handle_file_upload
+from .views import (
+    process_get_view,
+    user_form,
+    handle_file_upload,
+    profiling_summary_view,
+    ratelimit_stats_view,
+)
 
 app_name = 'requestdataapp'
 
@@ -7,4 +13,6 @@ urlpatterns = [
     path("get/", process_get_view, name="get-view"),
     path("bio/", user_form, name="user-form"),
     path("upload/", handle_file_upload, name="file-upload"),
+    path("profiling/", profiling_summary_view, name="profiling-summary"),
+    path("ratelimit/", ratelimit_stats_view, name="ratelimit-stats"),
 ]
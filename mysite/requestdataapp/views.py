@@ -1,7 +1,10 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.core.files.storage import FileSystemStorage
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import render
 
+from . import metrics, profiling, ratelimit
 from .forms import UserBioForm, UploadFileForm
 
 
@@ -38,3 +41,25 @@ def handle_file_upload(request: HttpRequest) -> HttpResponse:
         "form": form,
     }
     return render(request, "requestdataapp/file-upload.html", context=context)
+
+
+@staff_member_required
+def profiling_summary_view(request: HttpRequest) -> HttpResponse:
+    return JsonResponse({"routes": profiling.summary()})
+
+
+@staff_member_required
+def ratelimit_stats_view(request: HttpRequest) -> HttpResponse:
+    return JsonResponse({"rejected": ratelimit.get_limiter().rejection_counts()})
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """Метрики всех воркеров для Prometheus; доступ только с METRICS_ALLOWED_IPS."""
+    remote_addr = request.META.get("REMOTE_ADDR")
+    if not remote_addr or remote_addr not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    metrics.store.flush(force=True)
+    return HttpResponse(
+        metrics.render(metrics.collect()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -1,12 +1,14 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.db.models import QuerySet
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render, redirect
 from django.urls import path
 from .admin_mixins import ExportAsCSVMixin
-from .common import save_csv_products, save_csv_orders
+from .caching import PRODUCTS, ORDERS, invalidate, product_list_cache
+from .common import save_csv_products, save_csv_orders, recalculate_order_totals
 from .forms import CSVImportForm
 from .models import Product, Order, ProductImage
+from .search import fts_enabled, search_products
 
 
 class OrderInline(admin.TabularInline):
@@ -20,11 +22,15 @@ class ProductInline(admin.StackedInline):
 @admin.action(description="Archive products")
 def mark_archived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
     queryset.update(archived=True)
+    invalidate(PRODUCTS)
+    product_list_cache.purge()
 
 
 @admin.action(description="Unarchive products")
 def mark_unarchived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
     queryset.update(archived=False)
+    invalidate(PRODUCTS)
+    product_list_cache.purge()
 
 
 @admin.register(Product)
@@ -62,6 +68,17 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
         }),
     ]
 
+    def get_search_results(self, request, queryset, search_term):
+        if search_term and fts_enabled(queryset.db):
+            return search_products(queryset, search_term), False
+        return super().get_search_results(request, queryset, search_term)
+
+    def save_related(self, request, form, formsets, change):
+        # Инлайн OrderInline пишет в связующую таблицу без m2m_changed
+        super().save_related(request, form, formsets, change)
+        recalculate_order_totals(Order.objects.filter(products=form.instance))
+        invalidate(ORDERS)
+
     def description_short(self, obj: Product) -> str:
         if len(obj.description) < 48:
             return obj.description
@@ -81,12 +98,16 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
             }
             return render(request, "admin/csv_form.html", context, status=400)
 
-        save_csv_products(
+        summary = save_csv_products(
             file=form.files["csv_file"].file,
             encoding=request.encoding,
         )
 
-        self.message_user(request, "Data from CSV was imported")
+        self.message_user(
+            request,
+            f"Data from CSV was imported: {summary.inserted} added, "
+            f"{summary.updated} updated, {summary.rejected} rejected",
+        )
         return redirect("..")
 
     def get_urls(self):
@@ -106,16 +127,23 @@ class ProductInline(admin.StackedInline):
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(admin.ModelAdmin, ExportAsCSVMixin):
+    actions = [
+        "export_csv",
+    ]
     inlines = [
         ProductInline,
     ]
-    list_display = "delivery_address", "promocode", "created_at", "user_verbose"
+    list_display = "delivery_address", "promocode", "created_at", "user_verbose", "items_count", "total_price"
     change_list_template = "shopapp/orders_changelist.html"
 
     def get_queryset(self, request):
         return Order.objects.select_related("user").prefetch_related("products")
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        recalculate_order_totals(Order.objects.filter(pk=form.instance.pk))
+
     def user_verbose(self, obj: Order) -> str:
         return obj.user.first_name or obj.user.username
 
@@ -133,12 +161,25 @@ class OrderAdmin(admin.ModelAdmin):
             }
             return render(request, "admin/csv_form.html", context, status=400)
 
-        save_csv_orders(
+        summary = save_csv_orders(
             file=form.files["csv_file"].file,
             encoding=request.encoding,
         )
 
-        self.message_user(request, "Data from CSV was imported")
+        self.message_user(
+            request,
+            f"Data from CSV was imported: {summary.inserted} added, "
+            f"{summary.rejected} rejected",
+        )
+        if summary.unknown_users or summary.unknown_products:
+            self.message_user(
+                request,
+                "Unknown users: {users}; unknown products: {products}".format(
+                    users=", ".join(sorted(summary.unknown_users)) or "-",
+                    products=", ".join(sorted(summary.unknown_products)) or "-",
+                ),
+                level=messages.WARNING,
+            )
         return redirect("..")
 
     def get_urls(self):
@@ -1,24 +1,29 @@
-import csv
 from django.db.models import QuerySet
 from django.db.models.options import Options
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, StreamingHttpResponse
+
+from .common import CSV_CHUNK_SIZE, stream_csv_rows
 
 
 class ExportAsCSVMixin:
     def export_csv(self, request: HttpRequest, queryset: QuerySet):
         meta: Options = self.model._meta
         field_names = [field.name for field in meta.fields]
-
-        response = HttpResponse(content_type="text/csv")
+        # ForeignKey выгружается как str(объект), связанные строки - тем же запросом
+        relations = [field.name for field in meta.fields if field.is_relation]
+
+        objects = (
+            queryset
+            .select_related(*relations)
+            .prefetch_related(None)
+            .iterator(chunk_size=CSV_CHUNK_SIZE)
+        )
+        rows = ([getattr(obj, name) for name in field_names] for obj in objects)
+        response = StreamingHttpResponse(
+            stream_csv_rows(field_names, rows),
+            content_type="text/csv",
+        )
         response["Content-Disposition"] = f"attachment; filename={meta}-export.csv"
-
-        csv_writer = csv.writer(response)
-
-        csv_writer.writerow(field_names)
-
-        for object in queryset:
-            csv_writer.writerow([getattr(object, field) for field in field_names])
-
         return response
 
     export_csv.short_description = "Export as CSV"
@@ -0,0 +1,194 @@
+"""
+Бенчмарк всех маршрутов shopapp: число SQL-запросов и время ответа.
+
+Данные генерируются детерминированно (seed_benchmark_data), каждый
+маршрут из shopapp.urls запрашивается несколько раз под суперпользователем
+с отключённым кэшем, итог сравнивается с сохранённой базовой линией
+(benchmark-baseline.json). Запускается командой bench_shop_urls, а
+тест ShopRoutesBenchmarkTestCase проверяет, что число запросов
+не растёт вместе с объёмом данных.
+
+В базовой линии масштабы 1000 и 10000. На 100000 HTML-списки без
+пагинации (orders_list) рендерят все строки, и один запрос идёт
+больше получаса - этот масштаб не записывается, пока их не разобьют
+на страницы.
+"""
+
+import json
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List, Optional
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+
+from . import urls as shop_urls
+from .datagen import DataSpec, generate_data
+from .models import DailyProductSales, DailyUserSales
+from .rollups import refresh_sales_rollups
+
+BASELINE_PATH = Path(__file__).resolve().parent / "benchmark-baseline.json"
+
+# url name -> функция, которая по контексту сидирования даёт kwargs для reverse
+ROUTES: Dict[str, Callable[[dict], dict]] = {
+    "index": lambda ctx: {},
+    "api-root": lambda ctx: {},
+    "product-list": lambda ctx: {},
+    "product-detail": lambda ctx: {"pk": ctx["product"]},
+    "product-download-csv": lambda ctx: {},
+    "product-fuzzy-search": lambda ctx: {},
+    "product-cache-stats": lambda ctx: {},
+    "order-list": lambda ctx: {},
+    "order-detail": lambda ctx: {"pk": ctx["order"]},
+    "dailyproductsales-list": lambda ctx: {},
+    "dailyproductsales-detail": lambda ctx: {"pk": ctx["daily_product_sales"]},
+    "dailyusersales-list": lambda ctx: {},
+    "dailyusersales-detail": lambda ctx: {"pk": ctx["daily_user_sales"]},
+    "groups_list": lambda ctx: {},
+    "products_list": lambda ctx: {},
+    "product_create": lambda ctx: {},
+    "products-export": lambda ctx: {},
+    "product_details": lambda ctx: {"pk": ctx["product"]},
+    "product_update": lambda ctx: {"pk": ctx["product"]},
+    "product_delete": lambda ctx: {"pk": ctx["product"]},
+    "products-feed": lambda ctx: {},
+    "orders_list": lambda ctx: {},
+    "order_create": lambda ctx: {},
+    "orders-export": lambda ctx: {},
+    "order_details": lambda ctx: {"pk": ctx["order"]},
+    "order_update": lambda ctx: {"pk": ctx["order"]},
+    "order_delete": lambda ctx: {"pk": ctx["order"]},
+    "user-order": lambda ctx: {"user_id": ctx["user"]},
+    "user-order-export": lambda ctx: {"user_id": ctx["user"]},
+}
+
+QUERY_STRINGS = {
+    "product-fuzzy-search": "?q=laptp",
+}
+
+SKIPPED_ROUTES = {
+    "product-upload-csv": "POST only",
+}
+
+
+def iter_route_names(patterns=None) -> Iterator[str]:
+    for pattern in patterns if patterns is not None else shop_urls.urlpatterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_route_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name
+
+
+def seed_benchmark_data(scale: int, seed: int = 0) -> dict:
+    """
+    Добавить scale товаров и scale заказов через shopapp.datagen.
+
+    Пользователей - scale // 10, но не меньше одного.
+    """
+    created = generate_data(DataSpec(
+        users=max(scale // 10, 1),
+        products=scale,
+        orders=scale,
+        seed=seed,
+    ))
+    refresh_sales_rollups(full=True)
+    return {
+        "user": created["users"][0],
+        "product": created["products"][0],
+        "order": created["orders"][0],
+        "daily_product_sales": DailyProductSales.objects.values_list("pk", flat=True).first(),
+        "daily_user_sales": DailyUserSales.objects.values_list("pk", flat=True).first(),
+    }
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def fetch(client: Client, url: str) -> HttpResponse:
+    response = client.get(url)
+    if response.streaming:
+        b"".join(response.streaming_content)
+    return response
+
+
+def measure(client: Client, url: str, repeat: int) -> dict:
+    # Прогрев не считается: кэш ContentType, сборка индекса нечёткого поиска
+    fetch(client, url)
+    timings = []
+    queries = []
+    status = None
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as ctx:
+            started = perf_counter()
+            response = fetch(client, url)
+            timings.append((perf_counter() - started) * 1000)
+        queries.append(len(ctx.captured_queries))
+        status = response.status_code
+    return {
+        "status": status,
+        # Максимум по повторам: после прогрева лишний запрос в любом из них - регрессия
+        "queries": max(queries),
+        "p50_ms": round(percentile(timings, 0.5), 2),
+        "p95_ms": round(percentile(timings, 0.95), 2),
+        "max_ms": round(max(timings), 2),
+    }
+
+
+def run_benchmarks(ctx: dict, repeat: int = 10, client: Optional[Client] = None) -> Dict[str, dict]:
+    if client is None:
+        client = Client()
+        admin, _ = User.objects.get_or_create(
+            username="bench-admin",
+            defaults={"is_staff": True, "is_superuser": True},
+        )
+        client.force_login(admin)
+    results = {}
+    for name, make_kwargs in ROUTES.items():
+        url = reverse(f"shopapp:{name}", kwargs=make_kwargs(ctx)) + QUERY_STRINGS.get(name, "")
+        results[name] = measure(client, url, repeat)
+    return results
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> dict:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_baseline(baseline: dict, path: Path = BASELINE_PATH) -> None:
+    path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+
+
+def find_regressions(results: Dict[str, dict], baseline: Dict[str, dict],
+                     time_tolerance: float = 0.5, min_time_delta_ms: float = 5.0) -> List[str]:
+    """
+    Сравнить с базовой линией одного масштаба.
+
+    Число запросов не должно расти вообще, p95 - не больше чем на
+    time_tolerance (доля) и min_time_delta_ms сверх базовой.
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result["queries"] > expected["queries"]:
+            regressions.append(
+                f"{name}: {result['queries']} queries, baseline {expected['queries']}"
+            )
+        limit = max(
+            expected["p95_ms"] * (1 + time_tolerance),
+            expected["p95_ms"] + min_time_delta_ms,
+        )
+        if result["p95_ms"] > limit:
+            regressions.append(
+                f"{name}: p95 {result['p95_ms']} ms, baseline {expected['p95_ms']} ms"
+            )
+    return regressions
@@ -0,0 +1,203 @@
+"""
+Версионирование кэша интернет-магазина.
+
+Для каждой группы данных (товары, заказы) в кэше хранится номер версии -
+время последней записи в наносекундах. Версия передаётся в cache.get/set
+как version=..., поэтому после изменения данных старые записи просто
+перестают находиться, и кэш можно держать часами без риска отдать
+устаревшие данные. Номера версий хранятся в CACHES[STATE_CACHE], сами
+данные - в cache. Версии меняют сигналы из shopapp.signals и массовые
+операции, которые сигналов не вызывают.
+
+Реплика может отставать от новой версии: если её копировали до смены
+версии, при промахе запрос дочитывает данные из основной базы
+(read_from_primary_if_stale) - иначе старые данные попали бы в кэш
+под новой версией.
+"""
+
+from hashlib import md5
+from time import time_ns
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.utils.connection import ConnectionProxy
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from requestdataapp.metrics import observe_cache
+from requestdataapp.replicas import read_from_primary_if_stale
+
+PRODUCTS = "products"
+PRODUCTS_LIST = "products_list"
+ORDERS = "orders"
+
+VERSION_KEY = "shopapp:version:{namespace}"
+
+# Версии и счётчики меняют все воркеры: отдельный алиас без L1 и случайного вытеснения
+state_cache = ConnectionProxy(caches, settings.STATE_CACHE)
+
+
+def get_version(namespace: str) -> int:
+    key = VERSION_KEY.format(namespace=namespace)
+    version = state_cache.get(key)
+    if version is None:
+        # Без кэша (DummyCache) add ничего не сохраняет - версия каждый раз новая
+        version = time_ns()
+        if not state_cache.add(key, version, timeout=None):
+            version = state_cache.get(key, version)
+    return version
+
+
+def get_versions(*namespaces: str) -> List[int]:
+    """Версии нескольких групп за одно обращение к кэшу."""
+    keys = [VERSION_KEY.format(namespace=namespace) for namespace in namespaces]
+    found = state_cache.get_many(keys)
+    return [
+        found[key] if key in found else get_version(namespace)
+        for key, namespace in zip(keys, namespaces)
+    ]
+
+
+def bump_version(*namespaces: str) -> None:
+    for namespace in namespaces:
+        key = VERSION_KEY.format(namespace=namespace)
+        current = state_cache.get(key) or 0
+        state_cache.set(key, max(time_ns(), current + 1), timeout=None)
+
+
+def invalidate(*namespaces: str) -> None:
+    """
+    Сменить версии после коммита текущей транзакции.
+
+    Если сменить раньше, параллельный запрос может успеть закэшировать
+    ещё не изменённые данные уже под новой версией.
+    """
+    transaction.on_commit(lambda: bump_version(*namespaces))
+
+
+def incr_counter(key: str) -> None:
+    try:
+        state_cache.incr(key)
+    except ValueError:
+        if not state_cache.add(key, 1, timeout=None):
+            state_cache.incr(key)
+
+
+class ListResponseCache:
+    """
+    Кэш данных ответа list() для ViewSet с каноническим ключом.
+
+    Ключ строится только из известных параметров запроса: они сортируются,
+    из повторов берётся последнее значение, пустые значения и page=1
+    выбрасываются, поисковая строка приводится к нижнему регистру. Так ?ordering=price&search=Phone и
+    ?search=phone&ordering=price&utm=x попадают в одну запись.
+    Записи версионируются по namespace, purge() сбрасывает только их.
+    """
+
+    def __init__(self, name: str, namespace: str, timeout: int = 60 * 60):
+        self.name = name
+        self.namespace = namespace
+        self.timeout = timeout
+
+    def canonical_params(self, request: Request, params: Iterable[str]) -> str:
+        query = request.query_params
+        parts = []
+        for param in sorted(set(params)):
+            # DRF и django-filter берут последнее значение параметра
+            value = query.get(param, "").strip()
+            if param == api_settings.SEARCH_PARAM:
+                value = " ".join(value.lower().split())
+            if param == "page" and value == "1":
+                continue
+            if value:
+                parts.append(f"{param}={value}")
+        return "&".join(parts)
+
+    def make_key(self, request: Request, params: Iterable[str]) -> str:
+        canonical = f"{request.get_host()}?{self.canonical_params(request, params)}"
+        digest = md5(canonical.encode(), usedforsecurity=False).hexdigest()
+        return f"shopapp:list:{self.name}:{digest}"
+
+    def get(self, key: str) -> Optional[object]:
+        version = get_version(self.namespace)
+        data = cache.get(key, version=version)
+        incr_counter(f"shopapp:list:{self.name}:{'misses' if data is None else 'hits'}")
+        observe_cache(data is not None)
+        if data is None:
+            read_from_primary_if_stale(version)
+        return data
+
+    def set(self, key: str, data) -> None:
+        cache.set(key, data, self.timeout, version=get_version(self.namespace))
+
+    def purge(self) -> None:
+        invalidate(self.namespace)
+
+    def stats(self) -> dict:
+        prefix = f"shopapp:list:{self.name}"
+        counters = state_cache.get_many([f"{prefix}:hits", f"{prefix}:misses"])
+        hits = counters.get(f"{prefix}:hits", 0)
+        misses = counters.get(f"{prefix}:misses", 0)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / total if total else 0.0,
+        }
+
+
+class CachedListMixin:
+    """
+    Примесь для ViewSet: list() отдаётся из ListResponseCache.
+
+    В кэше лежат данные ответа (response.data), а не отрендеренные байты,
+    поэтому JSON и browsable API используют одну и ту же запись.
+    Запись через сам ViewSet сбрасывает кэш явно; остальные пути
+    (формы, админка, импорт) сбрасывают его через сигналы и invalidate().
+    """
+
+    list_cache: ListResponseCache = None
+
+    def get_list_cache_params(self):
+        filterset_fields = getattr(self, "filterset_fields", [])
+        if isinstance(filterset_fields, dict):
+            filterset_fields = [
+                field if lookup == "exact" else f"{field}__{lookup}"
+                for field, lookups in filterset_fields.items()
+                for lookup in lookups
+            ]
+        return [
+            *filterset_fields,
+            api_settings.SEARCH_PARAM,
+            api_settings.ORDERING_PARAM,
+            "page",
+            "pagination",
+            "cursor",
+        ]
+
+    def list(self, request, *args, **kwargs):
+        key = self.list_cache.make_key(request, self.get_list_cache_params())
+        data = self.list_cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        self.list_cache.set(key, response.data)
+        return response
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.list_cache.purge()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.list_cache.purge()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        self.list_cache.purge()
+
+
+product_list_cache = ListResponseCache("products", PRODUCTS_LIST)
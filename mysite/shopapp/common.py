@@ -1,54 +1,288 @@
-from csv import DictReader
+from csv import DictReader, writer
+from dataclasses import dataclass, field
+from decimal import Decimal
 from io import TextIOWrapper
+from itertools import islice
+from typing import Iterable, Iterator, List, Sequence
 
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, DecimalField, OuterRef, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
 
+from shopapp.caching import PRODUCTS, PRODUCTS_LIST, ORDERS, invalidate
+from shopapp.forms import ProductCSVRowForm
 from shopapp.models import Product, Order
 
+CSV_CHUNK_SIZE = 2000
+IMPORT_CHUNK_SIZE = 500
+IMPORT_MAX_ERRORS = 100
+PRODUCT_IMPORT_FIELDS = list(ProductCSVRowForm.Meta.fields)
+PRODUCT_IMPORT_DEFAULTS = {"description": "", "price": 0, "discount": 0}
+PROMOCODE_MAX_LENGTH = Order._meta.get_field("promocode").max_length
 
-def save_csv_products(file, encoding):
+
+class Echo:
+    """
+    Псевдо-файл для csv.writer: write() просто возвращает строку.
+
+    Нужен, чтобы отдавать CSV построчно через StreamingHttpResponse.
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv_rows(header: Sequence[str], rows: Iterable[Sequence]) -> Iterator[str]:
+    csv_writer = writer(Echo())
+    yield csv_writer.writerow(header)
+    for row in rows:
+        yield csv_writer.writerow(row)
+
+
+def recalculate_order_totals(orders: QuerySet) -> int:
+    """
+    Пересчитать total_price и items_count заказов одним UPDATE.
+
+    Используется там, где точечные сигналы не срабатывают:
+    массовый импорт, инлайны админки, команда recalc_order_totals.
+    Массовая смена цен (Product.objects.filter(...).update(price=...),
+    bulk_update) сигналов не посылает - после неё нужно вызвать
+    recalculate_order_totals(Order.objects.filter(products__in=...)).
+    """
+    items = (
+        Order.products.through.objects
+        .filter(order=OuterRef("pk"))
+        .order_by()
+        .values("order")
+    )
+    return orders.update(
+        total_price=Coalesce(
+            Subquery(items.annotate(total=Sum("product__price")).values("total")),
+            Value(Decimal(0)),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        items_count=Coalesce(
+            Subquery(items.annotate(count=Count("pk")).values("count")),
+            Value(0),
+        ),
+        updated_at=now(),
+    )
+
+
+@dataclass
+class ImportSummary:
+    """Итог импорта CSV: сколько строк добавлено, обновлено и отклонено."""
+
+    inserted: int = 0
+    updated: int = 0
+    rejected: int = 0
+    errors: List[dict] = field(default_factory=list)
+
+    def reject(self, line: int, errors) -> None:
+        self.rejected += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "errors": errors})
+
+    def as_dict(self) -> dict:
+        return {
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "rejected": self.rejected,
+            "errors": self.errors,
+        }
+
+
+def iter_chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _upsert_products_chunk(rows: dict, summary: ImportSummary, update_fields: List[str]) -> None:
+    """
+    Обновляет существующие товары (по name) и создаёт новые.
+
+    Если товаров с одинаковым name несколько, обновляется самый ранний.
+    У существующих меняются только update_fields - колонки из файла.
+    """
+    existing = {}
+    products = Product.objects.filter(name__in=rows.keys()).order_by("-pk")
+    for product in products:
+        existing[product.name] = product
+
+    to_create = []
+    to_update = []
+    for name, data in rows.items():
+        product = existing.get(name)
+        if product is None:
+            to_create.append(Product(**data))
+            continue
+        for key in update_fields:
+            setattr(product, key, data[key])
+        to_update.append(product)
+
+    Product.objects.bulk_create(to_create)
+    if update_fields:
+        Product.objects.bulk_update(to_update, fields=update_fields)
+    if to_update and "price" in update_fields:
+        # bulk_update мимо сигналов: цены в итогах заказов правим сами
+        recalculate_order_totals(
+            Order.objects.filter(products__in=[product.pk for product in to_update])
+        )
+    summary.inserted += len(to_create)
+    summary.updated += len(to_update)
+
+
+def save_csv_products(file, encoding, chunk_size: int = IMPORT_CHUNK_SIZE) -> ImportSummary:
+    """
+    Импорт товаров из CSV порциями по chunk_size строк.
+
+    Каждая строка проверяется ProductCSVRowForm, товары сопоставляются
+    по name: существующие обновляются, новые создаются. Значения по
+    умолчанию (PRODUCT_IMPORT_DEFAULTS) подставляются только новым
+    товарам, у существующих меняются лишь колонки, которые есть в файле.
+    Весь импорт выполняется в одной транзакции, в памяти держится
+    только одна порция.
+    """
     csv_file = TextIOWrapper(
         file, encoding
     )
     reader = DictReader(csv_file)
-
-    products = [
-        Product(**row)
-        for row in reader
+    summary = ImportSummary()
+    update_fields = [
+        key for key in PRODUCT_IMPORT_FIELDS
+        if key != "name" and key in (reader.fieldnames or ())
     ]
-    Product.objects.bulk_create(products)
-    return products
 
+    with transaction.atomic():
+        # Номер строки файла: заголовок - первая строка
+        for chunk in iter_chunks(enumerate(reader, start=2), chunk_size):
+            rows = {}
+            for line, row in chunk:
+                form = ProductCSVRowForm(data={**PRODUCT_IMPORT_DEFAULTS, **row})
+                if not form.is_valid():
+                    summary.reject(line, form.errors.get_json_data())
+                    continue
+                data = {key: form.cleaned_data[key] for key in PRODUCT_IMPORT_FIELDS}
+                # Повтор в той же порции: побеждает последняя строка, товар считается один раз
+                rows[data["name"]] = data
+            _upsert_products_chunk(rows, summary, update_fields)
+        # bulk_create/bulk_update не посылают сигналов
+        invalidate(PRODUCTS, PRODUCTS_LIST, ORDERS)
+    return summary
 
-def save_csv_orders(file, encoding):
-    csv_file = TextIOWrapper(
-        file,
-        encoding
+
+@dataclass
+class OrderImportSummary(ImportSummary):
+    """Итог импорта заказов: ещё и неизвестные пользователи и товары."""
+
+    unknown_users: set = field(default_factory=set)
+    unknown_products: set = field(default_factory=set)
+
+    def as_dict(self) -> dict:
+        return {
+            **super().as_dict(),
+            "unknown_users": sorted(self.unknown_users),
+            "unknown_products": sorted(self.unknown_products),
+        }
+
+
+def _resolve_names(model, field_name: str, names: set, known: dict) -> None:
+    """Дозагружает в known pk объектов с незнакомыми ещё именами."""
+    missing = [name for name in names if name not in known]
+    for start in range(0, len(missing), IMPORT_CHUNK_SIZE):
+        batch = missing[start:start + IMPORT_CHUNK_SIZE]
+        found = dict(
+            model.objects
+            .filter(**{f"{field_name}__in": batch})
+            .order_by("-pk")
+            .values_list(field_name, "pk")
+        )
+        for name in batch:
+            known[name] = found.get(name)
+
+
+def _save_orders_chunk(rows: List[tuple], users: dict, products: dict,
+                       summary: OrderImportSummary) -> None:
+    _resolve_names(User, "username", {row[1] for row in rows}, users)
+    _resolve_names(
+        Product, "name",
+        {name for row in rows for name in row[2]},
+        products,
     )
-    reader = DictReader(csv_file)
 
     orders = []
-    products_names = {product.name: product for product in Product.objects.all()}
-    users_names = {user.username: user for user in User.objects.all()}
+    orders_products = []
+    for line, username, product_names, data in rows:
+        user_id = users[username]
+        if user_id is None:
+            summary.unknown_users.add(username)
+            summary.reject(line, {"user": [f"User {username} not found"]})
+            continue
+        product_ids = []
+        for name in product_names:
+            product_id = products[name]
+            if product_id is None:
+                summary.unknown_products.add(name)
+            elif product_id not in product_ids:
+                product_ids.append(product_id)
+        orders.append(Order(user_id=user_id, **data))
+        orders_products.append(product_ids)
 
-    for row in reader:
-        username = row.pop("user")
-        products_from_file = row.pop("products").split(",")
-        user = users_names.get(username)
+    Order.objects.bulk_create(orders)
+    Through = Order.products.through
+    Through.objects.bulk_create(
+        Through(order_id=order.pk, product_id=product_id)
+        for order, product_ids in zip(orders, orders_products)
+        for product_id in product_ids
+    )
+    recalculate_order_totals(Order.objects.filter(pk__in=[order.pk for order in orders]))
+    summary.inserted += len(orders)
 
-        if not user:
-            print(f"User {username} not found")
-            continue
 
-        order_data = {**row, "user": user}
-        order = Order(**order_data)
-        order.save()
-
-        for name in products_from_file:
-            product = products_names.get(name)
-            if not product:
-                print(f"Product {name} not found")
-                continue
-            order.products.add(product)
-        orders.append(order)
-    return orders
+def save_csv_orders(file, encoding, chunk_size: int = IMPORT_CHUNK_SIZE) -> OrderImportSummary:
+    """
+    Импорт заказов из CSV пакетными INSERT-ами.
+
+    Колонки: delivery_address, promocode, user (username) и products
+    (имена товаров через запятую). Загружаются только упомянутые в файле
+    пользователи и товары. Заказы и строки связующей таблицы вставляются
+    через bulk_create в одной транзакции; строки с неизвестным
+    пользователем отклоняются, неизвестные товары пропускаются,
+    и то и другое попадает в итог.
+    """
+    csv_file = TextIOWrapper(
+        file,
+        encoding
+    )
+    reader = DictReader(csv_file)
+    summary = OrderImportSummary()
+    users = {}
+    products = {}
+
+    with transaction.atomic():
+        for chunk in iter_chunks(enumerate(reader, start=2), chunk_size):
+            rows = []
+            for line, row in chunk:
+                username = (row.get("user") or "").strip()
+                if not username:
+                    summary.reject(line, {"user": ["This field is required."]})
+                    continue
+                product_names = [
+                    name.strip()
+                    for name in (row.get("products") or "").split(",")
+                    if name.strip()
+                ]
+                data = {
+                    "delivery_address": row.get("delivery_address") or "",
+                    "promocode": row.get("promocode") or "",
+                }
+                if len(data["promocode"]) > PROMOCODE_MAX_LENGTH:
+                    summary.reject(line, {"promocode": ["Promocode is too long."]})
+                    continue
+                rows.append((line, username, product_names, data))
+            _save_orders_chunk(rows, users, products, summary)
+        invalidate(ORDERS)
+    return summary
@@ -0,0 +1,52 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для API и экспортов.
+
+Валидаторы считаются по версиям из shopapp.caching, то есть без
+обращения к базе и без сериализации: на If-None-Match или
+If-Modified-Since с неизменившимися данными сразу уходит 304.
+
+Валидаторы от базы не зависят, поэтому запрос с реплики получает те
+же ETag и 304. Если реплику копировали раньше, чем сменилась версия,
+тело ответа читается из основной базы (read_from_primary_if_stale) -
+иначе клиент сохранил бы старый ответ под новым ETag.
+"""
+
+from datetime import datetime, timezone
+from hashlib import md5
+
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from requestdataapp.replicas import read_from_primary_if_stale
+
+from .caching import get_versions
+
+
+def versioned_etag(*namespaces: str):
+    def etag_func(request, *args, **kwargs) -> str:
+        current = get_versions(*namespaces)
+        read_from_primary_if_stale(max(current))
+        versions = ":".join(str(version) for version in current)
+        # Разные страницы, фильтры и форматы ответа - разные представления
+        raw = "|".join([
+            versions,
+            request.get_full_path(),
+            request.META.get("HTTP_ACCEPT", ""),
+        ])
+        return md5(raw.encode(), usedforsecurity=False).hexdigest()
+    return etag_func
+
+
+def versioned_last_modified(*namespaces: str):
+    def last_modified_func(request, *args, **kwargs) -> datetime:
+        version = max(get_versions(*namespaces))
+        return datetime.fromtimestamp(version / 1e9, tz=timezone.utc)
+    return last_modified_func
+
+
+def versioned_condition(*namespaces: str):
+    """Декоратор метода view: ETag и Last-Modified по версиям namespaces."""
+    return method_decorator(condition(
+        etag_func=versioned_etag(*namespaces),
+        last_modified_func=versioned_last_modified(*namespaces),
+    ))
@@ -0,0 +1,352 @@
+"""
+Генератор синтетических данных для нагрузочных тестов.
+
+Создаёт пользователей, товары, заказы с позициями, а также авторов,
+категории, теги и статьи блога. Первичные ключи назначаются заранее
+(max(pk) + 1 и далее подряд), поэтому каждую пачку можно сгенерировать
+независимо: её содержимое зависит только от seed, вида данных и номера
+пачки. Генерация пачек при workers > 1 идёт в пуле процессов, вставка -
+в основном процессе через bulk_create, по порядку. При одинаковых
+параметрах на пустой базе результат всегда одинаковый.
+"""
+
+import random
+from bisect import bisect
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta, timezone
+from decimal import Decimal
+from itertools import accumulate
+from math import ceil, log
+from multiprocessing import Pool
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+
+from blogapp.models import Article, Author, Category, Tag
+
+from .caching import ORDERS, PRODUCTS, PRODUCTS_LIST, invalidate
+from .common import recalculate_order_totals
+from .models import Order, Product
+
+ADJECTIVES = [
+    "Compact", "Classic", "Smart", "Ultra", "Pro", "Mini", "Wireless",
+    "Portable", "Premium", "Eco", "Rugged", "Silent", "Turbo", "Vintage",
+]
+MATERIALS = [
+    "Steel", "Bamboo", "Carbon", "Glass", "Leather", "Ceramic", "Aluminium",
+    "Oak", "Cotton", "Titanium",
+]
+NOUNS = [
+    "Laptop", "Desktop", "Smartphone", "Tablet", "Headphones", "Keyboard",
+    "Monitor", "Camera", "Speaker", "Watch", "Router", "Printer", "Lamp",
+    "Backpack", "Chair", "Kettle",
+]
+WORDS = [
+    "fast", "reliable", "light", "durable", "quiet", "bright", "modern",
+    "simple", "powerful", "elegant", "everyday", "travel", "office", "home",
+    "battery", "screen", "design", "warranty", "storage", "sound", "color",
+    "quality", "comfort", "energy", "signal", "memory", "charge", "shape",
+]
+STREETS = ["Lenina", "Ivanova", "Mira", "Sadovaya", "Pushkina", "Gagarina", "Lesnaya"]
+CITIES = ["Moscow", "Kazan", "Omsk", "Tver", "Samara", "Perm"]
+PROMOCODES = ["SALE5", "SALE10", "promo5", "WELCOME", "BLACKFRIDAY"]
+FIRST_NAMES = ["Ivan", "Anna", "Petr", "Olga", "Sergey", "Maria", "Alexey", "Elena"]
+LAST_NAMES = ["Ivanov", "Petrova", "Sidorov", "Smirnova", "Kuznetsov", "Popova"]
+
+# Порядок важен: заказы ссылаются на пользователей и товары, статьи - на авторов, категории и теги
+KINDS = ["users", "products", "orders", "authors", "categories", "tags", "articles"]
+MODELS = {
+    "users": User,
+    "products": Product,
+    "orders": Order,
+    "authors": Author,
+    "categories": Category,
+    "tags": Tag,
+    "articles": Article,
+}
+LINKS = {
+    "orders": Order.products.through,
+    "articles": Article.tags.through,
+}
+
+
+@dataclass
+class DataSpec:
+    """Сколько и каких данных создать и как распределить значения."""
+
+    users: int = 0
+    products: int = 0
+    orders: int = 0
+    authors: int = 0
+    categories: int = 0
+    tags: int = 0
+    articles: int = 0
+    seed: int = 0
+    batch_size: int = 5000
+    lines_per_order: Tuple[int, int] = (1, 5)
+    tags_per_article: Tuple[int, int] = (0, 3)
+    # zipf - небольшая доля товаров попадает в большинство заказов
+    popularity: str = "zipf"
+    zipf_s: float = 1.1
+    # Цены - логнормальное распределение с медианой price_median
+    price_median: float = 50.0
+    price_sigma: float = 1.0
+    archived_ratio: float = 0.05
+    # Даты создания равномерно в последних days днях до until
+    days: int = 365
+    until: datetime = field(
+        default_factory=lambda: datetime.combine(
+            datetime.now(timezone.utc).date(), time.min, tzinfo=timezone.utc,
+        ),
+    )
+
+
+# pk-диапазоны (или списки уже существующих pk) для ссылок между видами данных
+Pools = Dict[str, Sequence[int]]
+
+_worker_state: dict = {}
+
+
+def _init_worker(spec: DataSpec, pools: Pools) -> None:
+    _worker_state.clear()
+    _worker_state.update(spec=spec, pools=pools)
+
+
+def _rng(spec: DataSpec, kind: str, batch: int) -> random.Random:
+    return random.Random(f"{spec.seed}:{kind}:{batch}")
+
+
+def _moment(rnd: random.Random, spec: DataSpec) -> datetime:
+    return spec.until - timedelta(seconds=rnd.uniform(0, spec.days * 86400))
+
+
+def _words(rnd: random.Random, low: int, high: int) -> str:
+    return " ".join(rnd.choices(WORDS, k=rnd.randint(low, high)))
+
+
+def _product_picker(spec: DataSpec, products: Sequence[int]) -> Callable[[random.Random, int], List[int]]:
+    if spec.popularity == "uniform":
+        return lambda rnd, k: rnd.sample(products, k=min(k, len(products)))
+
+    cum_weights = _worker_state.get("zipf")
+    if cum_weights is None:
+        cum_weights = list(accumulate(1 / (rank ** spec.zipf_s) for rank in range(1, len(products) + 1)))
+        _worker_state["zipf"] = cum_weights
+    total = cum_weights[-1]
+
+    def pick(rnd: random.Random, k: int) -> List[int]:
+        k = min(k, len(products))
+        if k * 2 > len(products):
+            # Почти все товары - взвешенный выбор без повторов тут лишь зациклится
+            return sorted(rnd.sample(products, k=k))
+        picked = set()
+        while len(picked) < k:
+            picked.add(products[bisect(cum_weights, rnd.random() * total)])
+        return sorted(picked)
+    return pick
+
+
+def _batch_range(spec: DataSpec, pools: Pools, kind: str, batch: int) -> range:
+    pks = pools[kind]
+    return pks[batch * spec.batch_size:(batch + 1) * spec.batch_size]
+
+
+def generate_batch(kind: str, batch: int) -> Tuple[list, list]:
+    """
+    Строки одной пачки: (строки модели, строки связей m2m).
+
+    Только кортежи из простых значений - пачка передаётся между процессами.
+    """
+    spec: DataSpec = _worker_state["spec"]
+    pools: Pools = _worker_state["pools"]
+    rnd = _rng(spec, kind, batch)
+    rows, links = [], []
+
+    for pk in _batch_range(spec, pools, kind, batch):
+        if kind == "users":
+            first_name, last_name = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+            rows.append((pk, f"gen_{pk}", first_name, last_name, f"gen_{pk}@example.com", _moment(rnd, spec)))
+        elif kind == "products":
+            price = min(rnd.lognormvariate(log(spec.price_median), spec.price_sigma), 999999.99)
+            rows.append((
+                pk,
+                f"{rnd.choice(ADJECTIVES)} {rnd.choice(MATERIALS)} {rnd.choice(NOUNS)} {pk}",
+                _words(rnd, 8, 30).capitalize(),
+                Decimal(max(price, 0.01)).quantize(Decimal("0.01")),
+                rnd.choice([0, 0, 0, 5, 10, 15, 25]),
+                _moment(rnd, spec),
+                rnd.random() < spec.archived_ratio,
+            ))
+        elif kind == "orders":
+            pick = _worker_state.get("pick")
+            if pick is None:
+                pick = _worker_state["pick"] = _product_picker(spec, pools["products"])
+            rows.append((
+                pk,
+                rnd.choice(pools["users"]),
+                f"{rnd.randint(1, 200)} {rnd.choice(STREETS)} st, {rnd.choice(CITIES)}",
+                rnd.choice(PROMOCODES) if rnd.random() < 0.2 else "",
+                _moment(rnd, spec),
+            ))
+            links.extend((pk, product) for product in pick(rnd, rnd.randint(*spec.lines_per_order)))
+        elif kind == "authors":
+            rows.append((pk, f"{rnd.choice(FIRST_NAMES)} {rnd.choice(LAST_NAMES)}", _words(rnd, 5, 20)))
+        elif kind == "categories":
+            rows.append((pk, f"{rnd.choice(WORDS).capitalize()} {pk}"))
+        elif kind == "tags":
+            rows.append((pk, f"{rnd.choice(WORDS)}{pk}"[:20]))
+        elif kind == "articles":
+            rows.append((
+                pk,
+                _words(rnd, 3, 8).capitalize(),
+                "\n\n".join(_words(rnd, 20, 60).capitalize() for _ in range(rnd.randint(1, 5))),
+                _moment(rnd, spec),
+                rnd.choice(pools["authors"]),
+                rnd.choice(pools["categories"]),
+            ))
+            k = min(rnd.randint(*spec.tags_per_article), len(pools["tags"]))
+            links.extend((pk, tag) for tag in sorted(rnd.sample(pools["tags"], k=k)))
+    return rows, links
+
+
+def _build(kind: str, rows: list) -> list:
+    if kind == "users":
+        return [
+            User(pk=pk, username=username, first_name=first_name, last_name=last_name,
+                 email=email, date_joined=joined, password=UNUSABLE_PASSWORD_PREFIX)
+            for pk, username, first_name, last_name, email, joined in rows
+        ]
+    if kind == "products":
+        return [
+            Product(pk=pk, name=name, description=description, price=price,
+                    discount=discount, created_at=created_at, archived=archived)
+            for pk, name, description, price, discount, created_at, archived in rows
+        ]
+    if kind == "orders":
+        return [
+            Order(pk=pk, user_id=user, delivery_address=address, promocode=promocode, created_at=created_at)
+            for pk, user, address, promocode, created_at in rows
+        ]
+    if kind == "authors":
+        return [Author(pk=pk, name=name, bio=bio) for pk, name, bio in rows]
+    if kind == "categories":
+        return [Category(pk=pk, name=name) for pk, name in rows]
+    if kind == "tags":
+        return [Tag(pk=pk, name=name) for pk, name in rows]
+    return [
+        Article(pk=pk, title=title, content=content, pub_date=pub_date,
+                author_id=author, category_id=category)
+        for pk, title, content, pub_date, author, category in rows
+    ]
+
+
+def _build_links(kind: str, links: list) -> list:
+    if kind == "orders":
+        return [LINKS[kind](order_id=order, product_id=product) for order, product in links]
+    return [LINKS[kind](article_id=article, tag_id=tag) for article, tag in links]
+
+
+@contextmanager
+def explicit_timestamps(model, *names: str) -> Iterator[None]:
+    """Временно отключить auto_now/auto_now_add, чтобы записать свои даты."""
+    fields = [model._meta.get_field(name) for name in names]
+    saved = [(f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, (auto_now, auto_now_add) in zip(fields, saved):
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+def _next_pk(model) -> int:
+    return (model.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+
+
+def plan_pools(spec: DataSpec) -> Pools:
+    """
+    pk будущих объектов; для видов, которые не создаются, - существующие pk.
+
+    Существующие pk нужны, только если на них будут ссылаться.
+    """
+    needed = {
+        "users": spec.orders > 0,
+        "products": spec.orders > 0,
+        "authors": spec.articles > 0,
+        "categories": spec.articles > 0,
+        "tags": spec.articles > 0,
+    }
+    pools: Pools = {}
+    for kind in KINDS:
+        model = MODELS[kind]
+        count = getattr(spec, kind)
+        if count:
+            start = _next_pk(model)
+            pools[kind] = range(start, start + count)
+        elif needed.get(kind):
+            pools[kind] = list(model.objects.order_by("pk").values_list("pk", flat=True))
+        else:
+            pools[kind] = range(0)
+    for kind, required in (("users", "orders"), ("products", "orders"),
+                           ("authors", "articles"), ("categories", "articles")):
+        if getattr(spec, required) and not pools[kind]:
+            raise ValueError(f"Cannot generate {required} without {kind}")
+    return pools
+
+
+def _iter_batches(kind: str, count: int, batch_size: int, pool, window: int) -> Iterator[Tuple[list, list]]:
+    jobs = [(kind, batch) for batch in range(ceil(count / batch_size))]
+    if pool is None:
+        yield from map(_generate_job, jobs)
+        return
+    # Окнами: иначе воркеры обгоняют вставку и все пачки копятся в памяти
+    for start in range(0, len(jobs), window):
+        yield from pool.imap(_generate_job, jobs[start:start + window])
+
+
+def _generate_job(job: Tuple[str, int]) -> Tuple[list, list]:
+    return generate_batch(*job)
+
+
+def generate_data(spec: DataSpec, workers: int = 1,
+                  progress: Optional[Callable[[str, int, int], None]] = None) -> Pools:
+    """
+    Сгенерировать данные по spec и вернуть pk-диапазоны созданных объектов.
+
+    progress(kind, сделано, всего) вызывается после каждой пачки.
+    """
+    pools = plan_pools(spec)
+    pool = Pool(workers, initializer=_init_worker, initargs=(spec, pools)) if workers > 1 else None
+    _init_worker(spec, pools)
+    try:
+        for kind in KINDS:
+            count = getattr(spec, kind)
+            if not count:
+                continue
+            model = MODELS[kind]
+            timestamps = ("created_at",) if kind in ("products", "orders") else ()
+            done = 0
+            for rows, links in _iter_batches(kind, count, spec.batch_size, pool, workers * 2):
+                with transaction.atomic(), explicit_timestamps(model, *timestamps):
+                    model.objects.bulk_create(_build(kind, rows), batch_size=spec.batch_size)
+                    if links:
+                        LINKS[kind].objects.bulk_create(_build_links(kind, links), batch_size=spec.batch_size)
+                    if kind == "orders":
+                        # Позиции вставлены без m2m_changed - итоги считаем сами
+                        recalculate_order_totals(Order.objects.filter(pk__gte=rows[0][0], pk__lte=rows[-1][0]))
+                done += len(rows)
+                if progress is not None:
+                    progress(kind, done, count)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _worker_state.clear()
+
+    invalidate(PRODUCTS, PRODUCTS_LIST, ORDERS)
+    return {kind: pools[kind] for kind in KINDS if getattr(spec, kind)}
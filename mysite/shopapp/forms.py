@@ -23,3 +23,11 @@ class ProductForm(forms.ModelForm):
 
 class CSVImportForm(forms.Form):
     csv_file = forms.FileField()
+
+
+class ProductCSVRowForm(forms.ModelForm):
+    """Проверка одной строки CSV при импорте товаров."""
+
+    class Meta:
+        model = Product
+        fields = "name", "description", "price", "discount"
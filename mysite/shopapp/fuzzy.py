@@ -0,0 +1,149 @@
+"""
+Нечёткий поиск товаров по названию (опечатки) на rapidfuzz.
+
+В памяти процесса держится индекс названий неархивных товаров и
+постинг-листы триграмм. На запрос сначала отбираются кандидаты с
+общими триграммами, затем они оцениваются пачкой через
+rapidfuzz.process.extract. Индекс обновляется по версии товаров из
+shopapp.caching: при её смене подгружаются пары (pk, name) и в
+постингах правятся только изменившиеся товары. Подгрузка - полный
+проход по таблице, поэтому при частых записях она идёт не чаще раза
+в rebuild_interval секунд: до этого поиск работает по прежнему индексу.
+"""
+
+from collections import Counter
+from threading import RLock
+from time import monotonic
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.db import DEFAULT_DB_ALIAS
+from rapidfuzz import fuzz, process
+
+from .caching import PRODUCTS, get_version
+from .models import Product
+
+
+def normalize(value: str) -> str:
+    return " ".join(value.lower().split())
+
+
+def trigrams(value: str) -> Set[str]:
+    padded = f"  {value} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyProductIndex:
+    def __init__(self, max_candidates: int = 2000, refresh_interval: float = 5.0,
+                 common_gram_ratio: float = 0.1, rebuild_interval: float = 30.0):
+        self.max_candidates = max_candidates
+        self.common_gram_ratio = common_gram_ratio
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.names: Dict[int, str] = {}
+        self.postings: Dict[str, Set[int]] = {}
+        self.version: Optional[int] = None
+        self.checked_at = 0.0
+        self.loaded_at: Optional[float] = None
+        self.rebuilding = False
+        self.lock = RLock()
+
+    def _add(self, pk: int, name: str) -> None:
+        self.names[pk] = name
+        for gram in trigrams(name):
+            self.postings.setdefault(gram, set()).add(pk)
+
+    def _remove(self, pk: int) -> None:
+        name = self.names.pop(pk)
+        for gram in trigrams(name):
+            posting = self.postings.get(gram)
+            if posting is None:
+                continue
+            posting.discard(pk)
+            if not posting:
+                del self.postings[gram]
+
+    def refresh(self, force: bool = False) -> None:
+        """
+        Подтянуть изменения, если версия товаров сменилась.
+
+        Версия проверяется не чаще раза в refresh_interval секунд,
+        таблица перечитывается не чаще раза в rebuild_interval. Чтение
+        таблицы идёт без блокировки: поиск в других потоках тем временем
+        работает по прежнему индексу, а не ждёт.
+        """
+        now = monotonic()
+        if not force and now - self.checked_at < self.refresh_interval:
+            return
+        with self.lock:
+            if not force and (self.rebuilding or now - self.checked_at < self.refresh_interval):
+                return
+            self.checked_at = now
+            version = get_version(PRODUCTS)
+            if not force and version == self.version:
+                return
+            if not force and self.loaded_at is not None and now - self.loaded_at < self.rebuild_interval:
+                return
+            self.rebuilding = True
+        try:
+            current = {
+                pk: normalize(name)
+                for pk, name in (
+                    # Реплика может отставать от версии, под которой запомнится индекс
+                    Product.objects.using(DEFAULT_DB_ALIAS)
+                    .filter(archived=False)
+                    .order_by()
+                    .values_list("pk", "name")
+                    .iterator(chunk_size=5000)
+                )
+            }
+            with self.lock:
+                for pk in self.names.keys() - current.keys():
+                    self._remove(pk)
+                for pk, name in current.items():
+                    old_name = self.names.get(pk)
+                    if old_name == name:
+                        continue
+                    if old_name is not None:
+                        self._remove(pk)
+                    self._add(pk, name)
+                self.version = version
+                self.loaded_at = now
+        finally:
+            self.rebuilding = False
+
+    def candidates(self, query: str) -> Dict[int, str]:
+        postings = sorted(
+            (self.postings[gram] for gram in trigrams(query) if gram in self.postings),
+            key=len,
+        )
+        # Слишком частые триграммы почти ничего не отсеивают, а считать
+        # их дольше всего: берём их, только если редких нет совсем
+        common = len(self.names) * self.common_gram_ratio
+        selective = [posting for posting in postings if len(posting) <= common]
+        counts = Counter()
+        for posting in selective or postings[:1]:
+            counts.update(posting)
+        return {
+            pk: self.names[pk]
+            for pk, _ in counts.most_common(self.max_candidates)
+        }
+
+    def search(self, query: str, limit: int = 10, score_cutoff: float = 60) -> List[Tuple[int, float]]:
+        """Список (pk, score) лучших совпадений, score от 0 до 100."""
+        query = normalize(query)
+        if not query:
+            return []
+        self.refresh()
+        with self.lock:
+            choices = self.candidates(query)
+        matches = process.extract(
+            query,
+            choices,
+            scorer=fuzz.WRatio,
+            limit=limit,
+            score_cutoff=score_cutoff,
+        )
+        return [(pk, score) for _, score, pk in matches]
+
+
+product_name_index = FuzzyProductIndex()
@@ -0,0 +1,132 @@
+"""
+Фоновая подготовка уменьшенных копий изображений товаров.
+
+После загрузки preview или картинки товара (ProductCreateView,
+ProductUpdateView) задача уходит в пул потоков: Pillow уменьшает
+изображение до ширин IMAGE_VARIANT_WIDTHS (без увеличения) и сохраняет
+их в WebP рядом с оригиналом (shopapp.models.variant_name). Resize
+и кодирование в Pillow отпускают GIL, поэтому потоков достаточно,
+а запрос не ждёт обработки.
+
+Готовые ширины записываются в Product.preview_variants и
+ProductImage.variants - по ним шаблоны строят srcset, а ProductSerializer
+отдаёт URL. Пока вариантов нет, используется оригинал.
+
+Копии заменённого или удалённого изображения удаляются
+(delete_variants из shopapp.signals), как и копии, которые пул
+досчитал уже после замены файла.
+"""
+
+import logging
+import os
+import posixpath
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage
+from django.db import close_old_connections, connections, transaction
+from PIL import Image, ImageOps
+
+from .caching import PRODUCTS, PRODUCTS_LIST, invalidate
+from .models import Product, ProductImage, variant_name
+
+log = logging.getLogger(__name__)
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def render_variants(storage: Storage, name: str, widths: List[int], quality: int) -> List[int]:
+    """Сохранить WebP-копии name нужных ширин и вернуть их ширины."""
+    with storage.open(name, "rb") as file:
+        with Image.open(file) as original:
+            image = ImageOps.exif_transpose(original)
+            image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+
+    # Меньше самой маленькой ширины - одна перекодированная копия в исходном размере
+    targets = sorted({width for width in widths if width < image.width}) or [min(image.width, min(widths))]
+    done = []
+    for width in targets:
+        height = max(round(image.height * width / image.width), 1)
+        variant = image.resize((width, height), Image.Resampling.LANCZOS) if width != image.width else image
+        buffer = BytesIO()
+        variant.save(buffer, "WEBP", quality=quality, method=4)
+        target = variant_name(name, width)
+        if storage.exists(target):
+            storage.delete(target)
+        storage.save(target, ContentFile(buffer.getvalue()))
+        done.append(width)
+    return done
+
+
+def delete_variants(storage: Storage, name: str) -> None:
+    """Удалить WebP-копии name всех ширин."""
+    directory, filename = posixpath.split(name)
+    try:
+        _, files = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    pattern = re.compile(re.escape(filename) + r"\.w\d+\.webp")
+    for file in files:
+        if pattern.fullmatch(file):
+            storage.delete(posixpath.join(directory, file))
+
+
+def process_image(model, pk: int, field_name: str, variants_field: str, name: str) -> List[int]:
+    storage = model._meta.get_field(field_name).storage
+    widths = render_variants(storage, name, settings.IMAGE_VARIANT_WIDTHS, settings.IMAGE_VARIANT_QUALITY)
+    with transaction.atomic():
+        updated = model.objects.filter(pk=pk, **{field_name: name}).update(**{variants_field: widths})
+        invalidate(PRODUCTS, PRODUCTS_LIST)
+    if not updated:
+        # Файл заменили или строку удалили, пока шла обработка - копии уже не нужны
+        delete_variants(storage, name)
+    return widths
+
+
+def _run_in_worker(*args) -> List[int]:
+    close_old_connections()
+    try:
+        return process_image(*args)
+    except Exception:
+        log.exception("Image variants failed for %s", args)
+        raise
+    finally:
+        # Соединения потока пула: закрыть, а не держать до следующей задачи
+        connections.close_all()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(settings.IMAGE_VARIANT_WORKERS, thread_name_prefix="image-variants")
+    return _executor
+
+
+def _reset_executor() -> None:
+    # Потоки пула не переживают fork: дочернему процессу нужен свой пул
+    global _executor
+    _executor = None
+
+
+os.register_at_fork(after_in_child=_reset_executor)
+
+
+def submit(model, pk: int, field_name: str, variants_field: str, name: str) -> Optional[Future]:
+    args = (model, pk, field_name, variants_field, name)
+    if not settings.IMAGE_VARIANT_WORKERS:
+        process_image(*args)
+        return None
+    return get_executor().submit(_run_in_worker, *args)
+
+
+def schedule_product_images(product: Product, images: List[ProductImage], preview_changed: bool) -> None:
+    """Поставить обработку в пул после коммита: до него файлы и строки могут не появиться."""
+    jobs = [(ProductImage, image.pk, "image", "variants", image.image.name) for image in images]
+    if preview_changed and product.preview:
+        jobs.append((Product, product.pk, "preview", "preview_variants", product.preview.name))
+    for job in jobs:
+        transaction.on_commit(lambda job=job: submit(*job))
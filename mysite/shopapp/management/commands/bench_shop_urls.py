@@ -0,0 +1,99 @@
+from pathlib import Path
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from shopapp.benchmarks import (
+    BASELINE_PATH,
+    find_regressions,
+    load_baseline,
+    run_benchmarks,
+    save_baseline,
+    seed_benchmark_data,
+)
+
+
+class Command(BaseCommand):
+    """
+    Benchmarks every shopapp route on a throwaway SQLite test database
+    """
+
+    help = "Measure query counts and latency of shopapp routes against a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scale",
+            type=int,
+            action="append",
+            help="Products and orders to seed (repeatable, default 1000)",
+        )
+        parser.add_argument("--repeat", type=int, default=10)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+        parser.add_argument(
+            "--update-baseline",
+            action="store_true",
+            help="Store the results as the new baseline instead of comparing",
+        )
+        parser.add_argument(
+            "--time-tolerance",
+            type=float,
+            default=0.5,
+            help="Allowed p95 growth as a fraction of the baseline",
+        )
+
+    def handle(self, *args, **options):
+        scales = options["scale"] or [1000]
+        baseline = load_baseline(options["baseline"])
+        regressions = []
+
+        setup_test_environment()
+        try:
+            for scale in scales:
+                results = self.run_scale(scale, options["repeat"], options["seed"])
+                for name, result in results.items():
+                    self.stdout.write(
+                        f"{scale:>7} {name:<28} {result['status']} "
+                        f"{result['queries']:>3} q  "
+                        f"p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms"
+                    )
+                if options["update_baseline"]:
+                    baseline[str(scale)] = results
+                else:
+                    regressions += [
+                        f"[{scale}] {message}"
+                        for message in find_regressions(
+                            results,
+                            baseline.get(str(scale), {}),
+                            time_tolerance=options["time_tolerance"],
+                        )
+                    ]
+        finally:
+            teardown_test_environment()
+
+        if options["update_baseline"]:
+            save_baseline(baseline, options["baseline"])
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {options['baseline']}"))
+            return
+        if regressions:
+            raise CommandError("Regressions:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions"))
+
+    def run_scale(self, scale: int, repeat: int, seed: int) -> dict:
+        self.stdout.write(f"Seed {scale} products and orders")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            ctx = seed_benchmark_data(scale, seed=seed)
+            # Кэш отключён: меряем сами запросы, а не попадания в кэш
+            with override_settings(CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+                "state": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+            }):
+                return run_benchmarks(ctx, repeat=repeat)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,85 @@
+from datetime import date, datetime, time, timezone
+from time import perf_counter
+
+from django.core.management import BaseCommand, CommandError
+
+from shopapp.datagen import DataSpec, generate_data
+
+
+def int_range(value: str):
+    low, _, high = value.partition(":")
+    return int(low), int(high or low)
+
+
+class Command(BaseCommand):
+    """
+    Generates large deterministic datasets for capacity testing
+    """
+
+    help = "Generate synthetic users, products, orders and blog articles in bulk"
+
+    def add_arguments(self, parser):
+        for kind in ("users", "products", "orders", "authors", "categories", "tags", "articles"):
+            parser.add_argument(f"--{kind}", type=int, default=0)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Processes generating batches; inserts stay in this process",
+        )
+        parser.add_argument("--lines-per-order", type=int_range, default=(1, 5), metavar="MIN:MAX")
+        parser.add_argument("--tags-per-article", type=int_range, default=(0, 3), metavar="MIN:MAX")
+        parser.add_argument("--popularity", choices=["zipf", "uniform"], default="zipf")
+        parser.add_argument("--zipf-s", type=float, default=1.1)
+        parser.add_argument("--price-median", type=float, default=50.0)
+        parser.add_argument("--price-sigma", type=float, default=1.0)
+        parser.add_argument("--archived-ratio", type=float, default=0.05)
+        parser.add_argument("--days", type=int, default=365, help="Spread creation dates over the last N days")
+        parser.add_argument(
+            "--until",
+            type=date.fromisoformat,
+            help="Last day of the date spread (default today); fix it to reproduce a dataset later",
+        )
+
+    def handle(self, *args, **options):
+        spec = DataSpec(
+            users=options["users"],
+            products=options["products"],
+            orders=options["orders"],
+            authors=options["authors"],
+            categories=options["categories"],
+            tags=options["tags"],
+            articles=options["articles"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+            lines_per_order=options["lines_per_order"],
+            tags_per_article=options["tags_per_article"],
+            popularity=options["popularity"],
+            zipf_s=options["zipf_s"],
+            price_median=options["price_median"],
+            price_sigma=options["price_sigma"],
+            archived_ratio=options["archived_ratio"],
+            days=options["days"],
+        )
+        if options["until"]:
+            spec.until = datetime.combine(options["until"], time.min, tzinfo=timezone.utc)
+
+        self.stdout.write(f"Generate data with seed {spec.seed}")
+        started = perf_counter()
+
+        def progress(kind: str, done: int, total: int):
+            self.stdout.write(f"{kind}: {done}/{total}")
+
+        try:
+            created = generate_data(spec, workers=options["workers"], progress=progress)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        for kind, pks in created.items():
+            self.stdout.write(f"Created {kind}: pk {pks[0]}..{pks[-1]}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Data generated in {perf_counter() - started:.1f}s; "
+            f"run refresh_sales_rollups to update the sales rollups"
+        ))
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management import BaseCommand
+
+from shopapp.images import process_image
+from shopapp.models import Product, ProductImage
+
+
+class Command(BaseCommand):
+    """
+    Backfills WebP variants for product previews and images uploaded before the pipeline existed
+    """
+
+    help = "Generate missing (or, with --force, all) resized WebP variants of product images"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--force", action="store_true", help="Regenerate images that already have variants")
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(preview="").exclude(preview__isnull=True)
+        images = ProductImage.objects.all()
+        if not options["force"]:
+            products = products.filter(preview_variants=[])
+            images = images.filter(variants=[])
+        jobs = [
+            (Product, pk, "preview", "preview_variants", name)
+            for pk, name in products.values_list("pk", "preview")
+        ] + [
+            (ProductImage, pk, "image", "variants", name)
+            for pk, name in images.values_list("pk", "image")
+        ]
+
+        failed = 0
+        with ThreadPoolExecutor(options["workers"]) as executor:
+            futures = {executor.submit(process_image, *job): job for job in jobs}
+            for future in as_completed(futures):
+                model, pk, _, _, name = futures[future]
+                try:
+                    widths = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} {pk} ({name}): {exc}")
+                else:
+                    self.stdout.write(f"{model.__name__} {pk}: {', '.join(map(str, widths))}")
+        self.stdout.write(f"Processed {len(jobs) - failed} of {len(jobs)} images")
@@ -0,0 +1,42 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from shopapp.caching import ORDERS, invalidate
+from shopapp.common import recalculate_order_totals
+from shopapp.models import Order
+
+
+class Command(BaseCommand):
+    """
+    Recalculates denormalized Order.total_price and Order.items_count
+    """
+
+    help = "Recalculate order totals from order products in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        self.stdout.write("Recalculate order totals")
+
+        last_pk = 0
+        updated = 0
+        while True:
+            pks = list(
+                Order.objects
+                .filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            with transaction.atomic():
+                updated += recalculate_order_totals(
+                    Order.objects.filter(pk__gte=pks[0], pk__lte=pks[-1])
+                )
+            last_pk = pks[-1]
+            self.stdout.write(f"Recalculated {updated} orders")
+
+        invalidate(ORDERS)
+        self.stdout.write(self.style.SUCCESS(f"Order totals recalculated: {updated}"))
@@ -0,0 +1,25 @@
+from django.core.management import BaseCommand
+
+from shopapp.rollups import refresh_sales_rollups
+
+
+class Command(BaseCommand):
+    """
+    Refreshes daily sales rollups for days touched since the last run
+    """
+
+    help = "Refresh daily product/user sales rollups incrementally"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Rebuild every day instead of the days changed since the watermark",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("Refresh sales rollups")
+        days = refresh_sales_rollups(full=options["full"])
+        if days:
+            self.stdout.write(f"Days refreshed: {days[0]} .. {days[-1]} ({len(days)})")
+        self.stdout.write(self.style.SUCCESS("Sales rollups refreshed"))
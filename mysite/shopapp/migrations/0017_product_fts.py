@@ -0,0 +1,60 @@
+from django.db import migrations
+
+FTS_TABLE = "shopapp_product_fts"
+PRODUCT_TABLE = "shopapp_product"
+
+
+def fts5_available(schema_editor) -> bool:
+    if schema_editor.connection.vendor != "sqlite":
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_product_fts(apps, schema_editor):
+    if not fts5_available(schema_editor):
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        f"name, description, content='{PRODUCT_TABLE}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {PRODUCT_TABLE} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, name, description) "
+        f"VALUES (new.id, new.name, new.description); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {PRODUCT_TABLE} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) "
+        f"VALUES ('delete', old.id, old.name, old.description); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF name, description "
+        f"ON {PRODUCT_TABLE} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description) "
+        f"VALUES ('delete', old.id, old.name, old.description); "
+        f"INSERT INTO {FTS_TABLE}(rowid, name, description) "
+        f"VALUES (new.id, new.name, new.description); END"
+    )
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_product_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for suffix in ("ai", "ad", "au"):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0016_alter_product_description_alter_product_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_product_fts, drop_product_fts),
+    ]
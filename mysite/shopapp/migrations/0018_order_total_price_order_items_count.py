@@ -0,0 +1,47 @@
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_order_totals(apps, schema_editor):
+    Order = apps.get_model("shopapp", "Order")
+    items = (
+        Order.products.through.objects
+        .filter(order=OuterRef("pk"))
+        .order_by()
+        .values("order")
+    )
+    Order.objects.update(
+        total_price=Coalesce(
+            Subquery(items.annotate(total=Sum("product__price")).values("total")),
+            Value(Decimal(0)),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+        items_count=Coalesce(
+            Subquery(items.annotate(count=Count("pk")).values("count")),
+            Value(0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0017_product_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='items_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(fill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.1.7 on 2026-10-18 02:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('shopapp', '0018_order_total_price_order_items_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SalesRollupDirtyDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='DailyUserSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('orders_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-day', 'user'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('orders_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='shopapp.product')),
+            ],
+            options={
+                'ordering': ['-day', 'product'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyusersales',
+            constraint=models.UniqueConstraint(fields=('day', 'user'), name='uniq_daily_user_sales'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyproductsales',
+            constraint=models.UniqueConstraint(fields=('day', 'product'), name='uniq_daily_product_sales'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.1.7 on 2026-10-18 02:55
+
+from django.db import migrations, models
+
+
+def restore_fts_triggers(apps, schema_editor):
+    # AlterField на SQLite пересоздаёт shopapp_product вместе с триггерами FTS
+    from shopapp.search import ensure_fts_triggers
+
+    ensure_fts_triggers(schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0019_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='description',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='name',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'price'], name='product_name_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('archived', False)), fields=['-created_at'], name='product_active_created_idx'),
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+    ]
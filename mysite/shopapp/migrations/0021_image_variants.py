@@ -0,0 +1,23 @@
+# Generated by Django 4.1.7 on 2026-10-18 03:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0020_product_order_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='preview_variants',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
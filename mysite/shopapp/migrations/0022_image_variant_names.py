@@ -0,0 +1,34 @@
+import os
+
+from django.db import migrations
+
+
+def drop_old_variants(apps, schema_editor):
+    """
+    Копии назывались без расширения оригинала (photo.w320.webp) и у
+    photo.jpg и photo.png совпадали. Старые файлы удаляются, списки ширин
+    сбрасываются - шаблоны отдают оригинал, пока generate_image_variants
+    не создаст копии с новыми именами.
+    """
+    for model_name, field_name, variants_field in (
+        ("Product", "preview", "preview_variants"),
+        ("ProductImage", "image", "variants"),
+    ):
+        model = apps.get_model("shopapp", model_name)
+        storage = model._meta.get_field(field_name).storage
+        rows = model.objects.exclude(**{variants_field: []}).values_list(field_name, variants_field)
+        for name, widths in rows.iterator():
+            for width in widths:
+                storage.delete(f"{os.path.splitext(name)[0]}.w{width}.webp")
+        model.objects.update(**{variants_field: []})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0021_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_old_variants, migrations.RunPython.noop),
+    ]
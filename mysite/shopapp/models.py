@@ -1,3 +1,5 @@
+from typing import List
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils.translation import gettext_lazy as _
@@ -11,7 +13,30 @@ def product_preview_directory_path(instance: "Product", filename: str):
     )
 
 
-class Product(models.Model):
+def variant_name(name: str, width: int) -> str:
+    """
+    Имя уменьшенной копии изображения в WebP (shopapp.images) рядом с оригиналом.
+
+    Расширение оригинала остаётся в имени: у photo.jpg и photo.png
+    в одном каталоге копии разные.
+    """
+    return f"{name}.w{width}.webp"
+
+
+class ImageVariantsMixin:
+    """URL вариантов изображения для шаблонов и API: variants - список готовых ширин."""
+
+    def build_variant_urls(self, field: models.ImageField, widths: List[int]) -> List[dict]:
+        return [
+            {"width": width, "url": field.storage.url(variant_name(field.name, width))}
+            for width in sorted(widths)
+        ] if field else []
+
+    def build_srcset(self, field: models.ImageField, widths: List[int]) -> str:
+        return ", ".join(f"{variant['url']} {variant['width']}w" for variant in self.build_variant_urls(field, widths))
+
+
+class Product(ImageVariantsMixin, models.Model):
     """
     Модель Product представляет товар, который можно продавать в интернет-магазине.
 
@@ -22,14 +47,27 @@ class Product(models.Model):
         verbose_name = _("Product")
         verbose_name_plural = _("Products")
         # db_table = "tech_products"
-
-    name = models.CharField(max_length=100, db_index=True)
-    description = models.TextField(null=False, blank=True, db_index=True)
+        indexes = [
+            # Сортировка по умолчанию (Meta.ordering) и keyset-пагинация API
+            models.Index(fields=["name", "price"], name="product_name_price_idx"),
+            # Неархивные товары от новых к старым: LatestProductsFeed, ShopSiteMap
+            models.Index(
+                fields=["-created_at"],
+                condition=models.Q(archived=False),
+                name="product_active_created_idx",
+            ),
+        ]
+
+    name = models.CharField(max_length=100)
+    # Поиск по описанию идёт через FTS5 (shopapp.search), B-tree на TextField не нужен
+    description = models.TextField(null=False, blank=True)
     price = models.DecimalField(default=0, max_digits=8, decimal_places=2)
     discount = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     archived = models.BooleanField(default=False)
     preview = models.ImageField(null=True, blank=True, upload_to=product_preview_directory_path)
+    # Ширины готовых вариантов preview, заполняет фоновая обработка (shopapp.images)
+    preview_variants = models.JSONField(default=list, blank=True, editable=False)
 
     # @property
     # def description_short(self) -> str:
@@ -43,6 +81,14 @@ class Product(models.Model):
     def get_absolute_url(self):
         return reverse("shopapp:product_details", kwargs={"pk": self.pk})
 
+    @property
+    def preview_variant_urls(self) -> List[dict]:
+        return self.build_variant_urls(self.preview, self.preview_variants)
+
+    @property
+    def preview_srcset(self) -> str:
+        return self.build_srcset(self.preview, self.preview_variants)
+
 
 def product_images_directory_path(instance: "ProductImage", filename: str) -> str:
     return "products/product_{pk}/images/{filename}".format(
@@ -51,20 +97,82 @@ def product_images_directory_path(instance: "ProductImage", filename: str) -> st
     )
 
 
-class ProductImage(models.Model):
+class ProductImage(ImageVariantsMixin, models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="images")
     image = models.ImageField(upload_to=product_images_directory_path)
     description = models.CharField(max_length=200, null=False, blank=True)
+    variants = models.JSONField(default=list, blank=True, editable=False)
+
+    @property
+    def image_variant_urls(self) -> List[dict]:
+        return self.build_variant_urls(self.image, self.variants)
+
+    @property
+    def image_srcset(self) -> str:
+        return self.build_srcset(self.image, self.variants)
 
 
 class Order(models.Model):
     class Meta:
         verbose_name = _("Order")
         verbose_name_plural = _("Orders")
+        indexes = [
+            # Курсорная пагинация (-created_at, -pk) и диапазоны дней в сводках
+            models.Index(fields=["created_at"], name="order_created_idx"),
+        ]
 
     delivery_address = models.TextField(null=False, blank=True)
     promocode = models.CharField(max_length=20, null=False, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Меняется и при правке состава заказа (см. shopapp.signals), по нему
+    # refresh_sales_rollups находит затронутые дни
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     user = models.ForeignKey(User, on_delete=models.PROTECT)
     products = models.ManyToManyField(Product, related_name="orders")
     receipt = models.FileField(null=True, upload_to='orders/receipts')
+    # Денормализованные итоги по products, их поддерживают сигналы
+    # (shopapp.signals) и команда recalc_order_totals
+    total_price = models.DecimalField(default=0, max_digits=12, decimal_places=2)
+    items_count = models.PositiveIntegerField(default=0)
+
+
+class DailyProductSales(models.Model):
+    """
+    Сводка продаж товара за день (UTC): сколько заказов и на какую сумму.
+
+    Заполняется командой refresh_sales_rollups, напрямую не редактируется.
+    """
+    class Meta:
+        ordering = ["-day", "product"]
+        constraints = [
+            models.UniqueConstraint(fields=["day", "product"], name="uniq_daily_product_sales"),
+        ]
+
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="daily_sales")
+    orders_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(default=0, max_digits=14, decimal_places=2)
+
+
+class DailyUserSales(models.Model):
+    """Сводка заказов пользователя за день (UTC), см. DailyProductSales."""
+    class Meta:
+        ordering = ["-day", "user"]
+        constraints = [
+            models.UniqueConstraint(fields=["day", "user"], name="uniq_daily_user_sales"),
+        ]
+
+    day = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="daily_sales")
+    orders_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(default=0, max_digits=14, decimal_places=2)
+
+
+class SalesRollupDirtyDay(models.Model):
+    """День, который нужно пересчитать: удалённые заказы по updated_at не найти."""
+    day = models.DateField(unique=True)
+
+
+class RollupWatermark(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
@@ -0,0 +1,80 @@
+"""
+Классы пагинации для API интернет-магазина.
+
+Курсорная (keyset) пагинация не делает ни OFFSET, ни COUNT(*),
+поэтому глубокие страницы отдаются так же быстро, как первая.
+"""
+
+from rest_framework.pagination import CursorPagination
+
+from .models import Product
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Курсорная пагинация с учётом OrderingFilter.
+
+    Если клиент передал ?ordering=..., используется его сортировка,
+    иначе - ordering этого класса. В конец всегда добавляется pk,
+    чтобы порядок был однозначным.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for filter_cls in getattr(view, "filter_backends", []):
+            if hasattr(filter_cls, "get_ordering"):
+                ordering = filter_cls().get_ordering(request, queryset, view)
+                break
+
+        if not ordering:
+            ordering = self.ordering
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        ordering = tuple(ordering)
+
+        if not any(field.lstrip("-") in ("pk", "id") for field in ordering):
+            direction = "-" if ordering[0].startswith("-") else ""
+            ordering += (f"{direction}pk",)
+        return ordering
+
+
+class ProductCursorPagination(KeysetPagination):
+    ordering = (*Product._meta.ordering, "pk")
+
+
+class OrderCursorPagination(KeysetPagination):
+    ordering = ("-created_at", "-pk")
+
+
+class CursorPaginationMixin:
+    """
+    Примесь для ViewSet: курсорная пагинация по запросу клиента.
+
+    Включается параметром ?pagination=cursor; ссылки next/previous
+    уже содержат ?cursor=..., поэтому дальше режим сохраняется сам.
+    Без параметров работает обычный pagination_class.
+    """
+
+    cursor_pagination_class = None
+    pagination_mode_param = "pagination"
+
+    def use_cursor_pagination(self) -> bool:
+        request = getattr(self, "request", None)
+        if self.cursor_pagination_class is None or request is None:
+            return False
+        params = request.query_params
+        return (
+            params.get(self.pagination_mode_param) == "cursor"
+            or self.cursor_pagination_class.cursor_query_param in params
+        )
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            if self.use_cursor_pagination():
+                self._paginator = self.cursor_pagination_class()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
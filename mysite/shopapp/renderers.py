@@ -0,0 +1,40 @@
+"""
+Формат application/msgpack для API интернет-магазина.
+
+Клиент выбирает его заголовком Accept (или ?format=msgpack) и шлёт
+данные с Content-Type: application/msgpack. Значения, которых нет
+в msgpack (Decimal, datetime, UUID, ленивые строки), приводятся так же,
+как в JSONRenderer - через кодировщик DRF, поэтому ответ в msgpack
+содержит те же данные, что и JSON, и читается любым клиентом msgpack
+без своих расширений.
+"""
+
+import msgpack
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+_encoder = JSONEncoder()
+
+
+class MsgpackRenderer(BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_encoder.default, use_bin_type=True)
+
+
+class MsgpackParser(BaseParser):
+    media_type = "application/msgpack"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, TypeError) as exc:
+            raise ParseError(f"msgpack parse error - {exc}")
@@ -0,0 +1,126 @@
+"""
+Дневные сводки продаж (DailyProductSales, DailyUserSales).
+
+Пересчитываются только затронутые дни: дни заказов, у которых
+updated_at новее водяной отметки, плюс дни удалённых заказов из
+SalesRollupDirtyDay. Каждый такой день пересобирается целиком, поэтому
+повторный пересчёт безопасен.
+
+updated_at ставится при сохранении, а не при коммите: заказ из
+транзакции, начатой до пересчёта и закоммиченной после чтения, имеет
+updated_at раньше начала пересчёта. Поэтому отметка отстаёт от начала
+на WATERMARK_LAG, и дни недавно изменённых заказов пересобираются
+ещё раз в следующем запуске.
+"""
+
+from datetime import date, datetime, time, timedelta, timezone
+from functools import reduce
+from operator import or_
+from typing import Iterable, List, Set
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils.timezone import now
+
+from .models import (
+    DailyProductSales,
+    DailyUserSales,
+    Order,
+    RollupWatermark,
+    SalesRollupDirtyDay,
+)
+
+WATERMARK_NAME = "sales_rollups"
+# Дней за один проход: ограничивает размер OR-условия и транзакции
+DAYS_BATCH_SIZE = 31
+# Дольше самой длинной транзакции, которая сохраняет заказы
+WATERMARK_LAG = timedelta(minutes=5)
+
+
+def days_filter(field: str, days: Iterable[date]) -> Q:
+    """created_at в одном из дней - через диапазоны, чтобы работал индекс."""
+    return reduce(or_, (
+        Q(**{
+            f"{field}__gte": datetime.combine(day, time.min, tzinfo=timezone.utc),
+            f"{field}__lt": datetime.combine(day + timedelta(days=1), time.min, tzinfo=timezone.utc),
+        })
+        for day in days
+    ))
+
+
+def touched_days(since) -> Set[date]:
+    orders = Order.objects.all()
+    if since is not None:
+        orders = orders.filter(updated_at__gt=since)
+    days = set(
+        orders
+        .order_by()
+        .annotate(day=TruncDate("created_at", tzinfo=timezone.utc))
+        .values_list("day", flat=True)
+        .distinct()
+    )
+    days.update(SalesRollupDirtyDay.objects.values_list("day", flat=True))
+    return days
+
+
+def rebuild_days(days: List[date]) -> None:
+    orders_filter = days_filter("created_at", days)
+    items = Order.products.through.objects.filter(
+        days_filter("order__created_at", days)
+    )
+
+    DailyProductSales.objects.filter(day__in=days).delete()
+    DailyProductSales.objects.bulk_create(
+        DailyProductSales(
+            day=row["day"],
+            product_id=row["product"],
+            orders_count=row["orders_count"],
+            revenue=row["revenue"],
+        )
+        for row in (
+            items
+            .order_by()
+            .values("product", day=TruncDate("order__created_at", tzinfo=timezone.utc))
+            .annotate(orders_count=Count("order"), revenue=Sum("product__price"))
+        )
+    )
+
+    DailyUserSales.objects.filter(day__in=days).delete()
+    DailyUserSales.objects.bulk_create(
+        DailyUserSales(
+            day=row["day"],
+            user_id=row["user"],
+            orders_count=row["orders_count"],
+            revenue=row["revenue"],
+        )
+        for row in (
+            Order.objects
+            .filter(orders_filter)
+            .order_by()
+            .values("user", day=TruncDate("created_at", tzinfo=timezone.utc))
+            .annotate(orders_count=Count("pk"), revenue=Sum("total_price"))
+        )
+    )
+
+
+def refresh_sales_rollups(full: bool = False) -> List[date]:
+    """Пересчитать сводки за дни, изменённые после прошлого запуска."""
+    started_at = now()
+    watermark = RollupWatermark.objects.filter(name=WATERMARK_NAME).first()
+    since = None if full or watermark is None else watermark.value
+
+    days = sorted(touched_days(since))
+    for start in range(0, len(days), DAYS_BATCH_SIZE):
+        batch = days[start:start + DAYS_BATCH_SIZE]
+        with transaction.atomic():
+            rebuild_days(batch)
+            SalesRollupDirtyDay.objects.filter(day__in=batch).delete()
+
+    # Отметка - начало пересчёта минус WATERMARK_LAG: то, что изменилось
+    # во время пересчёта или закоммичено позже чтения, попадёт в следующий запуск
+    RollupWatermark.objects.update_or_create(
+        name=WATERMARK_NAME,
+        defaults={"value": started_at - WATERMARK_LAG},
+    )
+    return days
@@ -0,0 +1,107 @@
+"""
+Полнотекстовый поиск по товарам на SQLite FTS5.
+
+Таблица shopapp_product_fts (миграция 0017) - external content индекс
+по Product.name и Product.description. Синхронизацию делают триггеры
+на shopapp_product, поэтому индекс обновляется при save(), delete(),
+bulk_create(), bulk_update() и queryset.update() одинаково.
+На других СУБД или без FTS5 используется обычный SearchFilter.
+"""
+
+import re
+
+from django.db import connections
+from django.db.models import QuerySet
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+FTS_TABLE = "shopapp_product_fts"
+PRODUCT_TABLE = "shopapp_product"
+
+# При пересоздании таблицы (ALTER на SQLite) Django удаляет её триггеры,
+# поэтому они создаются заново после каждого migrate (см. apps.py)
+FTS_TRIGGERS_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {PRODUCT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {PRODUCT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name, description
+    ON {PRODUCT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+_fts_tables = {}
+
+
+def fts_enabled(using: str = "default") -> bool:
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return False
+    name = str(connection.settings_dict["NAME"])
+    if name not in _fts_tables:
+        with connection.cursor() as cursor:
+            _fts_tables[name] = FTS_TABLE in connection.introspection.table_names(cursor)
+    return _fts_tables[name]
+
+
+def ensure_fts_triggers(using: str = "default") -> None:
+    _fts_tables.clear()
+    if not fts_enabled(using):
+        return
+    with connections[using].cursor() as cursor:
+        for sql in FTS_TRIGGERS_SQL:
+            cursor.execute(sql)
+
+
+def build_match_query(search_term: str) -> str:
+    """
+    Превращает ввод пользователя в запрос FTS5: "term1"* "term2"*.
+
+    Берутся только словесные токены, поэтому спецсимволы синтаксиса
+    FTS5 из ввода до запроса не доходят. Каждое слово ищется по префиксу.
+    """
+    return " ".join(f'"{token}"*' for token in re.findall(r"\w+", search_term))
+
+
+def search_products(queryset: QuerySet, search_term: str) -> QuerySet:
+    """Товары, подходящие под search_term, от самых релевантных (bm25)."""
+    match = build_match_query(search_term)
+    if not match:
+        return queryset
+    return (
+        queryset
+        .filter(pk__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+            [match],
+        ))
+        .annotate(search_rank=RawSQL(
+            f"SELECT rank FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = {PRODUCT_TABLE}.id",
+            [match],
+        ))
+        .order_by("search_rank", "pk")
+    )
+
+
+class ProductFullTextSearchFilter(SearchFilter):
+    """SearchFilter для товаров: ?search=... через FTS5 с ранжированием."""
+
+    def filter_queryset(self, request, queryset, view):
+        if not fts_enabled(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+        search_term = " ".join(self.get_search_terms(request))
+        return search_products(queryset, search_term)
@@ -1,9 +1,11 @@
 from rest_framework import serializers
 
-from .models import Product, Order
+from .models import Product, Order, DailyProductSales, DailyUserSales
 
 
 class ProductSerializer(serializers.ModelSerializer):
+    preview_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Product
         fields = (
@@ -15,8 +17,17 @@ class ProductSerializer(serializers.ModelSerializer):
             "created_at",
             "archived",
             "preview",
+            "preview_variants",
         )
 
+    def get_preview_variants(self, product: Product) -> list:
+        """Уменьшенные копии preview в WebP: [{"width": ..., "url": ...}], по возрастанию ширины."""
+        request = self.context.get("request")
+        return [
+            {**variant, "url": request.build_absolute_uri(variant["url"]) if request else variant["url"]}
+            for variant in product.preview_variant_urls
+        ]
+
 
 class OrderSerializer(serializers.ModelSerializer):
     class Meta:
@@ -29,4 +40,32 @@ class OrderSerializer(serializers.ModelSerializer):
             "user",
             "products",
             "receipt",
+            "total_price",
+            "items_count",
+        )
+        read_only_fields = (
+            "total_price",
+            "items_count",
+        )
+
+
+class DailyProductSalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailyProductSales
+        fields = (
+            "day",
+            "product",
+            "orders_count",
+            "revenue",
+        )
+
+
+class DailyUserSalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DailyUserSales
+        fields = (
+            "day",
+            "user",
+            "orders_count",
+            "revenue",
         )
@@ -0,0 +1,181 @@
+from datetime import timezone
+from decimal import Decimal
+from typing import Optional
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import (
+    post_init,
+    post_save,
+    pre_delete,
+    post_delete,
+    m2m_changed,
+)
+from django.dispatch import receiver
+from django.utils.timezone import now
+
+from .caching import PRODUCTS, PRODUCTS_LIST, ORDERS, invalidate
+from .common import recalculate_order_totals
+from .images import delete_variants
+from .models import Product, ProductImage, Order, SalesRollupDirtyDay
+from .search import ensure_fts_triggers
+
+# Поле изображения, у которого shopapp.images делает WebP-копии
+IMAGE_FIELDS = {Product: "preview", ProductImage: "image"}
+
+
+def shift_order_totals(orders, price_delta, count_delta: int = 0) -> None:
+    orders.update(
+        total_price=F("total_price") + price_delta,
+        items_count=F("items_count") + count_delta,
+        updated_at=now(),
+    )
+
+
+def saved_image_name(instance, field_name: str) -> Optional[str]:
+    """Имя файла в хранилище; None, если поле отложено или файл ещё не сохранён."""
+    # Через __dict__, чтобы не подгружать отложенное поле
+    value = instance.__dict__.get(field_name)
+    if isinstance(value, FieldFile):
+        value = value.name if value._committed else None
+    return value if isinstance(value, str) and value else None
+
+
+def delete_variants_on_commit(sender, name: str) -> None:
+    storage = sender._meta.get_field(IMAGE_FIELDS[sender]).storage
+    transaction.on_commit(lambda: delete_variants(storage, name))
+
+
+@receiver(post_init, sender=Product)
+def product_loaded(sender, instance: Product, **kwargs):
+    # Через __dict__, чтобы не подгружать отложенное (only/defer) поле
+    instance._saved_price = instance.__dict__.get("price")
+    instance._saved_image = saved_image_name(instance, "preview")
+
+
+@receiver(post_init, sender=ProductImage)
+def product_image_loaded(sender, instance: ProductImage, **kwargs):
+    instance._saved_image = saved_image_name(instance, "image")
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+def image_saved(sender, instance, **kwargs):
+    name = saved_image_name(instance, IMAGE_FIELDS[sender])
+    if instance._saved_image and instance._saved_image != name:
+        # Копии прежнего файла к новому не относятся
+        delete_variants_on_commit(sender, instance._saved_image)
+    instance._saved_image = name
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductImage)
+def image_deleted(sender, instance, **kwargs):
+    name = saved_image_name(instance, IMAGE_FIELDS[sender])
+    if name:
+        delete_variants_on_commit(sender, name)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance: Product, created: bool, raw: bool, update_fields, **kwargs):
+    invalidate(PRODUCTS, PRODUCTS_LIST)
+    if update_fields is not None and "price" not in update_fields:
+        return
+    if created or raw:
+        instance._saved_price = instance.price
+        return
+    if instance._saved_price is None:
+        # Старая цена не загружалась - пересчитываем заказы товара целиком
+        recalculate_order_totals(Order.objects.filter(products=instance))
+        invalidate(ORDERS)
+    else:
+        price_delta = Decimal(instance.price) - Decimal(instance._saved_price)
+        if price_delta:
+            shift_order_totals(Order.objects.filter(products=instance), price_delta)
+            invalidate(ORDERS)
+    instance._saved_price = instance.price
+
+
+@receiver(pre_delete, sender=Product)
+def product_deleting(sender, instance: Product, **kwargs):
+    # Строки Order.products.through удаляются каскадом без m2m_changed
+    shift_order_totals(Order.objects.filter(products=instance), -Decimal(instance.price), -1)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance: Product, **kwargs):
+    invalidate(PRODUCTS, PRODUCTS_LIST, ORDERS)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def order_changed(sender, instance: Order, **kwargs):
+    invalidate(ORDERS)
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance: Order, **kwargs):
+    SalesRollupDirtyDay.objects.get_or_create(
+        day=instance.created_at.astimezone(timezone.utc).date(),
+    )
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def order_products_changed(sender, instance, action: str, reverse: bool, pk_set, **kwargs):
+    """
+    Поправить итоги заказов на добавленные/убранные товары.
+
+    Прямая сторона: instance - заказ, pk_set - товары.
+    Обратная (product.orders.add(...)): instance - товар, pk_set - заказы.
+    """
+    if action == "pre_clear":
+        # После clear() уже не узнать, что было связано
+        if reverse:
+            instance._cleared_order_ids = list(instance.orders.values_list("pk", flat=True))
+        return
+    if action == "pre_remove":
+        # remove() передаёт все запрошенные pk, в том числе не связанные
+        # с instance (или уже убранные) - сдвигаем итоги только на реальные связи
+        links = sender.objects.filter(**{"product" if reverse else "order": instance.pk})
+        instance._removed_ids = set(links.filter(
+            **{"order__in" if reverse else "product__in": pk_set}
+        ).values_list("order" if reverse else "product", flat=True))
+        return
+    if not action.startswith("post_"):
+        return
+    invalidate(ORDERS)
+    if action == "post_remove":
+        pk_set = instance.__dict__.pop("_removed_ids", pk_set)
+
+    sign = -1 if action in ("post_remove", "post_clear") else 1
+    if not reverse:
+        if action == "post_clear":
+            Order.objects.filter(pk=instance.pk).update(
+                total_price=0,
+                items_count=0,
+                updated_at=now(),
+            )
+            instance.total_price, instance.items_count = Decimal(0), 0
+            return
+        if not pk_set:
+            return
+        price = Product.objects.filter(pk__in=pk_set).aggregate(total=Sum("price"))["total"] or 0
+        shift_order_totals(Order.objects.filter(pk=instance.pk), sign * price, sign * len(pk_set))
+        instance.total_price = Decimal(instance.total_price) + sign * price
+        instance.items_count += sign * len(pk_set)
+        return
+
+    order_ids = instance.__dict__.pop("_cleared_order_ids", None) if action == "post_clear" else pk_set
+    if order_ids:
+        shift_order_totals(Order.objects.filter(pk__in=order_ids), sign * Decimal(instance.price), sign)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance: User, **kwargs):
+    invalidate(ORDERS)
+
+
+def ensure_search_index(sender, using: str = "default", **kwargs):
+    ensure_fts_triggers(using)
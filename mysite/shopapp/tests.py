@@ -1,13 +1,47 @@
+import os
+from csv import DictReader
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
 from string import ascii_letters
 from random import choices
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+import msgpack
+from PIL import Image
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.timezone import now
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
-from shopapp.models import Product, Order
+from blogapp.models import Article, Author, Category, Tag
+from shopapp.benchmarks import (
+    ROUTES,
+    SKIPPED_ROUTES,
+    iter_route_names,
+    load_baseline,
+    run_benchmarks,
+    seed_benchmark_data,
+)
+from shopapp.common import save_csv_products, save_csv_orders
+from shopapp.datagen import DataSpec, generate_data
+from shopapp.fuzzy import FuzzyProductIndex, product_name_index
+from shopapp.images import render_variants, submit
+from shopapp.models import Product, ProductImage, Order, DailyProductSales, DailyUserSales, variant_name
+from shopapp.rollups import WATERMARK_LAG, refresh_sales_rollups, touched_days
+from shopapp.search import search_products
+from shopapp.sitemap import ShopSiteMap
+from shopapp.views import LatestProductsFeed, ProductsListView
 from shopapp.utils import add_two_numbers
 
 
@@ -222,3 +256,848 @@ class OrdersExportTestCase(TestCase):
     @classmethod
     def tearDownClass(cls):
         cls.user.delete()
+
+
+class ProductCursorPaginationTestCase(TestCase):
+    def setUp(self):
+        Product.objects.bulk_create(
+            Product(name=f"Product {i % 4}", price=i % 3)
+            for i in range(25)
+        )
+
+    def collect_pages(self, url):
+        pks = []
+        while url:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            for query in ctx.captured_queries:
+                self.assertNotIn("COUNT(", query["sql"].upper())
+            data = response.json()
+            self.assertNotIn("count", data)
+            pks.extend(item["pk"] for item in data["results"])
+            url = data["next"]
+        return pks
+
+    def test_cursor_pages_follow_model_ordering(self):
+        pks = self.collect_pages(
+            reverse("shopapp:product-list") + "?pagination=cursor"
+        )
+        expected = list(
+            Product.objects.order_by("name", "price", "pk").values_list("pk", flat=True)
+        )
+        self.assertEqual(pks, expected)
+
+    def test_cursor_pages_with_ordering_and_search(self):
+        pks = self.collect_pages(
+            reverse("shopapp:product-list")
+            + "?pagination=cursor&ordering=-price&search=Product 1"
+        )
+        expected = list(
+            Product.objects
+            .filter(name__icontains="Product 1")
+            .order_by("-price", "-pk")
+            .values_list("pk", flat=True)
+        )
+        self.assertEqual(pks, expected)
+
+    def test_page_number_pagination_is_default(self):
+        response = self.client.get(reverse("shopapp:product-list"))
+        self.assertEqual(response.json()["count"], 25)
+
+
+class ProductDownloadCSVTestCase(TestCase):
+    fixtures = [
+        'products-fixture.json',
+    ]
+
+    def test_download_csv_is_streamed_and_filtered(self):
+        response = self.client.get(
+            reverse("shopapp:product-download-csv") + "?archived=false"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "name,description,price,discount")
+        expected = [
+            f"{product.name},{product.description},{product.price},{product.discount}"
+            for product in Product.objects.filter(archived=False)
+        ]
+        self.assertEqual(lines[1:], expected)
+
+
+class SaveCSVProductsTestCase(TestCase):
+    def test_import_upserts_and_rejects(self):
+        Product.objects.create(name="Laptop", price=100)
+        csv_data = (
+            "name,description,price,discount\n"
+            "Laptop,updated,150.50,5\n"
+            "Desktop,new one,2000,0\n"
+            ",no name,10,0\n"
+            "Phone,bad price,abc,0\n"
+            "Tablet,,300,1\n"
+        )
+        summary = save_csv_products(
+            BytesIO(csv_data.encode()),
+            encoding="utf-8",
+            chunk_size=2,
+        )
+        self.assertEqual(summary.inserted, 2)
+        self.assertEqual(summary.updated, 1)
+        self.assertEqual(summary.rejected, 2)
+        self.assertEqual([error["line"] for error in summary.errors], [4, 5])
+
+        self.assertEqual(Product.objects.filter(name="Laptop").count(), 1)
+        laptop = Product.objects.get(name="Laptop")
+        self.assertEqual(laptop.description, "updated")
+        self.assertEqual(str(laptop.price), "150.50")
+        self.assertTrue(Product.objects.filter(name="Tablet").exists())
+
+    def test_missing_columns_keep_existing_values(self):
+        Product.objects.create(name="Laptop", description="fast", price=100, discount=15)
+        summary = save_csv_products(
+            BytesIO(b"name,price\nLaptop,120\nLaptop,130\nMouse,5\nMouse,6\n"),
+            encoding="utf-8",
+        )
+        self.assertEqual((summary.inserted, summary.updated), (1, 1))
+        laptop = Product.objects.get(name="Laptop")
+        self.assertEqual((laptop.description, laptop.discount, laptop.price), ("fast", 15, Decimal("130")))
+        mouse = Product.objects.get(name="Mouse")
+        self.assertEqual((mouse.description, mouse.discount, mouse.price), ("", 0, Decimal("6")))
+
+    def test_upload_csv_returns_summary(self):
+        csv_file = SimpleUploadedFile(
+            "products.csv",
+            b"name,price\nLaptop,100\nDesktop,200\n",
+            content_type="text/csv",
+        )
+        response = self.client.post(
+            reverse("shopapp:product-upload-csv"),
+            {"file": csv_file},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {"inserted": 2, "updated": 0, "rejected": 0, "errors": []},
+        )
+
+
+class SaveCSVOrdersTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="bob-test", password="qwerty")
+        self.laptop = Product.objects.create(name="Laptop")
+        self.desktop = Product.objects.create(name="Desktop")
+
+    def test_import_orders_in_bulk(self):
+        csv_data = (
+            "delivery_address,promocode,user,products\n"
+            'ul. Pupkina,SALE,bob-test,"Laptop,Desktop,Laptop"\n'
+            "ul. Ivanova,,bob-test,Ghost\n"
+            "ul. Petrova,,alice,Laptop\n"
+        )
+        with self.assertNumQueries(7):
+            summary = save_csv_orders(
+                BytesIO(csv_data.encode()),
+                encoding="utf-8",
+            )
+        self.assertEqual(summary.inserted, 2)
+        self.assertEqual(summary.rejected, 1)
+        self.assertEqual(summary.unknown_users, {"alice"})
+        self.assertEqual(summary.unknown_products, {"Ghost"})
+
+        order = Order.objects.get(delivery_address="ul. Pupkina")
+        self.assertEqual(order.user, self.user)
+        self.assertEqual(
+            set(order.products.values_list("pk", flat=True)),
+            {self.laptop.pk, self.desktop.pk},
+        )
+        self.assertFalse(
+            Order.objects.get(delivery_address="ul. Ivanova").products.exists()
+        )
+        self.assertEqual(order.items_count, 2)
+
+
+class ExportCacheInvalidationTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="bob-test", password="qwerty")
+        self.product = Product.objects.create(name="Laptop", price=100)
+
+    def test_products_export_is_invalidated_on_save(self):
+        url = reverse("shopapp:products-export")
+        self.assertEqual(self.client.get(url).json()["products"][0]["price"], "100.00")
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = 200
+            self.product.save()
+        self.assertEqual(self.client.get(url).json()["products"][0]["price"], "200.00")
+
+    def test_user_orders_export_is_invalidated_on_m2m_change(self):
+        order = Order.objects.create(user=self.user, delivery_address="ul. Pupkina")
+        url = reverse("shopapp:user-order-export", kwargs={"user_id": self.user.pk})
+        self.assertEqual(self.client.get(url).json()[0]["products"], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order.products.add(self.product)
+        self.assertEqual(self.client.get(url).json()[0]["products"], [self.product.pk])
+
+
+class ProductListCacheTestCase(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Phone", price=100)
+        self.user = User.objects.create_user(username="bob-test", password="qwerty", is_staff=True)
+
+    def test_equivalent_queries_share_one_entry(self):
+        url = reverse("shopapp:product-list")
+        self.client.get(url + "?ordering=price&search=Phone&page=1")
+        with self.assertNumQueries(0):
+            response = self.client.get(url + "?search=phone&utm_source=x&ordering=price")
+        self.assertEqual(response.json()["results"][0]["name"], "Phone")
+
+        self.client.force_login(self.user)
+        stats = self.client.get(reverse("shopapp:product-cache-stats")).json()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_repeated_param_keyed_by_last_value(self):
+        Product.objects.create(name="Laptop", price=10)
+        url = reverse("shopapp:product-list")
+        self.assertEqual(self.client.get(url + "?ordering=price&ordering=-price").json()["results"][0]["name"], "Phone")
+        response = self.client.get(url + "?ordering=-price&ordering=price")
+        self.assertEqual(response.json()["results"][0]["name"], "Laptop")
+
+    def test_write_through_viewset_purges_list(self):
+        url = reverse("shopapp:product-list")
+        self.assertEqual(self.client.get(url).json()["count"], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {"name": "Laptop", "price": "10.00"})
+        self.assertEqual(self.client.get(url).json()["count"], 2)
+
+    def test_admin_archive_action_purges_list(self):
+        url = reverse("shopapp:product-list") + "?archived=false"
+        self.assertEqual(self.client.get(url).json()["count"], 1)
+        self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("admin:shopapp_product_changelist"),
+                {"action": "mark_archived", "_selected_action": [self.product.pk]},
+            )
+        self.client.logout()
+        self.assertEqual(self.client.get(url).json()["count"], 0)
+
+
+class MsgpackAPITestCase(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Phone", price=Decimal("100.50"))
+
+    def test_list_in_msgpack(self):
+        response = self.client.get(reverse("shopapp:product-list"), HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        data = msgpack.unpackb(response.content)
+        self.assertEqual(data["results"][0]["name"], "Phone")
+        # Те же значения, что и в JSON
+        self.assertEqual(data, self.client.get(reverse("shopapp:product-list")).json())
+
+    def test_create_from_msgpack(self):
+        response = self.client.post(
+            reverse("shopapp:product-list"),
+            msgpack.packb({"name": "Laptop", "price": "10.00"}),
+            content_type="application/msgpack",
+            HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content)["price"], "10.00")
+        self.assertTrue(Product.objects.filter(name="Laptop", price=Decimal("10.00")).exists())
+
+    def test_invalid_msgpack(self):
+        response = self.client.post(reverse("shopapp:product-list"), b"\xc1", content_type="application/msgpack")
+        self.assertEqual(response.status_code, 400)
+
+
+def make_image(name: str, size=(64, 48), image_format="PNG") -> SimpleUploadedFile:
+    buffer = BytesIO()
+    Image.new("RGB", size, "teal").save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f"image/{image_format.lower()}")
+
+
+@override_settings(
+    IMAGE_VARIANT_WIDTHS=[16, 32, 128],
+    IMAGE_VARIANT_WORKERS=0,
+)
+class ProductImageVariantsTestCase(TestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_product(self) -> Product:
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("shopapp:product_create"), {
+                "name": "Lamp",
+                "price": "10.00",
+                "description": "",
+                "discount": "0",
+                "preview": make_image("lamp.png"),
+                "images": [make_image("side.jpg", (20, 10), "JPEG")],
+            })
+        self.assertRedirects(response, reverse("shopapp:products_list"))
+        return Product.objects.get(name="Lamp")
+
+    def test_create_view_generates_variants(self):
+        product = self.create_product()
+        self.assertEqual(product.preview_variants, [16, 32])
+        with Image.open(os.path.join(self.media_root, variant_name(product.preview.name, 32))) as variant:
+            self.assertEqual((variant.format, variant.size), ("WEBP", (32, 24)))
+        # Картинка уже меньше всех ширин - одна перекодированная копия без увеличения
+        self.assertEqual(product.images.get().variants, [16])
+
+        response = self.client.get(reverse("shopapp:products_list"))
+        self.assertContains(response, product.preview_srcset)
+        self.assertContains(response, variant_name(product.preview.url, 16))
+
+        data = self.client.get(reverse("shopapp:product-detail", kwargs={"pk": product.pk})).json()
+        self.assertEqual(
+            data["preview_variants"],
+            [
+                {"width": width, "url": "http://testserver" + variant_name(product.preview.url, width)}
+                for width in (16, 32)
+            ],
+        )
+
+    def variant_exists(self, name: str, width: int) -> bool:
+        return os.path.exists(os.path.join(self.media_root, variant_name(name, width)))
+
+    def test_new_preview_replaces_variants(self):
+        product = self.create_product()
+        old_preview = product.preview.name
+        self.assertTrue(self.variant_exists(old_preview, 16))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("shopapp:product_update", kwargs={"pk": product.pk}), {
+                "name": "Lamp",
+                "price": "10.00",
+                "description": "",
+                "discount": "0",
+                "preview": make_image("lamp-wide.png", (256, 64)),
+                "images": [make_image("top.png")],
+            })
+        product.refresh_from_db()
+        self.assertTrue(product.preview.name.endswith("lamp-wide.png"))
+        self.assertEqual(product.preview_variants, [16, 32, 128])
+        self.assertEqual(ProductImage.objects.filter(product=product).count(), 2)
+        self.assertFalse(self.variant_exists(old_preview, 16))
+        self.assertFalse(self.variant_exists(old_preview, 32))
+
+    def test_same_stem_images_keep_own_variants(self):
+        product = self.create_product()
+        with self.captureOnCommitCallbacks(execute=True):
+            images = [
+                ProductImage.objects.create(product=product, image=make_image(name, size))
+                for name, size in (("photo.jpg", (64, 48)), ("photo.png", (40, 40)))
+            ]
+        for image in images:
+            submit(ProductImage, image.pk, "image", "variants", image.image.name)
+        jpg, png = (ProductImage.objects.get(pk=image.pk) for image in images)
+        self.assertEqual((jpg.variants, png.variants), ([16, 32], [16, 32]))
+        with Image.open(os.path.join(self.media_root, variant_name(jpg.image.name, 32))) as variant:
+            self.assertEqual(variant.size, (32, 24))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            jpg.delete()
+        self.assertFalse(self.variant_exists(jpg.image.name, 16))
+        self.assertTrue(self.variant_exists(png.image.name, 16))
+
+    def test_render_keeps_transparency(self):
+        buffer = BytesIO()
+        Image.new("RGBA", (40, 40), (0, 0, 0, 0)).save(buffer, "PNG")
+        storage = Product._meta.get_field("preview").storage
+        name = storage.save("transparent.png", ContentFile(buffer.getvalue()))
+        self.assertEqual(render_variants(storage, name, [16, 64], quality=80), [16])
+        with storage.open(variant_name(name, 16)) as file, Image.open(file) as variant:
+            self.assertEqual(variant.mode, "RGBA")
+
+
+@override_settings(
+    IMAGE_VARIANT_WIDTHS=[16],
+    IMAGE_VARIANT_WORKERS=1,
+)
+class ImageVariantsPoolTestCase(TransactionTestCase):
+    def test_generated_in_pool_thread(self):
+        with TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            product = Product.objects.create(name="Lamp", preview=make_image("lamp.png"))
+            future = submit(Product, product.pk, "preview", "preview_variants", product.preview.name)
+            self.assertEqual(future.result(timeout=10), [16])
+            product.refresh_from_db()
+            self.assertEqual(product.preview_variants, [16])
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(name="Phone", price=100)
+
+    def test_products_api_not_modified(self):
+        url = reverse("shopapp:product-list")
+        response = self.client.get(url)
+        etag = response.headers["ETag"]
+        self.assertIn("Last-Modified", response.headers)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(url + "?page=2", HTTP_IF_NONE_MATCH=etag)
+        self.assertNotEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = "Smartphone"
+            self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_products_export_if_modified_since(self):
+        url = reverse("shopapp:products-export")
+        last_modified = self.client.get(url).headers["Last-Modified"]
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+
+class OrderQueryCountTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="bob-test", password="qwerty")
+        self.products = Product.objects.bulk_create(
+            Product(name=f"Product {i}") for i in range(3)
+        )
+
+    def create_orders(self, count):
+        for i in range(count):
+            order = Order.objects.create(user=self.user, delivery_address=f"Address {i}")
+            order.products.set(self.products)
+
+    def test_orders_api_query_count_does_not_depend_on_page_size(self):
+        url = reverse("shopapp:order-list")
+        self.create_orders(2)
+        # COUNT, заказы, товары заказов
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()["results"]), 2)
+
+        self.create_orders(8)
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()["results"]), 10)
+        self.assertEqual(len(response.json()["results"][0]["products"]), 3)
+
+    def test_user_orders_export_query_count(self):
+        self.create_orders(5)
+        url = reverse("shopapp:user-order-export", kwargs={"user_id": self.user.pk})
+        # пользователь, заказы, товары заказов
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(len(response.json()), 5)
+
+
+class ProductFullTextSearchTestCase(TestCase):
+    def search(self, term):
+        return list(
+            search_products(Product.objects.all(), term).values_list("name", flat=True)
+        )
+
+    def test_index_follows_save_update_and_delete(self):
+        product = Product.objects.create(name="Gaming laptop", description="fast")
+        self.assertEqual(self.search("lapt"), ["Gaming laptop"])
+
+        product.name = "Office desktop"
+        product.save()
+        self.assertEqual(self.search("laptop"), [])
+        self.assertEqual(self.search("desk"), ["Office desktop"])
+
+        Product.objects.filter(pk=product.pk).update(description="quiet")
+        self.assertEqual(self.search("quiet"), ["Office desktop"])
+
+        product.delete()
+        self.assertEqual(self.search("desk"), [])
+
+    def test_bulk_create_is_indexed_and_ranked(self):
+        Product.objects.bulk_create([
+            Product(name="Phone case", description="for any device"),
+            Product(name="Phone", description="phone phone phone"),
+            Product(name="Laptop", description="no match here"),
+        ])
+        self.assertEqual(self.search("phone"), ["Phone", "Phone case"])
+        self.assertEqual(self.search('phone "case'), ["Phone case"])
+
+    def test_products_api_uses_full_text_search(self):
+        Product.objects.create(name="Smartphone", description="")
+        Product.objects.create(name="Phone", description="")
+        response = self.client.get(reverse("shopapp:product-list") + "?search=pho")
+        self.assertEqual(
+            [product["name"] for product in response.json()["results"]],
+            ["Phone"],
+        )
+
+
+class FuzzyProductSearchTestCase(TestCase):
+    def setUp(self):
+        self.index = FuzzyProductIndex(refresh_interval=0, rebuild_interval=0)
+        Product.objects.bulk_create([
+            Product(name="Laptop"),
+            Product(name="Desktop"),
+            Product(name="Smartphone"),
+            Product(name="Lapdog toy", archived=True),
+        ])
+
+    def test_typos_are_matched(self):
+        self.index.refresh(force=True)
+        pks = [pk for pk, _ in self.index.search("lpatop")]
+        self.assertEqual(pks[0], Product.objects.get(name="Laptop").pk)
+        self.assertNotIn(Product.objects.get(name="Lapdog toy").pk, pks)
+
+    def test_index_refreshes_incrementally(self):
+        self.index.refresh(force=True)
+        laptop = Product.objects.get(name="Laptop")
+        with self.captureOnCommitCallbacks(execute=True):
+            laptop.name = "Notebook"
+            laptop.save()
+            Product.objects.create(name="Smartwatch")
+        self.assertEqual(self.index.search("notbook")[0][0], laptop.pk)
+        self.assertEqual(self.index.search("laptop"), [])
+        self.assertIn("smartwatch", self.index.names.values())
+
+    def test_rebuild_is_rate_limited(self):
+        index = FuzzyProductIndex(refresh_interval=0, rebuild_interval=60)
+        index.refresh(force=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="Smartwatch")
+        with self.assertNumQueries(0):
+            index.refresh()
+        self.assertNotIn("smartwatch", index.names.values())
+        index.loaded_at -= 60
+        index.refresh()
+        self.assertIn("smartwatch", index.names.values())
+
+    def test_fuzzy_search_limit_validation(self):
+        product_name_index.refresh(force=True)
+        url = reverse("shopapp:product-fuzzy-search") + "?q=smartphone&limit="
+        for limit in ("0", "-5"):
+            response = self.client.get(url + limit)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()["results"]), 1)
+        self.assertEqual(self.client.get(url + "abc").status_code, 400)
+
+    def test_fuzzy_search_endpoint(self):
+        product_name_index.refresh(force=True)
+        response = self.client.get(
+            reverse("shopapp:product-fuzzy-search") + "?q=smartfone"
+        )
+        self.assertEqual(response.status_code, 200)
+        result = response.json()["results"][0]
+        self.assertEqual(result["name"], "Smartphone")
+        self.assertGreater(result["score"], 60)
+
+    def test_fuzzy_search_skips_products_archived_since_rebuild(self):
+        product_name_index.refresh(force=True)
+        Product.objects.filter(name="Smartphone").update(archived=True)
+        response = self.client.get(reverse("shopapp:product-fuzzy-search") + "?q=smartfone")
+        self.assertNotIn("Smartphone", [item["name"] for item in response.json()["results"]])
+
+    def test_search_does_not_wait_for_running_rebuild(self):
+        self.index.refresh(force=True)
+        Product.objects.create(name="Smartwatch")
+        self.index.version = None
+        # Другой поток читает таблицу - поиск идёт по прежнему индексу
+        self.index.rebuilding = True
+        with self.assertNumQueries(0):
+            matches = self.index.search("smartwach")
+        self.assertNotIn("smartwatch", [self.index.names[pk] for pk, _ in matches])
+
+
+class AdminExportCSVTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(username="admin-test", password="qwerty")
+        self.client.force_login(self.user)
+        self.order = Order.objects.create(
+            user=self.user,
+            delivery_address="ul. Pupkina",
+            promocode="SALE",
+        )
+
+    def test_orders_export_is_streamed_in_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                reverse("admin:shopapp_order_changelist"),
+                {"action": "export_csv", "_selected_action": [self.order.pk]},
+            )
+            content = b"".join(response.streaming_content).decode()
+        export_queries = [
+            query["sql"] for query in ctx.captured_queries
+            if '"shopapp_order"."id"' in query["sql"] or '"auth_user"' in query["sql"]
+        ]
+        # только загрузка админа сессией и один SELECT по заказам вместе с пользователями
+        self.assertEqual(len(export_queries), 2)
+        header = content.splitlines()[0]
+        self.assertEqual(header, "id,delivery_address,promocode,created_at,updated_at,user,receipt,total_price,items_count")
+        [row] = DictReader(StringIO(content))
+        self.assertEqual(row["id"], str(self.order.pk))
+        self.assertEqual(row["delivery_address"], "ul. Pupkina")
+        self.assertEqual(row["promocode"], "SALE")
+        self.assertEqual(row["user"], "admin-test")
+
+
+class OrderTotalsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="bob-test", password="qwerty")
+        self.laptop = Product.objects.create(name="Laptop", price=1000)
+        self.phone = Product.objects.create(name="Phone", price="250.50")
+        self.order = Order.objects.create(user=self.user)
+
+    def assertTotals(self, price, count):
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_price, Decimal(price))
+        self.assertEqual(self.order.items_count, count)
+
+    def test_totals_follow_order_products(self):
+        self.order.products.add(self.laptop, self.phone)
+        self.assertTotals("1250.50", 2)
+        self.order.products.remove(self.laptop)
+        self.assertTotals("250.50", 1)
+        self.order.products.clear()
+        self.assertTotals("0", 0)
+
+    def test_totals_follow_reverse_side(self):
+        self.laptop.orders.add(self.order)
+        self.assertTotals("1000", 1)
+        self.laptop.orders.clear()
+        self.assertTotals("0", 0)
+
+    def test_removing_unlinked_products_keeps_totals(self):
+        self.order.products.add(self.laptop)
+        self.order.products.remove(self.phone)
+        self.assertTotals("1000", 1)
+        self.order.products.remove(self.laptop, self.phone)
+        self.order.products.remove(self.laptop)
+        self.assertTotals("0", 0)
+
+        self.phone.orders.add(self.order)
+        other = Order.objects.create(user=self.user)
+        self.phone.orders.remove(self.order, other)
+        self.phone.orders.remove(self.order)
+        self.assertTotals("0", 0)
+        other.refresh_from_db()
+        self.assertEqual((other.total_price, other.items_count), (Decimal(0), 0))
+
+    def test_totals_follow_product_price_and_delete(self):
+        self.order.products.add(self.laptop, self.phone)
+        laptop = Product.objects.only("pk", "name").get(pk=self.laptop.pk)
+        laptop.price = 900
+        laptop.save()
+        self.assertTotals("1150.50", 2)
+
+        self.phone.price = 300
+        self.phone.save()
+        self.assertTotals("1200", 2)
+
+        self.phone.delete()
+        self.assertTotals("900", 1)
+
+    def test_recalc_command_repairs_totals(self):
+        self.order.products.add(self.laptop, self.phone)
+        Order.objects.update(total_price=0, items_count=0)
+        call_command("recalc_order_totals", batch_size=1, stdout=StringIO())
+        self.assertTotals("1250.50", 2)
+
+    def test_orders_api_filters_and_orders_by_totals(self):
+        self.order.products.add(self.laptop)
+        cheap = Order.objects.create(user=self.user)
+        cheap.products.add(self.phone)
+        response = self.client.get(
+            reverse("shopapp:order-list") + "?ordering=-total_price&total_price__gte=100"
+        )
+        results = response.json()["results"]
+        self.assertEqual([order["pk"] for order in results], [self.order.pk, cheap.pk])
+        self.assertEqual(results[0]["total_price"], "1000.00")
+        self.assertEqual(results[0]["items_count"], 1)
+
+
+class SalesRollupsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="bob-test", password="qwerty", is_staff=True)
+        self.laptop = Product.objects.create(name="Laptop", price=1000)
+        self.phone = Product.objects.create(name="Phone", price=200)
+
+    def create_order(self, day, *products):
+        order = Order.objects.create(user=self.user)
+        Order.objects.filter(pk=order.pk).update(
+            created_at=datetime(2024, 12, day, 12, tzinfo=timezone.utc)
+        )
+        order.products.add(*products)
+        return order
+
+    def age_orders(self):
+        """Сдвинуть updated_at за WATERMARK_LAG - как будто с пересчёта прошло время."""
+        Order.objects.update(updated_at=F("updated_at") - 2 * WATERMARK_LAG)
+
+    def test_refresh_only_touched_days(self):
+        self.create_order(1, self.laptop, self.phone)
+        second = self.create_order(2, self.laptop)
+        call_command("refresh_sales_rollups", stdout=StringIO())
+        self.age_orders()
+
+        self.assertEqual(
+            list(DailyUserSales.objects.order_by("day").values_list("day", "orders_count", "revenue")),
+            [(date(2024, 12, 1), 1, Decimal("1200")), (date(2024, 12, 2), 1, Decimal("1000"))],
+        )
+        self.assertEqual(
+            DailyProductSales.objects.get(day=date(2024, 12, 1), product=self.laptop).revenue,
+            Decimal("1000"),
+        )
+
+        self.assertEqual(refresh_sales_rollups(), [])
+
+        second.products.add(self.phone)
+        self.assertEqual(refresh_sales_rollups(), [date(2024, 12, 2)])
+        self.assertEqual(DailyUserSales.objects.get(day=date(2024, 12, 2)).revenue, Decimal("1200"))
+
+        second.refresh_from_db()
+        second.delete()
+        self.assertEqual(refresh_sales_rollups(), [date(2024, 12, 2)])
+        self.assertFalse(DailyUserSales.objects.filter(day=date(2024, 12, 2)).exists())
+
+    def test_order_committed_after_read_is_not_lost(self):
+        self.create_order(1, self.laptop)
+
+        def read_then_commit(since):
+            days = touched_days(since)
+            # Заказ сохранён до начала пересчёта, а его транзакция закоммичена после чтения
+            late = self.create_order(3, self.phone)
+            Order.objects.filter(pk=late.pk).update(updated_at=now() - timedelta(seconds=30))
+            return days
+
+        with patch("shopapp.rollups.touched_days", side_effect=read_then_commit):
+            self.assertEqual(refresh_sales_rollups(), [date(2024, 12, 1)])
+        self.assertIn(date(2024, 12, 3), refresh_sales_rollups())
+        self.assertEqual(DailyUserSales.objects.get(day=date(2024, 12, 3)).revenue, Decimal("200"))
+
+    def test_analytics_api_reads_rollups(self):
+        self.create_order(1, self.laptop)
+        refresh_sales_rollups()
+        url = reverse("shopapp:dailyproductsales-list") + "?day__gte=2024-12-01"
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.user)
+        with self.assertNumQueries(4):
+            # сессия, пользователь, COUNT, сводки
+            response = self.client.get(url)
+        self.assertEqual(
+            response.json()["results"],
+            [{"day": "2024-12-01", "product": self.laptop.pk, "orders_count": 1, "revenue": "1000.00"}],
+        )
+
+
+@skipUnlessDBFeature("supports_partial_indexes")
+class HotQueryPlansTestCase(TestCase):
+    """Горячие запросы магазина должны идти по индексу, без SCAN и сортировки."""
+
+    def assertUsesIndex(self, queryset):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN is SQLite-specific")
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        for step in plan:
+            self.assertNotIn("TEMP B-TREE", step, plan)
+            if step.startswith("SCAN"):
+                self.assertIn("USING", step, plan)
+
+    def test_latest_products_feed(self):
+        self.assertUsesIndex(LatestProductsFeed().items())
+
+    def test_shop_sitemap(self):
+        self.assertUsesIndex(ShopSiteMap().items())
+
+    def test_products_list(self):
+        self.assertUsesIndex(ProductsListView.queryset.all())
+
+    def test_user_orders_export(self):
+        self.assertUsesIndex(Order.objects.filter(user=1).order_by("pk"))
+
+    def test_orders_cursor_pagination(self):
+        self.assertUsesIndex(Order.objects.order_by("-created_at", "-pk")[:10])
+
+
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+    "state": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+})
+class ShopRoutesBenchmarkTestCase(TestCase):
+    """Число запросов маршрутов не зависит от объёма данных и не выше базовой линии."""
+
+    def test_every_route_is_benchmarked(self):
+        self.assertEqual(set(iter_route_names()), set(ROUTES) | set(SKIPPED_ROUTES))
+
+    def test_query_counts_do_not_grow_with_data(self):
+        ctx = seed_benchmark_data(5, seed=1)
+        small = run_benchmarks(ctx, repeat=2)
+        # Сводки пересобираются целиком, поэтому берём свежий контекст
+        large = run_benchmarks(seed_benchmark_data(50, seed=2), repeat=2)
+        baseline = load_baseline().get("1000", {})
+
+        for name in ROUTES:
+            with self.subTest(route=name):
+                self.assertEqual(large[name]["status"], 200)
+                self.assertEqual(large[name]["queries"], small[name]["queries"])
+                if name in baseline:
+                    self.assertLessEqual(large[name]["queries"], baseline[name]["queries"])
+
+
+class GenerateDataTestCase(TestCase):
+    spec = dict(
+        users=3, products=40, orders=30, authors=2, categories=2, tags=6, articles=10,
+        seed=7, batch_size=8, until=datetime(2024, 6, 1, tzinfo=timezone.utc),
+    )
+
+    def snapshot(self) -> dict:
+        return {
+            "products": list(Product.objects.order_by("pk").values_list("pk", "name", "price", "created_at", "archived")),
+            "orders": list(Order.objects.order_by("pk").values_list("pk", "user", "delivery_address", "created_at")),
+            "lines": sorted(Order.products.through.objects.values_list("order", "product")),
+            "articles": list(Article.objects.order_by("pk").values_list("pk", "title", "author", "category")),
+            "tags": sorted(Article.tags.through.objects.values_list("article", "tag")),
+        }
+
+    def clear(self):
+        Order.objects.all().delete()
+        Product.objects.all().delete()
+        User.objects.all().delete()
+        Article.objects.all().delete()
+        Tag.objects.all().delete()
+        Author.objects.all().delete()
+        Category.objects.all().delete()
+
+    def test_same_seed_same_data_with_workers(self):
+        generate_data(DataSpec(**self.spec))
+        first = self.snapshot()
+        self.clear()
+        generate_data(DataSpec(**self.spec), workers=2)
+
+        self.assertEqual(self.snapshot(), first)
+        self.assertEqual(len(first["products"]), 40)
+        self.assertTrue(all(row[3] < self.spec["until"] for row in first["orders"]))
+
+    def test_order_totals_match_lines(self):
+        generate_data(DataSpec(**self.spec))
+
+        for order in Order.objects.prefetch_related("products"):
+            products = order.products.all()
+            self.assertGreaterEqual(len(products), 1)
+            self.assertEqual(order.items_count, len(products))
+            self.assertEqual(order.total_price, sum(product.price for product in products))
+
+    def test_orders_require_products(self):
+        with self.assertRaises(ValueError):
+            generate_data(DataSpec(users=1, orders=5))
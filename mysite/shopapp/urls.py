@@ -20,6 +20,8 @@ from .views import (
     OrdersDataExportView,
     ProductViewSet,
     OrderViewSet,
+    DailyProductSalesViewSet,
+    DailyUserSalesViewSet,
     LatestProductsFeed,
     UserOrdersListView,
     UserOrdersExportView,
@@ -30,6 +32,8 @@ app_name = 'shopapp'
 routers = DefaultRouter()
 routers.register("products", ProductViewSet)
 routers.register("orders", OrderViewSet)
+routers.register("analytics/products", DailyProductSalesViewSet)
+routers.register("analytics/users", DailyUserSalesViewSet)
 
 urlpatterns = [
     # path("", cache_page(60 * 3)(ShopIndexView.as_view()), name="index"),
@@ -5,12 +5,12 @@
 """
 
 import logging
-from csv import DictWriter
 from django.http import (
     HttpRequest,
     HttpResponse,
     HttpResponseRedirect,
-    JsonResponse
+    JsonResponse,
+    StreamingHttpResponse,
 )
 from django.core.cache import cache
 from django.contrib.auth.models import User
@@ -19,7 +19,7 @@ from django.shortcuts import render, redirect, reverse, get_object_or_404
 from django.urls import reverse_lazy
 from django.views import View
 from django.contrib.auth.models import Group
-from django.views.decorators.cache import cache_page
+from django.db.models import Prefetch
 from django.views.generic import (
     ListView,
     DetailView,
@@ -32,39 +32,74 @@ from django.contrib.auth.mixins import (
     PermissionRequiredMixin,
     UserPassesTestMixin
 )
-from django.utils.decorators import method_decorator
 from rest_framework.parsers import MultiPartParser
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.permissions import IsAdminUser
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from rest_framework.mixins import ListModelMixin
 from rest_framework.request import Request
+from rest_framework.settings import api_settings
 from rest_framework.response import Response
 from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 
-from .common import save_csv_products
+from requestdataapp.metrics import observe_cache
+from requestdataapp.replicas import read_from_primary_if_stale
+
+from .caching import (
+    PRODUCTS,
+    ORDERS,
+    CachedListMixin,
+    get_version,
+    product_list_cache,
+)
+from .conditional import versioned_condition
+from .common import CSV_CHUNK_SIZE, save_csv_products, stream_csv_rows
 from .forms import GroupForm, ProductForm
-from .models import Product, Order, ProductImage
-from .serializers import ProductSerializer, OrderSerializer
+from .fuzzy import product_name_index
+from .images import schedule_product_images
+from .models import Product, Order, ProductImage, DailyProductSales, DailyUserSales
+from .pagination import (
+    CursorPaginationMixin,
+    ProductCursorPagination,
+    OrderCursorPagination,
+)
+from .renderers import MsgpackParser, MsgpackRenderer
+from .search import ProductFullTextSearchFilter
+from .serializers import (
+    ProductSerializer,
+    OrderSerializer,
+    DailyProductSalesSerializer,
+    DailyUserSalesSerializer,
+)
 from timeit import default_timer
 
 
 log = logging.getLogger(__name__)
 
+# Экспорты инвалидируются по версии (см. shopapp.caching), TTL только страховка
+EXPORT_CACHE_TIMEOUT = 60 * 60 * 6
+
 
 @extend_schema(description="Product views CRUD")
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(CachedListMixin, CursorPaginationMixin, ModelViewSet):
     """
     Набор представлений для действий над Product.
 
-    Полный CRUD для сущностей товара
+    Полный CRUD для сущностей товара.
+    С параметром ?pagination=cursor список отдаётся курсорными страницами
     """
 
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    cursor_pagination_class = ProductCursorPagination
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, MsgpackRenderer]
+    parser_classes = [*api_settings.DEFAULT_PARSER_CLASSES, MsgpackParser]
+    list_cache = product_list_cache
     filter_backends = [
-        SearchFilter,
+        ProductFullTextSearchFilter,
         DjangoFilterBackend,
         OrderingFilter,
     ]
@@ -84,27 +119,21 @@ class ProductViewSet(ModelViewSet):
 
     @action(methods=["get"], detail=False)
     def download_csv(self, request: Request):
-
-        response = HttpResponse(content_type="text/csv")
-        filename = "products-export.csv"
-        response["Content-Disposition"] = f"attachment; filename={filename}"
-        queryset = self.filter_queryset(self.get_queryset())
         fields = [
             "name",
             "description",
             "price",
             "discount",
         ]
-        queryset = queryset.only(*fields)
-        writer = DictWriter(response, fieldnames=fields)
-        writer.writeheader()
-
-        for product in queryset:
-            writer.writerow({
-                field: getattr(product, field)
-                for field in fields
-            })
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.values_list(*fields).iterator(chunk_size=CSV_CHUNK_SIZE)
 
+        response = StreamingHttpResponse(
+            stream_csv_rows(fields, rows),
+            content_type="text/csv",
+        )
+        filename = "products-export.csv"
+        response["Content-Disposition"] = f"attachment; filename={filename}"
         return response
 
     @action(
@@ -113,22 +142,45 @@ class ProductViewSet(ModelViewSet):
         parser_classes=[MultiPartParser],
     )
     def upload_csv(self, request: Request):
-        products = save_csv_products(
+        summary = save_csv_products(
             request.FILES["file"],
             encoding=request.encoding,
         )
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
-
+        return Response(summary.as_dict())
 
+    @extend_schema(
+        summary="Нечёткий поиск товаров по названию",
+        description="Ищет неархивные товары по **?q=** с учётом опечаток, "
+                    "лучшие совпадения первыми; **?limit=** от 1 до 50",
+    )
+    @action(methods=["get"], detail=False, url_path="fuzzy-search")
+    def fuzzy_search(self, request: Request):
+        try:
+            limit = max(1, min(int(request.query_params.get("limit", 10)), 50))
+        except ValueError:
+            raise ValidationError({"limit": ["A valid integer is required."]})
+        matches = product_name_index.search(request.query_params.get("q", ""), limit=limit)
+        # Индекс отстаёт до rebuild_interval: архивные и удалённые с тех пор товары отбрасываем
+        products = Product.objects.filter(archived=False).in_bulk([pk for pk, _ in matches])
+        results = []
+        for pk, score in matches:
+            if pk not in products:
+                continue
+            item = self.get_serializer(products[pk]).data
+            item["score"] = round(score, 1)
+            results.append(item)
+        return Response({"results": results})
+
+    @action(methods=["get"], detail=False, permission_classes=[IsAdminUser])
+    def cache_stats(self, request: Request):
+        return Response(self.list_cache.stats())
 
     @extend_schema(
         summary="Получить список товаров",
         description="Возвращает **список товаров**; вернёт пустой список, если товаров нет",
     )
-    @method_decorator(cache_page(60 * 2))
+    @versioned_condition(PRODUCTS)
     def list(self, request, *args, **kwargs):
-        print("Hello products list")
         return super().list(request, *args, **kwargs)
 
     @extend_schema(
@@ -187,37 +239,49 @@ class ProductViewSet(ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(CursorPaginationMixin, ModelViewSet):
     """
     Набор представлений для действий над Order.
 
-    Полный CRUD для сущностей заказа
+    Полный CRUD для сущностей заказа.
+    С параметром ?pagination=cursor список отдаётся курсорными страницами
     """
-    queryset = Order.objects.all()
+    queryset = Order.objects.prefetch_related(
+        Prefetch("products", queryset=Product.objects.only("pk")),
+    )
     serializer_class = OrderSerializer
+    cursor_pagination_class = OrderCursorPagination
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, MsgpackRenderer]
+    parser_classes = [*api_settings.DEFAULT_PARSER_CLASSES, MsgpackParser]
     filter_backends = [
         SearchFilter,
         DjangoFilterBackend,
         OrderingFilter,
     ]
     search_fields = ["delivery_address", "promocode"]
-    filterset_fields = [
-        "delivery_address",
-        "promocode",
-        "user",
-        "products",
-
-    ]
+    filterset_fields = {
+        "delivery_address": ["exact"],
+        "promocode": ["exact"],
+        "user": ["exact"],
+        "products": ["exact"],
+        "total_price": ["exact", "gte", "lte"],
+        "items_count": ["exact", "gte", "lte"],
+    }
     ordering_fields = [
         "delivery_address",
         "promocode",
         "created_at",
+        "total_price",
+        "items_count",
     ]
+    # Без сортировки постраничный вывод неустойчив; совпадает с order_created_idx
+    ordering = ("-created_at", "-pk")
 
     @extend_schema(
         summary="Получить список заказов",
         description="Возвращает **список заказов**; вернёт пустой список, если заказов нет",
     )
+    @versioned_condition(ORDERS)
     def list(self, request, *args, **kwargs):
         return super().list(request, *args, **kwargs)
 
@@ -277,6 +341,56 @@ class OrderViewSet(ModelViewSet):
         return super().destroy(request, *args, **kwargs)
 
 
+@extend_schema(description="Дневные сводки продаж по товарам (refresh_sales_rollups)")
+class DailyProductSalesViewSet(ReadOnlyModelViewSet):
+    """
+    Сводки продаж товаров по дням для дашбордов.
+
+    Читает только таблицу сводок, Order и Product не сканируются
+    """
+    queryset = DailyProductSales.objects.all()
+    serializer_class = DailyProductSalesSerializer
+    permission_classes = [IsAdminUser]
+    filter_backends = [
+        DjangoFilterBackend,
+        OrderingFilter,
+    ]
+    filterset_fields = {
+        "day": ["exact", "gte", "lte"],
+        "product": ["exact"],
+    }
+    ordering_fields = [
+        "day",
+        "orders_count",
+        "revenue",
+    ]
+
+
+@extend_schema(description="Дневные сводки заказов по пользователям (refresh_sales_rollups)")
+class DailyUserSalesViewSet(ReadOnlyModelViewSet):
+    """
+    Сводки заказов пользователей по дням для дашбордов.
+
+    Читает только таблицу сводок, Order не сканируется
+    """
+    queryset = DailyUserSales.objects.all()
+    serializer_class = DailyUserSalesSerializer
+    permission_classes = [IsAdminUser]
+    filter_backends = [
+        DjangoFilterBackend,
+        OrderingFilter,
+    ]
+    filterset_fields = {
+        "day": ["exact", "gte", "lte"],
+        "user": ["exact"],
+    }
+    ordering_fields = [
+        "day",
+        "orders_count",
+        "revenue",
+    ]
+
+
 class ShopIndexView(View):
 
     # @method_decorator(cache_page(60 * 2))
@@ -291,7 +405,6 @@ class ShopIndexView(View):
             "products": products,
             "items": 1,
         }
-        print("shop index context:", context)
         log.debug("Products for shop index: %s", products)
         log.info("Rendering shop index")
         return render(request, 'shopapp/shop-index.html', context=context)
@@ -338,11 +451,14 @@ class ProductCreateView(CreateView):
 
     def form_valid(self, form):
         response = super().form_valid(form)
-        for image in form.files.getlist("images"):
+        images = [
             ProductImage.objects.create(
                 product=self.object,
                 image=image,
             )
+            for image in form.files.getlist("images")
+        ]
+        schedule_product_images(self.object, images, preview_changed=True)
         return response
 
     model = Product
@@ -358,12 +474,19 @@ class ProductUpdateView(UpdateView):
     template_name_suffix = "_update_form"
 
     def form_valid(self, form):
+        preview_changed = "preview" in form.changed_data
+        if preview_changed:
+            # Варианты старого preview к новому файлу не относятся
+            form.instance.preview_variants = []
         response = super().form_valid(form)
-        for image in form.files.getlist("images"):
+        images = [
             ProductImage.objects.create(
                 product=self.object,
                 image=image,
             )
+            for image in form.files.getlist("images")
+        ]
+        schedule_product_images(self.object, images, preview_changed)
         return response
 
     def get_success_url(self):
@@ -426,10 +549,14 @@ class OrderDeleteView(DeleteView):
 
 
 class ProductsDataExportView(View):
+    @versioned_condition(PRODUCTS)
     def get(self, request: HttpRequest) -> JsonResponse:
         cache_key = "products_data_export"
-        products_data = cache.get(cache_key)
+        version = get_version(PRODUCTS)
+        products_data = cache.get(cache_key, version=version)
+        observe_cache(products_data is not None)
         if products_data is None:
+            read_from_primary_if_stale(version)
             products = Product.objects.order_by("pk").all()
             products_data = [
                 {
@@ -440,7 +567,7 @@ class ProductsDataExportView(View):
                 }
                 for product in products
             ]
-            cache.set(cache_key, products_data, 300)
+            cache.set(cache_key, products_data, EXPORT_CACHE_TIMEOUT, version=version)
         return JsonResponse({"products": products_data})
 
 
@@ -507,15 +634,24 @@ class UserOrdersListView(LoginRequiredMixin, ListView):
 
 
 class UserOrdersExportView(View):
+    @versioned_condition(ORDERS)
     def get(self, request, user_id):
         cache_key = f"user_orders_{user_id}"
-        cached_data = cache.get(cache_key)
+        version = get_version(ORDERS)
+        cached_data = cache.get(cache_key, version=version)
+        observe_cache(cached_data is not None)
         if cached_data is not None:
             return JsonResponse(cached_data, safe=False)
 
+        read_from_primary_if_stale(version)
         user = get_object_or_404(User, pk=user_id)
-        orders = Order.objects.filter(user=user).order_by("pk")
+        orders = (
+            Order.objects
+            .filter(user=user)
+            .prefetch_related(Prefetch("products", queryset=Product.objects.only("pk")))
+            .order_by("pk")
+        )
         serializer = OrderSerializer(orders, many=True)
         data = serializer.data
-        cache.set(cache_key, data, 60 * 2)
+        cache.set(cache_key, data, EXPORT_CACHE_TIMEOUT, version=version)
         return JsonResponse(data, safe=False)